@@ -7,8 +7,24 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--input", default="/code/private_test.json", help="Input path")
     parser.add_argument("--output", default="submission.json", help="Output path")
+    parser.add_argument("--pipeline", choices=["streaming", "phased"], default=None, help="Solve pipeline (default: PIPELINE_MODE in config)")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run from its result journal")
+    parser.add_argument("--serve", action="store_true", help="Run as a resident inference server instead of a one-shot batch")
+    parser.add_argument("--host", default="127.0.0.1", help="Server bind address (--serve)")
+    parser.add_argument("--port", type=int, default=8000, help="Server port (--serve)")
+    parser.add_argument("--socket", default=None, help="Listen on a Unix domain socket instead of TCP (--serve)")
+    parser.add_argument("--llm-cache", action="store_true", help="Serve repeated deterministic LLM calls from the persistent response cache")
     args = parser.parse_args()
 
+    if args.llm_cache:
+        os.environ["VNPT_LLM_CACHE"] = "1"
+
+    if args.serve:
+        # Retriever, Reranker and HTTP connection pools stay loaded across requests
+        from src.server import serve
+        serve(host=args.host, port=args.port, unix_socket=args.socket)
+        return
+
     input_path = args.input
     output_path = args.output
     
@@ -29,7 +45,7 @@ def main():
     
     # Run
     # Limit is None to run all
-    solver.solve(input_path, output_path, limit=None)
+    solver.solve(input_path, output_path, limit=None, pipeline=args.pipeline, resume=args.resume)
     
     print("Done. Output saved to:", output_path)
 
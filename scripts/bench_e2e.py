@@ -0,0 +1,338 @@
+import sys
+import os
+import json
+import math
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+import urllib.request
+
+# End-to-end benchmark of BatchSolver.solve against scripts/mock_api.py.
+# Every dataset is solved in a fresh worker process (clean peak RSS / CPU, cold singletons,
+# runtime caches redirected to a temp dir) and reported as stage times, latency percentiles,
+# requests / tokens per question and resource usage. Compare with a stored baseline to catch
+# regressions:
+#   python scripts/bench_e2e.py --output output/bench_e2e_baseline.json
+#   python scripts/bench_e2e.py --baseline output/bench_e2e_baseline.json
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_DATASETS = ["public_test/val_50.json", "public_test/test.json"]
+
+# Runtime state that would make a second run faster (or pollute the real quota counters)
+ISOLATED_PATHS = ["DOMAIN_CACHE_PATH", "CODE_CACHE_PATH", "TOKEN_CALIBRATION_PATH", "LLM_CACHE_PATH",
+                  "QUOTA_TRACKER_PATH", "RATE_LIMIT_STATE_PATH"]
+
+# Solver methods timed as pipeline stages (shared by the streaming and phased pipelines)
+STAGES = {
+    "prepare": "prepare_item",              # Context extraction + RAG
+    "classify": "_classify_batch_domains",  # Domain classification (LLM)
+    "solve": "_process_single_batch"        # Inference batches incl. tool follow-ups
+}
+
+# Lower is better for all of them; checked against the baseline per dataset
+REGRESSION_METRICS = ["wall_s", "question_latency_s.p95", "requests_per_question", "tokens_per_question", "peak_rss_mb"]
+
+
+def percentiles(values):
+    """p50/p95/p99 (nearest rank), mean and max of a list of durations."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+    return {
+        "count": len(ordered),
+        "p50": round(pick(0.50), 4),
+        "p95": round(pick(0.95), 4),
+        "p99": round(pick(0.99), 4),
+        "mean": round(sum(ordered) / len(ordered), 4),
+        "max": round(ordered[-1], 4)
+    }
+
+
+class StageTimer:
+    """Wraps callables to record call durations and the wall-clock span (first start - last end)."""
+    def __init__(self):
+        self.calls = {}
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, name, fn):
+        def timed(*args, **kwargs):
+            t0 = time.time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                t1 = time.time()
+                with self._lock:
+                    self.calls.setdefault(name, []).append(t1 - t0)
+                    start, end = self.spans.get(name, (t0, t1))
+                    self.spans[name] = (min(start, t0), max(end, t1))
+        return timed
+
+    def report(self, origin):
+        return {name: dict(percentiles(calls), busy_s=round(sum(calls), 3),
+                           start_s=round(self.spans[name][0] - origin, 3), wall_s=round(self.spans[name][1] - self.spans[name][0], 3))
+                for name, calls in self.calls.items()}
+
+
+def scaled_dataset(questions, factor):
+    """'factor' copies of a dataset; copies get new IDs and a variant marker so they are not coalesced as duplicates."""
+    scaled = []
+    for n in range(factor):
+        for q in questions:
+            item = dict(q)
+            if n:
+                qid = q.get('qid') or q.get('id')
+                item['qid' if 'qid' in q else 'id'] = f"{qid}_x{n}"
+                item['question'] = f"{q['question']} (Biến thể {n})"
+            scaled.append(item)
+    return scaled
+
+
+def mock_stats(port):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats") as r:
+        return json.loads(r.read())["endpoints"]
+
+
+def write_mock_keys(path):
+    keys = [{"llmApiName": name, "authorization": "Bearer mock", "tokenId": "mock", "tokenKey": "mock"}
+            for name in ("LLM small", "LLM large", "LLM embedings")]
+    with open(path, "w") as f:
+        json.dump(keys, f)
+    return path
+
+
+# --- Worker (one dataset, fresh process) ---
+
+def run_worker(spec):
+    """Solves spec['input'] with instrumentation and writes the measurements to spec['result']."""
+    import src.config as config
+    for name in ISOLATED_PATHS:
+        setattr(config, name, os.path.join(spec["workdir"], os.path.basename(getattr(config, name))))
+    for name, value in spec.get("overrides", {}).items():
+        setattr(config, name, value)
+
+    from src.batch_solver import BatchSolver
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    solver = BatchSolver()
+    if not spec["rag"]:
+        solver._retriever_failed = True # Skip Retriever init (ChromaDB/Reranker) to isolate the pipeline
+
+    timer = StageTimer()
+    for stage, method in STAGES.items():
+        setattr(solver, method, timer.wrap(stage, getattr(solver, method)))
+    solver.client.chat_completion = timer.wrap("api_chat", solver.client.chat_completion)
+    solver.client.get_embedding = timer.wrap("api_embedding", solver.client.get_embedding)
+
+    # Per-question latency: time from start until the question's final answer is emitted
+    done = {}
+    solve_items = solver.solve_items
+    def instrumented(data, **kwargs):
+        kwargs["on_result"] = lambda r: done.setdefault(r['id'], time.time() - t0)
+        return solve_items(data, **kwargs)
+    solver.solve_items = instrumented
+
+    cpu0 = os.times()
+    t0 = time.time()
+    solver.solve(spec["input"], os.path.join(spec["workdir"], "pred.json"), pipeline=spec["pipeline"])
+    wall = time.time() - t0
+    cpu1 = os.times()
+
+    with open(spec["input"], "r", encoding="utf-8") as f:
+        n = len(json.load(f))
+    cpu_s = (cpu1.user - cpu0.user) + (cpu1.system - cpu0.system)
+    usage = solver.client.get_usage_stats()
+    rag_requests = solver._retriever.get_request_count() if solver._retriever else 0
+    requests = solver.client.get_request_count() + rag_requests
+    result = {
+        "questions": n,
+        "answered": len(done),
+        "wall_s": round(wall, 3),
+        "throughput_qps": round(n / wall, 3) if wall else 0.0,
+        "first_result_s": round(min(done.values()), 3) if done else None,
+        "question_latency_s": percentiles(list(done.values())),
+        "stages": timer.report(t0),
+        "requests": requests,
+        "requests_per_question": round(requests / n, 3),
+        "tokens": {k: usage[k] for k in ("prompt_tokens", "completion_tokens", "cached_tokens")},
+        "tokens_per_question": round((usage["prompt_tokens"] + usage["completion_tokens"]) / n, 1),
+        "cpu_s": round(cpu_s, 3),
+        "cpu_utilization": round(cpu_s / wall, 3) if wall else 0.0, # 1.0 = one core busy
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1), # ru_maxrss is KB on Linux
+        "startup_rss_mb": round(rss_start / 1024, 1)
+    }
+    with open(spec["result"], "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+
+
+# --- Driver ---
+
+def run_dataset(name, path, args, workdir, env):
+    spec = {"input": path, "workdir": tempfile.mkdtemp(dir=workdir), "rag": args.rag, "pipeline": args.pipeline,
+            "result": os.path.join(workdir, f"{name}.result.json")}
+    spec_path = os.path.join(workdir, f"{name}.spec.json")
+    with open(spec_path, "w", encoding="utf-8") as f:
+        json.dump(spec, f, ensure_ascii=False)
+
+    before = mock_stats(args.mock_port)
+    log_path = os.path.join(workdir, f"{name}.log")
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", spec_path], cwd=PROJECT_ROOT, env=env,
+                              stdout=None if args.verbose else log, stderr=subprocess.STDOUT if not args.verbose else None)
+    if proc.returncode != 0 or not os.path.exists(spec["result"]):
+        with open(log_path, "r", encoding="utf-8") as f:
+            tail = f.read().splitlines()[-20:]
+        raise RuntimeError(f"Worker for {name} failed (exit {proc.returncode}):\n" + "\n".join(tail))
+
+    with open(spec["result"], "r", encoding="utf-8") as f:
+        result = json.load(f)
+    # Server-side view: includes retried and rejected (429/5xx) requests
+    after = mock_stats(args.mock_port)
+    result["server"] = {}
+    for endpoint, stats in after.items():
+        prev = before.get(endpoint, {})
+        errors = {code: count - prev.get("errors", {}).get(code, 0) for code, count in stats["errors"].items()}
+        result["server"][endpoint] = {"requests": stats["requests"] - prev.get("requests", 0),
+                                      "errors": {code: c for code, c in errors.items() if c}}
+    return result
+
+
+def lookup(result, dotted):
+    for key in dotted.split("."):
+        result = (result or {}).get(key)
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Relative change of REGRESSION_METRICS per dataset; lists the ones above tolerance."""
+    changes, regressions = {}, []
+    for name, result in results.items():
+        old_result = baseline.get("datasets", {}).get(name)
+        if not old_result:
+            continue
+        changes[name] = {}
+        for metric in REGRESSION_METRICS:
+            old, new = lookup(old_result, metric), lookup(result, metric)
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            changes[name][metric] = {"baseline": old, "current": new, "change": round(change, 4)}
+            if change > tolerance:
+                regressions.append(f"{name} {metric}: {old} -> {new} (+{change * 100:.0f}%)")
+    return changes, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end BatchSolver benchmark against the mock API.")
+    parser.add_argument("--datasets", nargs="+", default=DEFAULT_DATASETS, help="Question JSON files")
+    parser.add_argument("--scale", type=int, nargs="*", default=[], help="Also run test.json scaled up by these factors (e.g. 5 10)")
+    parser.add_argument("--scale-source", default="public_test/test.json", help="Dataset used for --scale")
+    parser.add_argument("--pipeline", choices=["streaming", "phased"], default=None, help="Solve pipeline (default: config)")
+    parser.add_argument("--rag", action="store_true", help="Include Retriever (needs ChromaDB/BM25 index)")
+    parser.add_argument("--latency", choices=["constant", "uniform", "lognormal", "exponential"], default="lognormal")
+    parser.add_argument("--latency-ms", type=float, default=100, help="Median mock chat latency")
+    parser.add_argument("--prompt-ms-per-1k", type=float, default=20, help="Mock prefill cost per 1k prompt tokens")
+    parser.add_argument("--completion-ms-per-1k", type=float, default=200, help="Mock decode cost per 1k completion tokens")
+    parser.add_argument("--tool-rate", type=float, default=0.1, help="Share of first-pass questions answered with execute_python")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of mock requests failing with 429/5xx")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mock-port", type=int, default=5058)
+    parser.add_argument("--output", default=os.path.join("output", "bench_e2e.json"), help="Result JSON path")
+    parser.add_argument("--baseline", default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression (0.10 = +10%%)")
+    parser.add_argument("--verbose", action="store_true", help="Show solver logs instead of writing them to the worker log")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(args.worker, "r", encoding="utf-8") as f:
+            run_worker(json.load(f))
+        return
+
+    from mock_api import MockConfig, LatencyModel, start_server
+    config = MockConfig(
+        seed=args.seed,
+        latency=LatencyModel(args.latency, args.latency_ms, sigma=0.5, tail_prob=0.05, tail_factor=5,
+                             prompt_ms_per_1k=args.prompt_ms_per_1k, completion_ms_per_1k=args.completion_ms_per_1k),
+        embedding_latency=LatencyModel("constant", args.latency_ms / 4),
+        error_rate=args.error_rate,
+        tool_rate=args.tool_rate
+    )
+    mock = start_server(config, args.mock_port)
+
+    workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+    env = dict(os.environ)
+    env.update({"VNPT_API_URL": f"http://127.0.0.1:{args.mock_port}", "VNPT_LLM_CACHE": "0",
+                "VNPT_API_KEYS": write_mock_keys(os.path.join(workdir, "keys.json"))})
+
+    datasets = [(os.path.splitext(os.path.basename(p))[0], os.path.join(PROJECT_ROOT, p)) for p in args.datasets]
+    if args.scale:
+        with open(os.path.join(PROJECT_ROOT, args.scale_source), "r", encoding="utf-8") as f:
+            source = json.load(f)
+        base = os.path.splitext(os.path.basename(args.scale_source))[0]
+        for factor in args.scale:
+            path = os.path.join(workdir, f"{base}_x{factor}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(scaled_dataset(source, factor), f, ensure_ascii=False)
+            datasets.append((f"{base}_x{factor}", path))
+
+    results = {}
+    try:
+        for name, path in datasets:
+            print(f"[Bench] Solving {name}...")
+            results[name] = run_dataset(name, path, args, workdir, env)
+    finally:
+        mock.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{'dataset':<14} {'questions':>9} {'wall (s)':>9} {'q/s':>7} {'p50 (s)':>8} {'p95 (s)':>8} {'p99 (s)':>8} "
+          f"{'req/q':>6} {'tok/q':>8} {'CPU':>6} {'RSS (MB)':>9}")
+    for name, r in results.items():
+        lat = r["question_latency_s"]
+        print(f"{name:<14} {r['questions']:>9} {r['wall_s']:>9.2f} {r['throughput_qps']:>7.2f} {lat.get('p50', 0):>8.2f} "
+              f"{lat.get('p95', 0):>8.2f} {lat.get('p99', 0):>8.2f} {r['requests_per_question']:>6.2f} "
+              f"{r['tokens_per_question']:>8.0f} {r['cpu_utilization']:>6.0%} {r['peak_rss_mb']:>9.0f}")
+        stages = ", ".join(f"{s} {st['wall_s']:.2f}s wall / {st['busy_s']:.2f}s busy (p95 {st.get('p95', 0):.2f}s)"
+                           for s, st in r["stages"].items())
+        print(f"   stages: {stages}")
+
+    output = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "settings": {k: getattr(args, k) for k in ("pipeline", "rag", "latency", "latency_ms", "prompt_ms_per_1k",
+                                                   "completion_ms_per_1k", "tool_rate", "error_rate", "seed")},
+        "datasets": results
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != output["settings"]:
+            print(f"[Bench] WARNING: baseline settings differ: {baseline.get('settings')}")
+        output["comparison"], regressions = compare(results, baseline, args.tolerance)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, ensure_ascii=False, indent=2)
+    print(f"[Bench] Saved results to {args.output}")
+
+    if args.baseline:
+        if regressions:
+            print("[Bench] REGRESSION vs baseline:")
+            for r in regressions:
+                print(f"   - {r}")
+            sys.exit(1)
+        print("[Bench] No regression vs baseline.")
+
+
+if __name__ == "__main__":
+    main()
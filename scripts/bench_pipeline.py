@@ -0,0 +1,109 @@
+import sys
+import os
+import json
+import time
+import argparse
+import tempfile
+
+# Wall-clock comparison of the streaming solve pipeline vs the legacy phased one.
+# Runs both on the same questions against scripts/mock_api.py with injected latency
+# (heavy-tailed, so a few slow calls stall the phased barriers like the real API does).
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_mock_api(port, latency_ms, seed, tool_rate, prefix_cache=None):
+    from mock_api import MockConfig, LatencyModel, start_server
+
+    # Log-normal around the median; ~5% of calls are 5x slower
+    config = MockConfig(
+        seed=seed,
+        latency=LatencyModel("lognormal", latency_ms, sigma=0.5, tail_prob=0.05, tail_factor=5),
+        embedding_latency=LatencyModel("constant", latency_ms / 4),
+        tool_rate=tool_rate,
+        prefix_cache=prefix_cache
+    )
+    return start_server(config, port)
+
+
+def write_mock_keys():
+    keys = [{"llmApiName": name, "authorization": "Bearer mock", "tokenId": "mock", "tokenKey": "mock"}
+            for name in ("LLM small", "LLM large", "LLM embedings")]
+    fd, path = tempfile.mkstemp(suffix=".json", prefix="mock_keys_")
+    with os.fdopen(fd, "w") as f:
+        json.dump(keys, f)
+    return path
+
+
+def run_mode(mode, questions, use_rag):
+    from src.batch_solver import BatchSolver
+
+    solver = BatchSolver()
+    if not use_rag:
+        solver._retriever_failed = True # Skip Retriever init (ChromaDB/Reranker) to isolate pipeline scheduling
+
+    t0 = time.time()
+    first = []
+    results = solver.solve_items([dict(q) for q in questions], pipeline=mode,
+                                 on_result=lambda r: first.append(time.time() - t0) if not first else None)
+    wall = time.time() - t0
+    return {
+        "mode": mode,
+        "wall_s": round(wall, 3),
+        "first_result_s": round(first[0], 3) if first else None,
+        "answered": len(results),
+        "api_requests": solver.client.get_request_count()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming vs phased solve pipeline (wall-clock).")
+    parser.add_argument("--input", default=os.path.join(PROJECT_ROOT, "public_test", "test.json"), help="Questions JSON")
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first N questions")
+    parser.add_argument("--latency-ms", type=float, default=300, help="Median mock chat latency")
+    parser.add_argument("--tool-rate", type=float, default=0.2, help="Share of first-pass answers the mock turns into tool calls")
+    parser.add_argument("--mock-port", type=int, default=5056)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--live", action="store_true", help="Use VNPT_API_URL / real keys instead of the mock")
+    parser.add_argument("--rag", action="store_true", help="Include Retriever (needs ChromaDB/BM25 index)")
+    parser.add_argument("--output", default=os.path.join("output", "bench_pipeline.json"), help="Result JSON path")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+    if args.limit:
+        questions = questions[:args.limit]
+
+    keys_path = None
+    if not args.live:
+        start_mock_api(args.mock_port, args.latency_ms, args.seed, args.tool_rate)
+        os.environ["VNPT_API_URL"] = f"http://127.0.0.1:{args.mock_port}"
+        keys_path = os.environ["VNPT_API_KEYS"] = write_mock_keys()
+
+    runs = []
+    try:
+        for mode in ("phased", "streaming"):
+            print(f"[Bench] Running {mode} pipeline on {len(questions)} questions...")
+            runs.append(run_mode(mode, questions, args.rag))
+    finally:
+        if keys_path:
+            os.remove(keys_path)
+
+    phased, streaming = runs
+    speedup = phased["wall_s"] / streaming["wall_s"] if streaming["wall_s"] else 0.0
+    print(f"\n{'mode':<10} {'wall (s)':>9} {'first (s)':>10} {'answered':>9} {'requests':>9}")
+    for r in runs:
+        print(f"{r['mode']:<10} {r['wall_s']:>9.2f} {r['first_result_s'] or 0:>10.2f} {r['answered']:>9} {r['api_requests']:>9}")
+    print(f"[Bench] Streaming speedup: {speedup:.2f}x")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"questions": len(questions), "latency_ms": args.latency_ms, "tool_rate": args.tool_rate, "mock": not args.live,
+                   "runs": runs, "speedup": round(speedup, 3)}, f, ensure_ascii=False, indent=2)
+    print(f"[Bench] Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import sys
+import os
+import json
+import argparse
+
+# Prefix-cache effectiveness of the solver's prompts.
+# Runs the solver against scripts/mock_api.py with a PrefixCacheSimulator (vLLM-style
+# block hashing) and reports which share of prompt tokens a prefix-caching server
+# could have served from its cache.
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_pipeline import start_mock_api, write_mock_keys
+from mock_api import PrefixCacheSimulator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure prompt prefix-cache hits against a simulated caching server.")
+    parser.add_argument("--input", default=os.path.join(PROJECT_ROOT, "public_test", "test.json"), help="Questions JSON")
+    parser.add_argument("--limit", type=int, default=200, help="Only use the first N questions")
+    parser.add_argument("--pipeline", choices=["streaming", "phased"], default=None, help="Solve pipeline (default: config)")
+    parser.add_argument("--block-tokens", type=int, default=16, help="Simulated cache block size")
+    parser.add_argument("--capacity-blocks", type=int, default=50000, help="Simulated cache capacity (LRU)")
+    parser.add_argument("--tool-rate", type=float, default=0.2, help="Share of first-pass answers the mock turns into tool calls")
+    parser.add_argument("--mock-port", type=int, default=5057)
+    parser.add_argument("--rag", action="store_true", help="Include Retriever (needs ChromaDB/BM25 index)")
+    parser.add_argument("--output", default=os.path.join("output", "bench_prefix_cache.json"), help="Result JSON path")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+    if args.limit:
+        questions = questions[:args.limit]
+
+    simulator = PrefixCacheSimulator(block_tokens=args.block_tokens, capacity_blocks=args.capacity_blocks)
+    start_mock_api(args.mock_port, 0, 0, args.tool_rate, prefix_cache=simulator)
+    os.environ["VNPT_API_URL"] = f"http://127.0.0.1:{args.mock_port}"
+    os.environ["VNPT_API_KEYS"] = keys_path = write_mock_keys()
+    os.environ["VNPT_LLM_CACHE"] = "0" # Every call must reach the server
+
+    from src.batch_solver import BatchSolver
+    try:
+        solver = BatchSolver()
+        if not args.rag:
+            solver._retriever_failed = True
+        print(f"[Bench] Solving {len(questions)} questions against the prefix-caching mock...")
+        solver.solve_items([dict(q) for q in questions], pipeline=args.pipeline)
+    finally:
+        os.remove(keys_path)
+
+    server = simulator.stats()
+    client = solver.client.get_usage_stats()
+    print(f"\n[Bench] {server['requests']} chat requests, {server['prompt_tokens']} prompt tokens")
+    print(f"[Bench] Served from prefix cache: {server['cached_tokens']} tokens ({server['hit_ratio']:.1%})")
+    print(f"[Bench] Client-side accounting: {client['cached_tokens']}/{client['prompt_tokens']} ({client['prefix_hit_ratio']:.1%})")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"questions": len(questions), "block_tokens": args.block_tokens, "server": server, "client": client},
+                  f, ensure_ascii=False, indent=2)
+    print(f"[Bench] Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
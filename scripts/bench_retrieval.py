@@ -0,0 +1,230 @@
+import sys
+import os
+import re
+import json
+import math
+import time
+import random
+import sqlite3
+import argparse
+import itertools
+
+# Retrieval quality vs latency of Retriever.search configurations.
+# Sweeps K, FETCH_K, RERANK_POOL_SIZE, RRF_K and the reranker over a labeled
+# query -> relevant chunk set and reports recall@k, MRR, nDCG@k and per-stage latency
+# (embedding, vector, BM25, fusion, rerank), marking the Pareto-optimal settings.
+#
+# Label file: JSON list of {"query": str, "relevant": [chunk id, ...] or {chunk id: grade}}.
+# Without hand labels, --build-labels samples indexed chunks and turns a word window of
+# each into a known-item query (silver labels: the source chunk is the relevant one).
+#   python scripts/bench_retrieval.py --build-labels 200 --labels output/retrieval_labels.json
+#   python scripts/bench_retrieval.py --labels output/retrieval_labels.json --budget-ms 400
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(PROJECT_ROOT)
+
+STAGES = ["embedding", "vector", "bm25", "fusion", "rerank"]
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+|\n+")
+
+
+def build_labels(db_path, n, query_words, drop, seed):
+    """Known-item queries from random indexed chunks (a word window, 'drop' share of words removed)."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    max_rowid = conn.execute("SELECT max(rowid) FROM documents").fetchone()[0] or 0
+    labels, tried = [], set()
+    while len(labels) < n and len(tried) < min(max_rowid, n * 20):
+        rowid = rng.randint(1, max_rowid)
+        if rowid in tried:
+            continue
+        tried.add(rowid)
+        row = conn.execute("SELECT id, raw_content FROM documents WHERE rowid = ?", (rowid,)).fetchone()
+        if not row or not row[1]:
+            continue
+        sentences = [s.split() for s in _SENTENCE_END.split(row[1]) if len(s.split()) >= query_words // 2]
+        if not sentences:
+            continue
+        words = rng.choice(sentences)
+        start = rng.randint(0, max(0, len(words) - query_words))
+        window = words[start:start + query_words]
+        kept = [w for w in window if rng.random() >= drop] or window
+        labels.append({"query": " ".join(kept), "relevant": [row[0]]})
+    conn.close()
+    return labels
+
+
+def grades_of(label):
+    relevant = label["relevant"]
+    return {doc_id: 1.0 for doc_id in relevant} if isinstance(relevant, list) else {k: float(v) for k, v in relevant.items()}
+
+
+def rank_metrics(ranked_ids, grades, k):
+    """recall@k, reciprocal rank and nDCG@k of one ranked list."""
+    top = ranked_ids[:k]
+    hits = [doc_id for doc_id in top if doc_id in grades]
+    recall = len(set(hits)) / len(grades) if grades else 0.0
+    rr = next((1.0 / (i + 1) for i, doc_id in enumerate(top) if doc_id in grades), 0.0)
+    dcg = sum((2 ** grades[doc_id] - 1) / math.log2(i + 2) for i, doc_id in enumerate(top) if doc_id in grades)
+    ideal = sorted(grades.values(), reverse=True)[:k]
+    idcg = sum((2 ** g - 1) / math.log2(i + 2) for i, g in enumerate(ideal))
+    return recall, rr, dcg / idcg if idcg else 0.0
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def sweep_grid(args):
+    """Configurations to run; the pool size only matters when the reranker is on."""
+    grid = []
+    for k, fetch_k, rrf_k, rerank in itertools.product(args.k, args.fetch_k, args.rrf_k, args.reranker):
+        for pool in (args.pool if rerank == "on" else [max(args.pool)]):
+            if fetch_k < k or (rerank == "on" and pool < k):
+                continue
+            grid.append({"k": k, "fetch_k": fetch_k, "rrf_k": rrf_k, "pool_size": pool, "use_reranker": rerank == "on"})
+    return grid
+
+
+def run_config(retriever, labels, cfg, embed_latency):
+    """Searches every labeled query with one configuration; returns its quality and latency summary."""
+    recall, rr, ndcg, totals = [], [], [], []
+    stages = {stage: [] for stage in STAGES}
+    for label in labels:
+        timings = {}
+        results = retriever.search(label["query"], k=cfg["k"], fetch_k=cfg["fetch_k"], rrf_k=cfg["rrf_k"],
+                                   pool_size=cfg["pool_size"], use_reranker=cfg["use_reranker"], timings=timings)
+        # Embeddings are memoized across configurations: use the query's measured API latency
+        timings["embedding"] = embed_latency.get(label["query"], 0.0)
+        for stage in STAGES:
+            stages[stage].append(timings.get(stage, 0.0))
+        # Critical path of Retriever.search: (embedding -> vector) || BM25, then fusion and rerank
+        totals.append(max(timings["embedding"] + timings.get("vector", 0.0), timings.get("bm25", 0.0))
+                      + timings.get("fusion", 0.0) + timings.get("rerank", 0.0))
+
+        r, m, n = rank_metrics([doc.get("id") for doc in results], grades_of(label), cfg["k"])
+        recall.append(r)
+        rr.append(m)
+        ndcg.append(n)
+
+    count = len(labels)
+    return dict(cfg, **{
+        "recall": round(sum(recall) / count, 4),
+        "mrr": round(sum(rr) / count, 4),
+        "ndcg": round(sum(ndcg) / count, 4),
+        "latency_ms": {"p50": round(percentile(totals, 0.50) * 1000, 1), "p95": round(percentile(totals, 0.95) * 1000, 1),
+                       "mean": round(sum(totals) / count * 1000, 1)},
+        "stages_ms": {stage: {"p50": round(percentile(v, 0.50) * 1000, 2), "p95": round(percentile(v, 0.95) * 1000, 2)}
+                      for stage, v in stages.items()}
+    })
+
+
+def mark_pareto(results):
+    """Flags configurations not dominated on (nDCG higher, p95 latency lower)."""
+    for r in results:
+        r["pareto"] = not any(
+            o["ndcg"] >= r["ndcg"] and o["latency_ms"]["p95"] <= r["latency_ms"]["p95"]
+            and (o["ndcg"] > r["ndcg"] or o["latency_ms"]["p95"] < r["latency_ms"]["p95"])
+            for o in results)
+
+
+def main():
+    from src.config import DB_PATH, RETRIEVER_K, RETRIEVER_FETCH_K, RERANK_POOL_SIZE, RRF_K, USE_RERANKER
+
+    parser = argparse.ArgumentParser(description="Retriever quality vs latency sweep.")
+    parser.add_argument("--labels", default=os.path.join("output", "retrieval_labels.json"), help="Labeled queries JSON")
+    parser.add_argument("--build-labels", type=int, default=0, metavar="N", help="Write N known-item queries sampled from the index to --labels and exit")
+    parser.add_argument("--query-words", type=int, default=15, help="Words per known-item query")
+    parser.add_argument("--drop", type=float, default=0.2, help="Share of query words dropped (harder than verbatim lookup)")
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first N labeled queries")
+    parser.add_argument("--k", type=int, nargs="+", default=sorted({5, 10, RETRIEVER_K}))
+    parser.add_argument("--fetch-k", type=int, nargs="+", default=sorted({20, 50, RETRIEVER_FETCH_K}))
+    parser.add_argument("--pool", type=int, nargs="+", default=sorted({10, RERANK_POOL_SIZE}), help="RERANK_POOL_SIZE values")
+    parser.add_argument("--rrf-k", type=int, nargs="+", default=sorted({20, 60, RRF_K}))
+    parser.add_argument("--reranker", nargs="+", choices=["on", "off"], default=["on", "off"])
+    parser.add_argument("--budget-ms", type=float, default=None, help="Report the best nDCG within this p95 latency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join("output", "bench_retrieval.json"), help="Result JSON path")
+    args = parser.parse_args()
+
+    if args.build_labels:
+        labels = build_labels(DB_PATH, args.build_labels, args.query_words, args.drop, args.seed)
+        os.makedirs(os.path.dirname(os.path.abspath(args.labels)), exist_ok=True)
+        with open(args.labels, "w", encoding="utf-8") as f:
+            json.dump(labels, f, ensure_ascii=False, indent=2)
+        print(f"[Bench] Wrote {len(labels)} known-item queries to {args.labels}")
+        return
+
+    with open(args.labels, "r", encoding="utf-8") as f:
+        labels = json.load(f)
+    if args.limit:
+        labels = labels[:args.limit]
+
+    from src.retriever import Retriever
+    retriever = Retriever()
+
+    # One embedding call per query for the whole sweep (API quota); its latency is kept per query
+    embed_latency = {}
+    embed_memo = {}
+    get_embedding = retriever.client.get_embedding
+    def memo_embedding(text):
+        if text not in embed_memo:
+            t0 = time.time()
+            embed_memo[text] = get_embedding(text)
+            embed_latency[text] = time.time() - t0
+        return embed_memo[text]
+    retriever.client.get_embedding = memo_embedding
+
+    # Warm-up: reranker model, pyvi, SQLite pages and ChromaDB segments load on first use
+    if "on" in args.reranker:
+        retriever._ensure_reranker_loaded(force=True)
+    retriever.search(labels[0]["query"], use_reranker="on" in args.reranker)
+
+    grid = sweep_grid(args)
+    print(f"[Bench] {len(labels)} queries x {len(grid)} configurations")
+    results = []
+    for i, cfg in enumerate(grid, 1):
+        results.append(run_config(retriever, labels, cfg, embed_latency))
+        r = results[-1]
+        print(f"[{i}/{len(grid)}] k={cfg['k']} fetch_k={cfg['fetch_k']} rrf_k={cfg['rrf_k']} pool={cfg['pool_size']} "
+              f"rerank={'on' if cfg['use_reranker'] else 'off'}: nDCG {r['ndcg']:.3f}, p95 {r['latency_ms']['p95']:.0f} ms")
+    mark_pareto(results)
+
+    current = {"k": RETRIEVER_K, "fetch_k": RETRIEVER_FETCH_K, "rrf_k": RRF_K, "pool_size": RERANK_POOL_SIZE, "use_reranker": USE_RERANKER}
+    for r in results:
+        r["configured"] = all(r[key] == value for key, value in current.items())
+
+    print(f"\n{'k':>3} {'fetch':>6} {'rrf':>4} {'pool':>5} {'rerank':>7} {'recall':>7} {'MRR':>6} {'nDCG':>6} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'emb':>6} {'vec':>6} {'bm25':>6} {'fuse':>5} {'rerank':>7}")
+    for r in sorted(results, key=lambda r: r["latency_ms"]["p95"]):
+        st = r["stages_ms"]
+        flags = (" *" if r["pareto"] else "") + (" (config)" if r["configured"] else "")
+        print(f"{r['k']:>3} {r['fetch_k']:>6} {r['rrf_k']:>4} {r['pool_size'] if r['use_reranker'] else '-':>5} "
+              f"{'on' if r['use_reranker'] else 'off':>7} {r['recall']:>7.3f} {r['mrr']:>6.3f} {r['ndcg']:>6.3f} "
+              f"{r['latency_ms']['p50']:>7.0f} {r['latency_ms']['p95']:>7.0f} {st['embedding']['p50']:>6.0f} "
+              f"{st['vector']['p50']:>6.0f} {st['bm25']['p50']:>6.0f} {st['fusion']['p50']:>5.1f} {st['rerank']['p50']:>7.0f}{flags}")
+    print("(* = Pareto-optimal on nDCG vs p95 latency; stage columns are p50 ms)")
+
+    best = None
+    if args.budget_ms:
+        within = [r for r in results if r["latency_ms"]["p95"] <= args.budget_ms]
+        best = max(within, key=lambda r: (r["ndcg"], -r["latency_ms"]["p95"])) if within else None
+        if best:
+            print(f"[Bench] Best within {args.budget_ms:.0f} ms p95: RETRIEVER_K={best['k']}, RETRIEVER_FETCH_K={best['fetch_k']}, "
+                  f"RRF_K={best['rrf_k']}, RERANK_POOL_SIZE={best['pool_size']}, USE_RERANKER={best['use_reranker']} "
+                  f"(nDCG {best['ndcg']:.3f}, p95 {best['latency_ms']['p95']:.0f} ms)")
+        else:
+            print(f"[Bench] No configuration within {args.budget_ms:.0f} ms p95.")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"timestamp": time.strftime("%Y-%m-%d %H:%M:%S"), "queries": len(labels), "labels": args.labels,
+                   "configured": current, "budget_ms": args.budget_ms, "best_within_budget": best, "results": results},
+                  f, ensure_ascii=False, indent=2)
+    print(f"[Bench] Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+# Cold-start benchmark for predict.py based on 'python -X importtime'.
+# Tracks import cost as a regression metric and flags heavy modules loaded at startup.
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# These must only load on first real use (lazy imports)
+HEAVY_MODULES = ["torch", "chromadb", "pyvi", "sentence_transformers", "transformers", "sklearn"]
+
+
+def parse_importtime(stderr: str):
+    """
+    Parses '-X importtime' output.
+    Line format: 'import time: <self us> | <cumulative us> | <indented module name>'
+    Returns (total_us, {module: cumulative_us}) where total is summed over top-level imports.
+    """
+    total_us = 0
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue # Header line
+        cum_us = int(parts[1].strip())
+        name = parts[2]
+        # Top-level imports have exactly one space of indentation after the pipe
+        depth = len(name) - len(name.lstrip(" "))
+        module = name.strip()
+        modules[module] = max(modules.get(module, 0), cum_us)
+        if depth <= 1:
+            total_us += cum_us
+    return total_us, modules
+
+
+def run_once(target_args):
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None) # Any non-empty value disables .pyc caching
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime"] + target_args,
+        cwd=PROJECT_ROOT, capture_output=True, text=True, env=env
+    )
+    wall = time.perf_counter() - t0
+    total_us, modules = parse_importtime(proc.stderr)
+    return {
+        "returncode": proc.returncode,
+        "wall_s": wall,
+        "import_s": total_us / 1e6,
+        "modules": modules,
+        "error": proc.stderr.splitlines()[-1] if proc.returncode != 0 and proc.stderr else ""
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark of predict.py (python -X importtime).")
+    parser.add_argument("--runs", type=int, default=5, help="Number of measured runs (after 1 warm-up for .pyc)")
+    parser.add_argument("--top", type=int, default=15, help="Show the N most expensive modules")
+    parser.add_argument("--output", default=os.path.join("output", "bench_startup.json"), help="Result JSON path")
+    parser.add_argument("--baseline", default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="Allowed relative regression (0.20 = +20%%)")
+    args = parser.parse_args()
+
+    target = ["predict.py", "--help"] # Import + argparse, no work
+
+    run_once(target) # Warm-up: compile .pyc so we measure import cost, not bytecode compilation
+    runs = [run_once(target) for _ in range(args.runs)]
+    failed = [r for r in runs if r["returncode"] != 0]
+    if failed:
+        print(f"[Startup] predict.py failed to start: {failed[0]['error']}")
+        sys.exit(2)
+
+    wall = [r["wall_s"] for r in runs]
+    imports = [r["import_s"] for r in runs]
+    modules = runs[-1]["modules"]
+    heavy_loaded = sorted(m for m in modules if m.split(".")[0] in HEAVY_MODULES and "." not in m)
+    top = sorted(modules.items(), key=lambda kv: kv[1], reverse=True)[:args.top]
+
+    result = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "wall_s_median": statistics.median(wall),
+        "wall_s_min": min(wall),
+        "import_s_median": statistics.median(imports),
+        "heavy_modules_loaded": heavy_loaded,
+        "top_modules_us": dict(top)
+    }
+
+    print(f"[Startup] predict.py cold start: {result['wall_s_median']*1000:.0f} ms (median of {args.runs}), "
+          f"imports: {result['import_s_median']*1000:.0f} ms")
+    print("[Startup] Most expensive imports (cumulative):")
+    for name, us in top:
+        print(f"   {us/1000:8.1f} ms  {name}")
+    if heavy_loaded:
+        print(f"[Startup] WARNING: heavy modules imported at startup: {', '.join(heavy_loaded)}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"[Startup] Saved results to {args.output}")
+
+    # Regression Check
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = []
+        for key in ("wall_s_median", "import_s_median"):
+            old, new = baseline.get(key), result[key]
+            if old and new > old * (1 + args.tolerance):
+                regressions.append(f"{key}: {old*1000:.0f} ms -> {new*1000:.0f} ms (+{(new/old-1)*100:.0f}%)")
+        new_heavy = set(heavy_loaded) - set(baseline.get("heavy_modules_loaded", []))
+        if new_heavy:
+            regressions.append(f"new heavy modules at startup: {', '.join(sorted(new_heavy))}")
+
+        if regressions:
+            print("[Startup] REGRESSION vs baseline:")
+            for r in regressions:
+                print(f"   - {r}")
+            sys.exit(1)
+        print("[Startup] No regression vs baseline.")
+
+
+if __name__ == "__main__":
+    main()
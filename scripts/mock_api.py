@@ -1,91 +1,597 @@
 import http.server
 import socketserver
+import argparse
 import json
+import math
 import random
 import time
 import re
+import hashlib
+import threading
+from collections import OrderedDict, deque, defaultdict
+
+# Offline stand-in for the VNPT API (chat small/large + embedding), the standard backend
+# for pipeline performance tests (scripts/bench_pipeline.py, scripts/bench_prefix_cache.py,
+# scripts/test_server.py).
+#
+# - Threaded; every random decision is seeded from (seed, request content, occurrence),
+#   so a run is reproducible regardless of thread scheduling.
+# - Embeddings: signed feature hashing of words and word bigrams (texts sharing words are
+#   close in cosine space), so retrieval over a mock-built index is reproducible.
+# - Tool calls: forced 'submit_batch_results' / 'submit_classification' calls are answered
+#   with arguments generated from the request's own JSON schema (one entry per question).
+# - Latency: constant / uniform / lognormal / exponential base plus per-token costs.
+# - Faults: injected 429 / 5xx (with Retry-After) and per-endpoint request / token rate limits.
+# - Usage: OpenAI-style 'usage' per response, server totals on GET /stats.
 
 PORT = 5000
+EMBEDDING_DIM = 1024
+CHARS_PER_TOKEN = 3.0
+
+# A question block runs to the next one: tool results are appended after '</question>'
+_QUESTION_BLOCK = re.compile(r"<question id=['\"]([^'\"]+)['\"]>(.*?)(?=<question id=|\Z)", re.S)
+_CHOICE_LINE = re.compile(r"^([A-J])\. ", re.M)
+_CLASSIFY_ID = re.compile(r"- ID: (\S+)")
+_WORDS = re.compile(r"\w+", re.UNICODE)
+
+
+def estimate_tokens(text):
+    return max(1, int(len(text) / CHARS_PER_TOKEN)) if text else 0
+
+
+def _digest(*parts):
+    return hashlib.sha256("\x00".join(str(p) for p in parts).encode("utf-8")).digest()
+
+
+def _unit(*parts):
+    """Deterministic float in [0, 1) from the given parts."""
+    return int.from_bytes(_digest(*parts)[:8], "big") / 2.0 ** 64
+
+
+def hash_embedding(text, dim=EMBEDDING_DIM, seed=0):
+    """
+    Deterministic unit vector for a text: each word / word bigram adds +-1 to a few hashed
+    dimensions. Equal texts get equal vectors; texts sharing words get a high cosine.
+    """
+    words = _WORDS.findall((text or "").lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    vec = [0.0] * dim
+    for feat in features or [text or ""]:
+        h = _digest(seed, feat)
+        for j in range(4):
+            idx = int.from_bytes(h[4 * j:4 * j + 3], "big") % dim
+            vec[idx] += 1.0 if h[4 * j + 3] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def render_prompt(data):
+    """Chat-template-like rendering (system message, tool schemas, conversation)."""
+    messages = data.get('messages', [])
+    parts = []
+    if messages and messages[0].get('role') == 'system':
+        parts.append(f"<|im_start|>system\n{messages[0].get('content') or ''}")
+        messages = messages[1:]
+    else:
+        parts.append("<|im_start|>system\n")
+    if data.get('tools'):
+        parts.append("\n# Tools\n" + json.dumps(data['tools'], ensure_ascii=False))
+    parts.append("<|im_end|>\n")
+    for m in messages:
+        parts.append(f"<|im_start|>{m.get('role')}\n{m.get('content') or ''}<|im_end|>\n")
+    return "".join(parts)
+
+
+class PrefixCacheSimulator:
+    """
+    Stand-in for a server with automatic prefix caching (vLLM-style block hashing).
+
+    The request is rendered like a chat template (system message, tool schemas, then the
+    conversation), cut into fixed-size blocks, and each block is hashed together with all
+    blocks before it. A block is a hit only if the whole prefix up to it was seen before;
+    blocks are kept in an LRU of 'capacity_blocks'. Tokens are approximated as characters.
+
+    Args:
+        block_tokens (int): Tokens per cache block.
+        chars_per_token (float): Rendering length per simulated token.
+        capacity_blocks (int): Cached blocks kept (per server, all models).
+    """
+    def __init__(self, block_tokens=16, chars_per_token=CHARS_PER_TOKEN, capacity_blocks=50000):
+        self.block_chars = max(1, int(block_tokens * chars_per_token))
+        self.chars_per_token = chars_per_token
+        self.capacity_blocks = capacity_blocks
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.requests = 0
+
+    @staticmethod
+    def render(data):
+        return render_prompt(data)
+
+    def lookup(self, data):
+        """Returns (prompt_tokens, cached_tokens) for a chat request and caches its blocks."""
+        text = f"{data.get('model', '')}\x00" + self.render(data)
+        prompt_tokens = max(1, int(len(text) / self.chars_per_token))
+        hashes = []
+        h = b""
+        for i in range(0, len(text) - self.block_chars + 1, self.block_chars):
+            h = hashlib.sha1(h + text[i:i + self.block_chars].encode('utf-8')).digest()
+            hashes.append(h)
+
+        with self._lock:
+            hit_blocks = 0
+            for h in hashes:
+                if h not in self._blocks:
+                    break
+                hit_blocks += 1
+            for h in hashes:
+                self._blocks[h] = True
+                self._blocks.move_to_end(h)
+            while len(self._blocks) > self.capacity_blocks:
+                self._blocks.popitem(last=False)
+            cached = min(prompt_tokens, int(hit_blocks * self.block_chars / self.chars_per_token))
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached
+        return prompt_tokens, cached
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "hit_ratio": round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0
+            }
+
+
+class LatencyModel:
+    """
+    Response time = base sample + per-token costs (prefill and decode).
+
+    Args:
+        kind (str): 'constant', 'uniform' (0..2x median), 'lognormal' or 'exponential'.
+        median_ms (float): Median of the base distribution.
+        sigma (float): Log-normal shape.
+        tail_prob (float): Share of requests slowed down by 'tail_factor' (stragglers).
+        tail_factor (float): Straggler multiplier.
+        prompt_ms_per_1k (float): Added per 1000 prompt tokens.
+        completion_ms_per_1k (float): Added per 1000 completion tokens.
+    """
+    def __init__(self, kind="lognormal", median_ms=0.0, sigma=0.5, tail_prob=0.0, tail_factor=5.0,
+                 prompt_ms_per_1k=0.0, completion_ms_per_1k=0.0):
+        self.kind = kind
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.tail_prob = tail_prob
+        self.tail_factor = tail_factor
+        self.prompt_ms_per_1k = prompt_ms_per_1k
+        self.completion_ms_per_1k = completion_ms_per_1k
+
+    def sample(self, rng, prompt_tokens=0, completion_tokens=0):
+        """Seconds for one request (rng: random.Random seeded per request)."""
+        m = self.median_ms
+        if self.kind == "constant":
+            base = m
+        elif self.kind == "uniform":
+            base = rng.uniform(0, 2 * m)
+        elif self.kind == "exponential":
+            base = rng.expovariate(math.log(2) / m) if m > 0 else 0.0
+        else:
+            base = rng.lognormvariate(0, self.sigma) * m
+        if self.tail_prob and rng.random() < self.tail_prob:
+            base *= self.tail_factor
+        base += prompt_tokens / 1000.0 * self.prompt_ms_per_1k + completion_tokens / 1000.0 * self.completion_ms_per_1k
+        return base / 1000.0
+
+
+class WindowRateLimit:
+    """Sliding-window request and token limits of one endpoint (None = unlimited)."""
+    def __init__(self, requests=None, tokens=None, window=60.0):
+        self.requests = requests
+        self.tokens = tokens
+        self.window = window
+        self._events = deque() # (time, tokens)
+        self._token_sum = 0
+        self._lock = threading.Lock()
+
+    def check(self, tokens):
+        """Admits a request, or returns the seconds until it would fit (Retry-After)."""
+        if not self.requests and not self.tokens:
+            return None
+        with self._lock:
+            now = time.time()
+            while self._events and self._events[0][0] <= now - self.window:
+                self._token_sum -= self._events.popleft()[1]
+            over_requests = self.requests and len(self._events) >= self.requests
+            over_tokens = self.tokens and self._events and self._token_sum + tokens > self.tokens
+            if over_requests or over_tokens:
+                return max(0.1, self._events[0][0] + self.window - now)
+            self._events.append((now, tokens))
+            self._token_sum += tokens
+            return None
+
+
+class MockConfig:
+    """
+    Behaviour of the mock server.
+
+    Args:
+        seed (int): Seed of every deterministic choice (answers, faults, latency, embeddings).
+        latency (LatencyModel): Chat latency.
+        embedding_latency (LatencyModel): Embedding latency.
+        error_rate (float): Share of requests answered with an injected error.
+        error_statuses (tuple): Statuses drawn for injected errors (429, 500, 502, 503, 504).
+        retry_after (float): Retry-After seconds sent with injected 429/503.
+        rate_limits (dict): endpoint ('small', 'large', 'embedding') -> WindowRateLimit.
+        tool_rate (float): Share of first-pass questions answered with an execute_python request.
+        prefix_cache (PrefixCacheSimulator, optional): Reports usage.prompt_tokens_details.cached_tokens.
+        verbose (bool): Print one line per request.
+    """
+    def __init__(self, seed=0, latency=None, embedding_latency=None, error_rate=0.0,
+                 error_statuses=(429, 500, 503), retry_after=1.0, rate_limits=None, tool_rate=0.0,
+                 prefix_cache=None, verbose=False):
+        self.seed = seed
+        self.latency = latency or LatencyModel(kind="constant")
+        self.embedding_latency = embedding_latency or LatencyModel(kind="constant")
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.retry_after = retry_after
+        self.rate_limits = rate_limits or {}
+        self.tool_rate = tool_rate
+        self.prefix_cache = prefix_cache
+        self.verbose = verbose
+
+
+class MockState:
+    """Per-server counters: usage accounting and request occurrence numbers (fault seeding)."""
+    def __init__(self, config):
+        self.config = config
+        self._lock = threading.Lock()
+        self._occurrences = defaultdict(int)
+        self.started = time.time()
+        self.usage = defaultdict(lambda: {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                          "cached_tokens": 0, "errors": defaultdict(int), "latency_s": 0.0})
+
+    def occurrence(self, key):
+        """How many times this exact request was seen before (retries get fresh draws)."""
+        with self._lock:
+            n = self._occurrences[key]
+            self._occurrences[key] += 1
+            return n
+
+    def record(self, endpoint, prompt_tokens=0, completion_tokens=0, cached_tokens=0, error=None, latency=0.0):
+        with self._lock:
+            u = self.usage[endpoint]
+            u["requests"] += 1
+            u["latency_s"] += latency
+            if error:
+                u["errors"][str(error)] += 1
+            else:
+                u["prompt_tokens"] += prompt_tokens
+                u["completion_tokens"] += completion_tokens
+                u["cached_tokens"] += cached_tokens
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = {k: dict(v, errors=dict(v["errors"]), latency_s=round(v["latency_s"], 3)) for k, v in self.usage.items()}
+        stats = {"uptime_s": round(time.time() - self.started, 3), "endpoints": endpoints}
+        if self.config.prefix_cache is not None:
+            stats["prefix_cache"] = self.config.prefix_cache.stats()
+        return stats
+
+
+def _endpoint_of(path, data):
+    if path.endswith('/vnptai-hackathon-embedding'):
+        return 'embedding'
+    if path.endswith('/vnptai-hackathon-large') or 'large' in str(data.get('model', '')):
+        return 'large'
+    return 'small'
+
+
+def fake_from_schema(schema, rng, overrides=None):
+    """Value matching a JSON schema (object / array / enum / scalar); 'overrides' fixes object fields."""
+    overrides = overrides or {}
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    kind = schema.get("type")
+    if kind == "object":
+        props = schema.get("properties", {})
+        return {name: overrides[name] if name in overrides else fake_from_schema(sub, rng)
+                for name, sub in props.items()}
+    if kind == "array":
+        return [fake_from_schema(schema.get("items", {}), rng)]
+    if kind == "integer":
+        return rng.randint(50, 100)
+    if kind == "number":
+        return round(rng.random(), 3)
+    if kind == "boolean":
+        return False
+    return "mock"
+
+
+class MockHandler(http.server.BaseHTTPRequestHandler):
+    config = MockConfig()
+    state = MockState(config)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self._send_json(self.state.snapshot())
+        elif self.path.rstrip('/') == '/health':
+            self._send_json({"status": "ok"})
+        else:
+            self.send_response(404)
+            self.end_headers()
 
-class MockHandler(http.server.SimpleHTTPRequestHandler):
     def do_POST(self):
         content_length = int(self.headers['Content-Length'])
         post_data = self.rfile.read(content_length)
         data = json.loads(post_data.decode('utf-8'))
-        
-        # Handle Embedding Request
-        if self.path.endswith('/vnptai-hackathon-embedding'):
-            self._handle_embedding(data)
-        
-        # Handle Chat Completion (Small & Large)
-        elif '/chat/completions' in self.path:
-            self._handle_chat(data)
-            
-        else:
+        if not (self.path.endswith('/vnptai-hackathon-embedding') or '/chat/completions' in self.path):
             self.send_response(404)
             self.end_headers()
+            return
+
+        endpoint = _endpoint_of(self.path, data)
+        request_key = hashlib.sha256(post_data).hexdigest()
+        rng = random.Random(_digest(self.config.seed, request_key, self.state.occurrence(request_key)))
+
+        if endpoint == 'embedding':
+            self._handle_embedding(data, rng)
+        else:
+            self._handle_chat(data, rng, endpoint)
+
+    # --- Faults ---
 
-    def _handle_embedding(self, data):
+    def _fault(self, endpoint, rng, prompt_tokens):
+        """Sends an injected error or rate-limit response; returns True if the request ends here."""
+        cfg = self.config
+        limit = cfg.rate_limits.get(endpoint)
+        wait = limit.check(prompt_tokens) if limit else None
+        if wait is not None:
+            self._send_error(endpoint, 429, "Rate limit exceeded (mock window)", retry_after=wait)
+            return True
+        if cfg.error_rate and rng.random() < cfg.error_rate:
+            status = rng.choice(cfg.error_statuses)
+            retry_after = cfg.retry_after if status in (429, 503) else None
+            self._send_error(endpoint, status, "Injected mock error", retry_after=retry_after)
+            return True
+        return False
+
+    def _send_error(self, endpoint, status, message, retry_after=None):
+        self.state.record(endpoint, error=status)
+        body = json.dumps({"error": {"message": message, "code": status}}).encode('utf-8')
+        self.send_response(status)
+        if retry_after is not None:
+            self.send_header('Retry-After', f"{retry_after:.2f}")
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # --- Embedding ---
+
+    def _handle_embedding(self, data, rng):
         texts = data.get('input', [])
         if isinstance(texts, str): texts = [texts]
-        
-        print(f"[MOCK] Embedding request for {len(texts)} texts")
-        
+        if self.config.verbose:
+            print(f"[MOCK] Embedding request for {len(texts)} texts")
+
+        prompt_tokens = sum(estimate_tokens(t) for t in texts)
+        if self._fault('embedding', rng, prompt_tokens):
+            return
+
         mock_data = []
-        for i in range(len(texts)):
+        for i, text in enumerate(texts):
             mock_data.append({
                 "object": "embedding",
-                "embedding": [random.random() for _ in range(1024)],
+                "embedding": hash_embedding(text, seed=self.config.seed),
                 "index": i
             })
-            
+
         response = {
             "object": "list",
             "data": mock_data,
             "model": "mock-embedding-v1",
-            "usage": {"prompt_tokens": 10, "total_tokens": 10}
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}
         }
+        delay = self.config.embedding_latency.sample(rng, prompt_tokens)
+        time.sleep(delay)
+        self.state.record('embedding', prompt_tokens=prompt_tokens, latency=delay)
         self._send_json(response)
 
-    def _handle_chat(self, data):
+    # --- Chat ---
+
+    def _handle_chat(self, data, rng, endpoint):
         messages = data.get('messages', [])
         last_msg = messages[-1]['content'] if messages else ""
-        print(f"[MOCK] Chat request: {last_msg[:50]}...")
-        
+        if self.config.verbose:
+            print(f"[MOCK] Chat request: {(last_msg or '')[:50]}...")
+
+        cached = 0
+        if self.config.prefix_cache is not None:
+            prompt_tokens, cached = self.config.prefix_cache.lookup(data)
+        else:
+            prompt_tokens = estimate_tokens(render_prompt(data))
+        if self._fault(endpoint, rng, prompt_tokens):
+            return
+
         answer = "MOCK ANSWER: Đây là câu trả lời kiểm thử từ hệ thống giả lập."
-        
+        message = {
+            "role": "assistant",
+            "content": answer
+        }
+
+        # Forced tool calls (BatchSolver): answer every question ID found in the prompt
+        tool_name = ((data.get('tool_choice') or {}).get('function') or {}).get('name')
+        if tool_name:
+            schema = next((t['function'].get('parameters', {}) for t in data.get('tools') or []
+                           if t.get('function', {}).get('name') == tool_name), {})
+            arguments = self._tool_arguments(tool_name, schema, last_msg or "")
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{hashlib.sha1(json.dumps(arguments).encode()).hexdigest()[:12]}",
+                    "type": "function",
+                    "function": {"name": tool_name, "arguments": json.dumps(arguments, ensure_ascii=False)}
+                }]
+            }
+
+        completion_text = message["content"] or message["tool_calls"][0]["function"]["arguments"]
+        completion_tokens = estimate_tokens(completion_text)
+        max_tokens = data.get('max_completion_tokens') or data.get('max_tokens')
+        finish_reason = "tool_calls" if tool_name else "stop"
+        if max_tokens and completion_tokens > max_tokens:
+            completion_tokens, finish_reason = max_tokens, "length"
+
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        if self.config.prefix_cache is not None:
+            usage["prompt_tokens_details"] = {"cached_tokens": cached}
         response = {
-            "id": "mock-chat-123",
+            "id": f"mock-chat-{rng.getrandbits(48):012x}",
             "object": "chat.completion",
             "created": int(time.time()),
             "model": data.get('model', 'mock-model'),
             "choices": [{
                 "index": 0,
-                "message": {
-                    "role": "assistant",
-                    "content": answer
-                },
-                "finish_reason": "stop"
+                "message": message,
+                "finish_reason": finish_reason
             }],
-            "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20}
+            "usage": usage
         }
+        delay = self.config.latency.sample(rng, prompt_tokens, completion_tokens)
+        time.sleep(delay)
+        self.state.record(endpoint, prompt_tokens, completion_tokens, cached, latency=delay)
         self._send_json(response)
 
+    def _tool_arguments(self, tool_name, schema, prompt):
+        """Schema-shaped arguments answering every question of the prompt (deterministic per question)."""
+        seed = self.config.seed
+        props = schema.get("properties", {})
+        if tool_name == 'submit_classification':
+            item_schema = props.get("results", {}).get("items", {})
+            enum = item_schema.get("properties", {}).get("domain", {}).get("enum") or ["K"]
+            results = []
+            for qid in _CLASSIFY_ID.findall(prompt):
+                domain = enum[int(_unit(seed, "domain", qid) * len(enum))]
+                results.append(fake_from_schema(item_schema, random.Random(_digest(seed, qid)), {"id": qid, "domain": domain}))
+            return {"results": results}
+
+        answer_schema = props.get("answers", {}).get("items", {})
+        code_schema = props.get("execute_python", {}).get("items")
+        answers, calc = [], []
+        for qid, block in _QUESTION_BLOCK.findall(prompt):
+            letters = _CHOICE_LINE.findall(block) or ["A"]
+            q_rng = random.Random(_digest(seed, "answer", qid))
+            # First pass only: a share of questions asks for a calculation (-> tool follow-up pass)
+            if code_schema and "[HỆ THỐNG EXECUTION]" not in block and _unit(seed, "tool", qid) < self.config.tool_rate:
+                calc.append(fake_from_schema(code_schema, q_rng, {"id": qid, "code": "print(6 * 7)"}))
+                continue
+            answers.append(fake_from_schema(answer_schema, q_rng, {
+                "id": qid,
+                "answer": letters[int(_unit(seed, "letter", qid) * len(letters))],
+                "reasoning": f"Mock reasoning for {qid}.",
+                "is_sensitive": False
+            }))
+        arguments = {"answers": answers}
+        if calc:
+            arguments["execute_python"] = calc
+        return arguments
+
     def _send_json(self, data):
         self.send_response(200)
+        body = json.dumps(data).encode('utf-8')
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body))) # Lets clients reuse keep-alive connections
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode('utf-8'))
+        self.wfile.write(body)
 
     def log_message(self, format, *args):
         # Suppress default logging to keep terminal clean
         return
 
-if __name__ == '__main__':
-    print(f"Starting DEPENDENCY-FREE Mock API on port {PORT}...")
-    print("Use Ctrl+C to stop.")
-    with socketserver.TCPServer(("", PORT), MockHandler) as httpd:
+
+def start_server(config=None, port=PORT, host="127.0.0.1"):
+    """
+    Starts a threaded mock server in the background and returns it (httpd.handler has
+    .config and .state; GET /stats serves the usage accounting).
+    """
+    config = config or MockConfig()
+
+    class Handler(MockHandler):
+        pass
+
+    Handler.config = config
+    Handler.state = MockState(config)
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    httpd = socketserver.ThreadingTCPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    httpd.handler = Handler
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def _parse_rate_limits(specs):
+    """'small:60:200000' (endpoint:requests per minute:tokens per minute, 0 = unlimited) -> {endpoint: WindowRateLimit}"""
+    limits = {}
+    for spec in specs or []:
+        endpoint, requests, tokens = (spec.split(":") + ["0", "0"])[:3]
+        limits[endpoint] = WindowRateLimit(int(requests) or None, int(tokens) or None)
+    return limits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic offline VNPT API stand-in.")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--host", default="")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", choices=["constant", "uniform", "lognormal", "exponential"], default="lognormal")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Median chat latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal shape")
+    parser.add_argument("--tail-prob", type=float, default=0.0, help="Share of straggler requests")
+    parser.add_argument("--tail-factor", type=float, default=5.0, help="Straggler slowdown")
+    parser.add_argument("--prompt-ms-per-1k", type=float, default=0.0, help="Added latency per 1k prompt tokens")
+    parser.add_argument("--completion-ms-per-1k", type=float, default=0.0, help="Added latency per 1k completion tokens")
+    parser.add_argument("--embedding-latency-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with an injected error")
+    parser.add_argument("--error-statuses", default="429,500,503", help="Comma-separated statuses for injected errors")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on injected 429/503")
+    parser.add_argument("--rate-limit", action="append", metavar="ENDPOINT:RPM:TPM",
+                        help="Sliding 60s window per endpoint (small/large/embedding), e.g. small:60:200000")
+    parser.add_argument("--tool-rate", type=float, default=0.0, help="Share of first-pass questions answered with execute_python")
+    parser.add_argument("--prefix-cache", action="store_true", help="Simulate server-side prefix caching")
+    parser.add_argument("--quiet", action="store_true", help="No per-request log lines")
+    args = parser.parse_args()
+
+    config = MockConfig(
+        seed=args.seed,
+        latency=LatencyModel(args.latency, args.latency_ms, args.latency_sigma, args.tail_prob, args.tail_factor,
+                             args.prompt_ms_per_1k, args.completion_ms_per_1k),
+        embedding_latency=LatencyModel("constant", args.embedding_latency_ms),
+        error_rate=args.error_rate,
+        error_statuses=[int(s) for s in args.error_statuses.split(",") if s],
+        retry_after=args.retry_after,
+        rate_limits=_parse_rate_limits(args.rate_limit),
+        tool_rate=args.tool_rate,
+        prefix_cache=PrefixCacheSimulator() if args.prefix_cache else None,
+        verbose=not args.quiet
+    )
+    print(f"Starting DEPENDENCY-FREE Mock API on port {args.port} (seed {args.seed})...")
+    print("GET /stats for usage accounting. Use Ctrl+C to stop.")
+    # Threaded: the solver sends concurrent requests
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    handler = type("Handler", (MockHandler,), {"config": config, "state": MockState(config)})
+    with socketserver.ThreadingTCPServer((args.host, args.port), handler) as httpd:
+        httpd.daemon_threads = True
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
             print("\nStopping server...")
+
+
+if __name__ == '__main__':
+    main()
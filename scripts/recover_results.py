@@ -0,0 +1,46 @@
+import sys
+import os
+import json
+import argparse
+
+# Rebuilds submission files (JSON + CSVs) from a result journal, e.g. after a crash
+# or to materialize a snapshot of a run that is still in progress.
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.journal import ResultJournal, journal_path_for, write_submission
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Materialize submission files from a result journal.")
+    parser.add_argument("--output", default="output/submission.json", help="Submission JSON path to (re)write")
+    parser.add_argument("--journal", default=None, help="Journal path (default: derived from --output)")
+    parser.add_argument("--input", default=None, help="Questions JSON: restores input order and reports missing IDs")
+    args = parser.parse_args()
+
+    journal_path = args.journal or journal_path_for(args.output)
+    if not os.path.exists(journal_path):
+        print(f"[Recover] Journal not found: {journal_path}")
+        sys.exit(1)
+
+    latest = ResultJournal.replay(journal_path)
+    print(f"[Recover] {len(latest)} answered questions in {journal_path}")
+
+    if args.input:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            questions = json.load(f)
+        order = [q.get('id') or q.get('qid') for q in questions]
+        results = [latest[qid] for qid in order if qid in latest]
+        missing = [qid for qid in order if qid not in latest]
+        if missing:
+            print(f"[Recover] {len(missing)} questions have no answer yet (first: {', '.join(missing[:5])})")
+    else:
+        results = list(latest.values()) # Journal order
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    write_submission(results, args.output)
+    print(f"[Recover] Wrote {len(results)} results to {args.output} (+ CSVs)")
+
+
+if __name__ == "__main__":
+    main()
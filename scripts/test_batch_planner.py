@@ -0,0 +1,56 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.batch_planner import first_fit_decreasing, sequential_fill, min_batches, plan_batches, PackingStats
+
+
+def check_layout(bins, sizes, max_tokens, max_items=None):
+    """Every index exactly once; bins within budget unless they hold one oversized item."""
+    assert sorted(i for b in bins for i in b) == list(range(len(sizes)))
+    for b in bins:
+        assert b == sorted(b)
+        assert len(b) == 1 or sum(sizes[i] for i in b) <= max_tokens
+        assert not max_items or len(b) <= max_items
+
+
+def test_first_fit_decreasing():
+    print("Testing first_fit_decreasing...")
+    sizes = [60, 50, 40, 30, 20, 10, 50, 40]
+    bins = first_fit_decreasing(sizes, 100)
+    print(f"FFD: {bins} vs sequential: {sequential_fill(sizes, 100)}")
+    check_layout(bins, sizes, 100)
+    assert len(bins) == min_batches(sizes, 100) == 3
+    assert len(sequential_fill(sizes, 100)) == 4
+
+    # Item cap
+    bins = first_fit_decreasing([1] * 10, 100, max_items=4)
+    check_layout(bins, [1] * 10, 100, 4)
+    assert len(bins) == 3
+
+    # Oversized item gets a bin of its own
+    sizes = [250, 30, 30]
+    bins = first_fit_decreasing(sizes, 100)
+    check_layout(bins, sizes, 100)
+    assert [0] in bins and len(bins) == 2
+
+    assert first_fit_decreasing([], 100) == []
+
+
+def test_plan_batches():
+    print("Testing plan_batches (domain-pure batches, stats)...")
+    items = [{"id": f"q{i}", "domain": "TN" if i % 2 else "XH", "_formatted_text": "từ " * (20 * (i + 1))} for i in range(8)]
+    stats = PackingStats()
+    batches = plan_batches(items, 200, max_items=3, stats=stats, stage="test")
+    assert sorted(it["id"] for b in batches for it in b) == sorted(it["id"] for it in items)
+    for b in batches:
+        assert len({it["domain"] for it in b}) == 1 and len(b) <= 3
+    summary = stats.summary()["test"]
+    print(f"Stats: {summary}")
+    assert summary["batches"] == len(batches) and summary["items"] == 8
+    assert summary["lower_bound"] <= summary["batches"] <= summary["greedy"]
+
+
+if __name__ == "__main__":
+    test_first_fit_decreasing()
+    test_plan_batches()
+    print("\nAll Tests Passed!")
@@ -0,0 +1,89 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.coalesce import DuplicateCoalescer, normalize_text
+
+
+def q(qid, question, choices):
+    return {"id": qid, "question": question, "choices": choices}
+
+
+def test_normalize_text():
+    print("Testing normalize_text...")
+    assert normalize_text("  Thủ đô của  Việt Nam là gì? ") == normalize_text("thủ đô của việt nam là gì")
+    assert normalize_text("5 - 3") != normalize_text("5 + 3")
+    assert normalize_text("x > 2") != normalize_text("x < 2")
+    assert normalize_text("1.5") != normalize_text("15")
+    assert normalize_text("5-3") == normalize_text("5 - 3")
+
+
+def test_operators_not_coalesced():
+    print("Testing operator / sign differences are kept apart...")
+    choices = ["2", "8", "15", "0"]
+    coalescer = DuplicateCoalescer()
+    unique = coalescer.coalesce([
+        q("a", "Giá trị của 5 - 3 là bao nhiêu?", choices),
+        q("b", "Giá trị của 5 + 3 là bao nhiêu?", choices),
+        q("c", "Giá trị của 5 * 3 là bao nhiêu?", choices),
+    ])
+    print(f"Representatives: {coalescer.representatives}, stats: {coalescer.stats}")
+    assert [item["id"] for item in unique] == ["a", "b", "c"]
+    assert coalescer.representatives == {}
+
+    coalescer = DuplicateCoalescer()
+    unique = coalescer.coalesce([
+        q("a", "Nếu x > 2 thì khẳng định nào đúng?", ["x = 3 là nghiệm", "x = 1 là nghiệm"]),
+        q("b", "Nếu x < 2 thì khẳng định nào đúng?", ["x = 3 là nghiệm", "x = 1 là nghiệm"]),
+    ])
+    assert len(unique) == 2
+
+    # Long stems: the near-duplicate path must not merge them either
+    stem = "Trong một bài toán dài về chi phí sản xuất của doanh nghiệp trong năm tài chính, hãy tính "
+    coalescer = DuplicateCoalescer(threshold=0.5)
+    unique = coalescer.coalesce([q("a", stem + "100 - 20", choices), q("b", stem + "100 + 20", choices)])
+    assert len(unique) == 2, coalescer.stats
+
+
+def test_exact_and_near_duplicates():
+    print("Testing exact / near duplicates...")
+    choices = ["Hà Nội", "Huế", "Đà Nẵng", "Sài Gòn"]
+    coalescer = DuplicateCoalescer(threshold=0.8)
+    unique = coalescer.coalesce([
+        q("a", "Thủ đô của Việt Nam là gì?", choices),
+        q("b", "thủ đô của việt nam là gì", choices),
+        q("c", "Thủ đô của Việt Nam là gì ạ?", choices),
+        q("d", "Thủ đô của Việt Nam không phải là gì?", choices),
+    ])
+    print(f"Representatives: {coalescer.representatives}, stats: {coalescer.stats}")
+    assert [item["id"] for item in unique] == ["a", "d"]
+    assert coalescer.representatives == {"b": "a", "c": "a"}
+    assert coalescer.stats["exact"] == 1 and coalescer.stats["near"] == 1
+
+
+def test_remap_permuted_choices():
+    print("Testing answer remap for permuted choices...")
+    coalescer = DuplicateCoalescer()
+    unique = coalescer.coalesce([
+        q("a", "Thủ đô của Việt Nam là gì?", ["Hà Nội", "Huế", "Đà Nẵng", "Sài Gòn"]),
+        q("b", "Thủ đô của Việt Nam là gì?", ["B. Huế", "A. Sài Gòn", "C. Đà Nẵng", "D. Hà Nội"]),
+        q("c", "Thủ đô của Việt Nam là gì?", ["Hà Nội", "Huế", "Đà Nẵng", "Sài Gòn"]),
+    ])
+    assert len(unique) == 1
+    copies = {r["id"]: r for r in coalescer.expand({"id": "a", "answer": "A", "confidence": 90})}
+    print(f"Copies: {copies}")
+    assert copies["b"]["answer"] == "D"
+    assert copies["c"]["answer"] == "A"
+    assert copies["b"]["duplicate_of"] == "a" and copies["b"]["confidence"] == 90
+    assert coalescer.expand({"id": "b", "answer": "A"}) == []
+
+    # Copies did no work: they report no time of their own
+    copies = coalescer.expand({"id": "a", "answer": "A", "time": 1.5, "timeline": {"llm": 1.5}})
+    assert all(c["time"] == 0.0 and c["timeline"] == {"dedup": 0.0} for c in copies)
+
+
+if __name__ == "__main__":
+    test_normalize_text()
+    test_operators_not_coalesced()
+    test_exact_and_near_duplicates()
+    test_remap_permuted_choices()
+    print("\nAll Tests Passed!")
@@ -0,0 +1,57 @@
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.code_cache import code_key, CodeResultCache
+
+
+def test_code_key():
+    print("Testing code_key (AST normalization)...")
+    a, det_a = code_key("x = 1+2\nprint(x)", 5)
+    b, det_b = code_key("# tính tổng\nx = (1 + 2)\n\nprint( x )  # kết quả\n", 5)
+    assert a == b and det_a and det_b
+    assert code_key("x = 1+2\nprint(x)", 10)[0] != a # Timeout is part of the key
+    assert code_key("x = 1-2\nprint(x)", 5)[0] != a
+    assert code_key("print('a b')", 5)[0] != code_key("print('a  b')", 5)[0] # String literals matter
+
+    key, det = code_key("print(1 +", 5)
+    assert det and key == code_key("  print(1 +  \n", 5)[0] # SyntaxError is deterministic too
+
+
+def test_nondeterministic_code():
+    print("Testing non-deterministic snippets are detected...")
+    for code in ["import random\nprint(random.random())",
+                 "from datetime import datetime\nprint(datetime.now())",
+                 "import numpy as np\nprint(np.random.rand())",
+                 "print(open('/etc/hostname').read())",
+                 "m = __import__('os')\nprint(m.getpid())",
+                 "from numpy.random import default_rng"]:
+        assert not code_key(code, 5)[1], code
+    for code in ["import math\nprint(math.sqrt(16))", "from fractions import Fraction\nprint(Fraction(1, 3) * 3)"]:
+        assert code_key(code, 5)[1], code
+
+
+def test_cache_lru_and_persistence():
+    print("Testing CodeResultCache (LRU, transient outputs, save/load)...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "code_cache.json")
+        cache = CodeResultCache(max_entries=2, path=path)
+        cache.put("k1", "1")
+        cache.put("k2", "2")
+        assert cache.get("k1") == "1" # k1 is now the most recent
+        cache.put("k3", "3")
+        assert cache.get("k2") is None and cache.get("k3") == "3"
+        cache.put("k4", "Error: Execution timed out (limit: 5s).")
+        assert cache.get("k4") is None
+        print(f"Stats: {cache.stats()}")
+        cache.save()
+
+        reloaded = CodeResultCache(max_entries=2, path=path)
+        assert reloaded.get("k1") == "1" and reloaded.get("k3") == "3"
+
+
+if __name__ == "__main__":
+    test_code_key()
+    test_nondeterministic_code()
+    test_cache_lru_and_persistence()
+    print("\nAll Tests Passed!")
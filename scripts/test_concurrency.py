@@ -0,0 +1,121 @@
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.concurrency import AdaptiveConcurrencyLimiter, get_limiter, pool_size, parse_retry_after
+from src.config import ADAPTIVE_CONCURRENCY, CONCURRENCY_MAX, MAX_WORKERS_CALC, MAX_WORKERS_INFERENCE
+
+
+class FakeResponse:
+    def __init__(self, status_code, retry_after=None):
+        self.status_code = status_code
+        self.headers = {'Retry-After': retry_after} if retry_after is not None else {}
+
+
+def full_round(limiter, latency=0.1):
+    """Fills every slot, then lets each request finish healthy."""
+    width = int(limiter.limit)
+    for _ in range(width):
+        limiter.acquire()
+    for _ in range(width):
+        limiter.release(latency=latency)
+
+
+def test_additive_increase():
+    print("Testing additive increase while the limit is used...")
+    limiter = AdaptiveConcurrencyLimiter("test", 4, max_limit=8)
+    for _ in range(4):
+        full_round(limiter)
+    print(f"Snapshot: {limiter.snapshot()}")
+    assert 4.5 < limiter.limit < 6 # About +1 per round of full-width requests
+    for _ in range(100):
+        full_round(limiter)
+    assert limiter.limit == 8 # Capped at max_limit
+
+    # Unused headroom does not grow the limit
+    idle = AdaptiveConcurrencyLimiter("idle", 4, max_limit=8)
+    for _ in range(20):
+        idle.acquire()
+        idle.release(latency=0.1)
+    assert idle.limit == 4
+
+    # Latency far above the baseline stops growth
+    slow = AdaptiveConcurrencyLimiter("slow", 4, max_limit=8, latency_tolerance=2.0)
+    full_round(slow, latency=0.1)
+    start = slow.limit
+    for _ in range(5):
+        full_round(slow, latency=1.0)
+    assert slow.limit == start
+
+
+def test_overload_halves_and_cools_down():
+    print("Testing 429 / 503 halve the limit once per congestion event...")
+    limiter = AdaptiveConcurrencyLimiter("test", 8, backoff=0.5, default_retry_after=0.2, max_retry_after=5.0)
+    with limiter.slot() as slot:
+        slot.record(FakeResponse(429))
+    assert limiter.limit == 4
+
+    # Same congestion event (within one baseline latency of the cut): no second halving
+    with limiter.slot() as slot:
+        slot.record(FakeResponse(503))
+    assert limiter.limit == 4 and limiter.overloads == 2
+
+    # A later event cuts again, down to min_limit at most
+    limiter._last_decrease -= 10
+    limiter.on_overload(retry_after=0)
+    assert limiter.limit == 2
+    for _ in range(5):
+        limiter._last_decrease -= 10
+        limiter.on_overload(retry_after=0)
+    assert limiter.limit == limiter.min_limit
+
+
+def test_retry_after():
+    print("Testing Retry-After blocks new requests...")
+    assert parse_retry_after("1.5") == 1.5 and parse_retry_after("") is None and parse_retry_after("soon") is None
+
+    limiter = AdaptiveConcurrencyLimiter("test", 4, default_retry_after=0.2)
+    with limiter.slot() as slot:
+        slot.record(FakeResponse(429, retry_after="0.4"))
+    t0 = time.time()
+    with limiter.slot():
+        pass
+    waited = time.time() - t0
+    print(f"Waited {waited:.2f}s (Retry-After: 0.4)")
+    assert 0.3 < waited < 0.8
+
+    # No header: exponential default, doubling per consecutive overload
+    limiter = AdaptiveConcurrencyLimiter("test", 4, default_retry_after=0.1, max_retry_after=0.3)
+    now = time.time()
+    limiter.on_overload()
+    assert abs(limiter.blocked_until - now - 0.1) < 0.05
+    limiter.on_overload()
+    assert abs(limiter.blocked_until - now - 0.2) < 0.05
+    limiter.on_overload()
+    limiter.on_overload()
+    assert limiter.blocked_until - now < 0.35 # Capped at max_retry_after
+
+    # A healthy response resets the streak
+    time.sleep(0.35)
+    with limiter.slot():
+        pass
+    assert limiter._overload_streak == 0
+
+
+def test_pool_and_initial_width():
+    print("Testing pool sizes and starting limits...")
+    if not ADAPTIVE_CONCURRENCY:
+        assert pool_size(MAX_WORKERS_CALC) == MAX_WORKERS_CALC
+        return
+    # Pools are as wide as the limiter may grow; the limiter does the gating
+    assert pool_size(MAX_WORKERS_INFERENCE) == pool_size(MAX_WORKERS_CALC) == max(CONCURRENCY_MAX, MAX_WORKERS_CALC)
+    # Chat limiters start at the widest pool that used to call them
+    assert get_limiter('small').limit == get_limiter('large').limit == max(MAX_WORKERS_INFERENCE, MAX_WORKERS_CALC)
+
+
+if __name__ == "__main__":
+    test_additive_increase()
+    test_overload_halves_and_cools_down()
+    test_retry_after()
+    test_pool_and_initial_width()
+    print("\nAll Tests Passed!")
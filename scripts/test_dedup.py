@@ -0,0 +1,35 @@
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.dedup import MinHashDeduplicator
+
+
+def test_minhash_rollback():
+    print("Testing MinHash signatures are only persisted once written...")
+    body = " ".join(f"Điều {i} quy định về quyền và nghĩa vụ của công dân trong lĩnh vực này" for i in range(8))
+    canonical = {"text": body, "metadata": {"source": "vbpl", "source_file": "a.txt"}}
+    duplicate = {"text": body + ".", "metadata": {"source": "luatvn", "source_file": "b.txt"}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        state = os.path.join(tmp, "dedup.pkl")
+        dedup = MinHashDeduplicator(state_path=state)
+        assert dedup.filter([canonical, duplicate]) == [canonical]
+
+        # Embedding failed: the duplicate comes back and becomes the canonical
+        fallbacks = dedup.rollback([canonical["text"]])
+        assert fallbacks == [duplicate]
+        assert dedup.filter(fallbacks) == [duplicate]
+
+        # Unconfirmed canonicals are not saved
+        dedup.save()
+        assert MinHashDeduplicator(state_path=state).filter([canonical]) == [canonical]
+
+        dedup.confirm([duplicate["text"]])
+        dedup.save()
+        assert MinHashDeduplicator(state_path=state).filter([canonical]) == []
+
+
+if __name__ == "__main__":
+    test_minhash_rollback()
+    print("\nAll Tests Passed!")
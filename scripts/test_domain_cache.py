@@ -0,0 +1,102 @@
+import sys
+import os
+import json
+import random
+import tempfile
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.domain_cache import DomainCache, DomainPreClassifier, question_key, _feature_text
+
+
+def q(qid, question, choices=("A", "B")):
+    return {"id": qid, "question": question, "choices": list(choices)}
+
+
+def test_cache_round_trip():
+    print("Testing DomainCache round trip (content keys, save/load)...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "domain_cache.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"legacy_qid": "TN"}, f) # Old {qid: domain} format is ignored
+
+        cache = DomainCache(path)
+        assert len(cache) == 0
+        items = [q("q1", "Đạo hàm của x^2 là gì?"), q("q2", "Năm 1945 có sự kiện gì?"), q("q3", "Không có nhãn")]
+        cache.put_many(items, {"q1": "TN", "q2": "XH"})
+        cache.save()
+
+        reloaded = DomainCache(path)
+        assert len(reloaded) == 2
+        # Keyed by content: another ID (and spacing / case) hits, another question misses
+        assert reloaded.get(q("other", "  đạo hàm của  X^2 là gì? ")) == "TN"
+        assert reloaded.get(q("q2", "Một câu hỏi khác")) is None
+        assert reloaded.get(items[2]) is None
+        assert (reloaded.hits, reloaded.misses) == (1, 2)
+
+        keys, texts, labels = reloaded.training_data()
+        assert set(keys) == {question_key(items[0]), question_key(items[1])}
+        assert all(texts) and sorted(labels) == ["TN", "XH"]
+
+
+def test_fallback_labels_not_cached():
+    print("Testing safety-filter fallback labels are not persisted...")
+    from src.batch_solver import BatchSolver
+
+    def blocked(**kwargs):
+        raise ValueError("400 BadRequestError: nội dung vi phạm thuần phong mỹ tục")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = DomainCache(os.path.join(tmp, "domain_cache.json"))
+        solver = SimpleNamespace(client=SimpleNamespace(chat_completion=blocked), domain_cache=cache,
+                                 limiter_small=None, limiter_large=None)
+        batch = [q("q1", "Câu hỏi nhạy cảm 1"), q("q2", "Câu hỏi nhạy cảm 2")]
+        assert BatchSolver._classify_batch_domains(solver, batch) == {"q1": "S", "q2": "S"}
+        assert len(cache) == 0 and cache.get(batch[0]) is None
+
+
+def separable_dataset(n=120):
+    items, labels = [], []
+    for i in range(n):
+        if i % 2:
+            items.append(q(f"t{i}", f"Tính đạo hàm của hàm số y = x^{i} + {i}x tại điểm x = {i % 7}", ["0", "1", "2", "3"]))
+            labels.append("TN")
+        else:
+            items.append(q(f"x{i}", f"Triều đại nhà Lý năm {1000 + i} ban hành chính sách lịch sử nào", ["Thuế", "Ruộng", "Quân", "Đê"]))
+            labels.append("XH")
+    return items, labels
+
+
+def test_pre_classifier_gating():
+    print("Testing pre-classifier confidence / accuracy gating...")
+    items, labels = separable_dataset()
+    keys = [question_key(it) for it in items]
+    texts = [_feature_text(it) for it in items]
+
+    # Too few labels: stays disabled
+    clf = DomainPreClassifier(min_samples=500)
+    assert not clf.fit(keys, texts, labels) and clf.predict(items) == {}
+
+    clf = DomainPreClassifier(threshold=0.6, min_samples=50, min_accuracy=0.9)
+    assert clf.fit(keys, texts, labels)
+    probe = [q("p1", "Tính đạo hàm của hàm số y = x^3 + 5x tại điểm x = 2", ["0", "1", "2", "3"]),
+             q("p2", "Triều đại nhà Lý năm 1075 ban hành chính sách lịch sử nào", ["Thuế", "Ruộng", "Quân", "Đê"])]
+    local = clf.predict(probe)
+    print(f"Confident labels: {local}")
+    assert local == {"p1": "TN", "p2": "XH"}
+
+    # Nothing clears an impossible threshold: every item goes to the LLM
+    clf.threshold = 1.01
+    assert clf.predict(probe) == {}
+
+    # Labels the text cannot explain: held-out accuracy gate keeps it off
+    rng = random.Random(0)
+    noisy = [rng.choice(["TN", "XH", "K"]) for _ in labels]
+    clf = DomainPreClassifier(threshold=0.6, min_samples=50, min_accuracy=0.9)
+    assert not clf.fit(keys, texts, noisy) and clf.model is None
+
+
+if __name__ == "__main__":
+    test_cache_round_trip()
+    test_fallback_labels_not_cached()
+    test_pre_classifier_gating()
+    print("\nAll Tests Passed!")
@@ -0,0 +1,85 @@
+import sys
+import os
+import sqlite3
+import hashlib
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.integrity import IdLedger, NUM_SEGMENTS, divergent_segments, id_segment
+
+
+def doc_id(i):
+    return hashlib.md5(f"doc {i}".encode('utf-8')).hexdigest()
+
+
+def new_ledger(ids=()):
+    conn = sqlite3.connect(":memory:")
+    ledger = IdLedger("ids")
+    cursor = conn.cursor()
+    assert ledger.ensure_schema(cursor)
+    ledger.add(cursor, list(ids))
+    return ledger, cursor
+
+
+def test_digest_detects_single_changes():
+    print("Testing per-segment XOR digests catch one added / removed ID...")
+    ids = [doc_id(i) for i in range(3000)]
+    a, ca = new_ledger(ids)
+    b, cb = new_ledger(reversed(ids)) # Insertion order does not matter
+    assert a.digests(ca) == b.digests(cb) and a.total(ca) == 3000
+    assert divergent_segments(a.digests(ca), b.digests(cb)) == []
+
+    # One extra ID in every segment: each segment is flagged, nothing else
+    extra = {}
+    i = 3000
+    while len(extra) < NUM_SEGMENTS:
+        extra.setdefault(id_segment(doc_id(i)), doc_id(i))
+        i += 1
+    for seg, new_id in extra.items():
+        b.add(cb, [new_id])
+        assert divergent_segments(a.digests(ca), b.digests(cb)) == [seg], seg
+        b.remove(cb, [new_id])
+    assert a.digests(ca) == b.digests(cb)
+
+    # One missing ID per segment
+    by_segment = {}
+    for x in ids:
+        by_segment.setdefault(id_segment(x), x)
+    for seg, old_id in by_segment.items():
+        b.remove(cb, [old_id])
+        assert divergent_segments(a.digests(ca), b.digests(cb)) == [seg]
+        assert set(a.ids_in_segment(ca, seg)) - set(b.ids_in_segment(cb, seg)) == {old_id}
+        b.add(cb, [old_id])
+    assert a.digests(ca) == b.digests(cb)
+
+    # Same count, different member: the XOR still differs
+    seg, old_id = next(iter(extra.items()))
+    swapped = [x for x in ids if x != by_segment[seg]] + [old_id]
+    c, cc = new_ledger(swapped)
+    assert c.total(cc) == a.total(ca) and divergent_segments(a.digests(ca), c.digests(cc)) == [seg]
+    print(f"Checked {len(extra)} segments")
+
+
+def test_idempotent_updates_and_pending_marker():
+    print("Testing repeated adds / removes and the in-flight write marker...")
+    ledger, cursor = new_ledger([doc_id(i) for i in range(10)])
+    before = ledger.digests(cursor)
+    assert ledger.add(cursor, [doc_id(1), doc_id(1)]) == []
+    assert ledger.remove(cursor, [doc_id(99)]) == []
+    assert ledger.digests(cursor) == before
+
+    assert ledger.pending_writes(cursor) == 0
+    ledger.begin_write(cursor)
+    ledger.begin_write(cursor)
+    assert ledger.pending_writes(cursor) == 2
+    ledger.end_write(cursor)
+    ledger.end_write(cursor)
+    ledger.end_write(cursor) # Never below zero
+    assert ledger.pending_writes(cursor) == 0
+
+    pages = list(ledger.iter_ids(cursor, batch_size=4))
+    assert [len(p) for p in pages] == [4, 4, 2] and sorted(x for p in pages for x in p) == sorted(doc_id(i) for i in range(10))
+
+
+if __name__ == "__main__":
+    test_digest_detects_single_changes()
+    test_idempotent_updates_and_pending_marker()
+    print("\nAll Tests Passed!")
@@ -0,0 +1,153 @@
+import sys
+import os
+import json
+import socket
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.journal import ResultJournal, input_digest, journal_path_for
+from src.batch_solver import BatchSolver
+
+DATA = [{"id": f"q{i}", "question": f"Câu hỏi {i}", "choices": ["A", "B"]} for i in range(4)]
+
+
+def write_journal(path):
+    journal = ResultJournal(path, fsync_every=1)
+    journal.append_run(DATA)
+    journal.append_results([{"id": "q0", "answer": "A", "_internal": 1}])
+    journal.append_states([{"id": "q1", "_formatted_text": "ctx", "domain": "TN", "_followup_model": "large"}], "pending")
+    journal.append_results([{"id": "q2", "answer": "B"}])
+    journal.append_states([{"id": "q2", "domain": "KT"}], "pending") # q2 went back into the pipeline
+    journal.append_results([{"id": "q0", "answer": "C"}]) # Later answer wins
+    journal.close()
+
+
+def test_replay_and_resume_state():
+    print("Testing journal replay / resume state...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "submission.journal.jsonl")
+        write_journal(path)
+
+        assert ResultJournal.replay(path) == {"q0": {"id": "q0", "answer": "C"}, "q2": {"id": "q2", "answer": "B"}}
+        state = ResultJournal.load_resume_state(path)
+        print(f"Resume state: {state}")
+        assert state["input_digest"] == input_digest(DATA)
+        assert state["results"] == {"q0": {"id": "q0", "answer": "C"}}
+        assert state["states"]["q1"] == {"_formatted_text": "ctx", "domain": "TN", "_followup_model": "large", "stage": "pending"}
+        assert state["states"]["q2"]["stage"] == "pending"
+
+
+def test_torn_tail():
+    print("Testing torn last line (crash mid-write)...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "submission.journal.jsonl")
+        write_journal(path)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('{"event": "result", "id": "q3", "data": {"ans')
+
+        # Reading skips the partial line; appending cuts it first
+        assert "q3" not in ResultJournal.replay(path)
+        journal = ResultJournal(path, truncate=False)
+        journal.append_results([{"id": "q3", "answer": "D"}])
+        journal.close()
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        assert all(json.loads(line) for line in lines)
+        assert ResultJournal.replay(path)["q3"] == {"id": "q3", "answer": "D"}
+
+
+def test_restore_from_journal():
+    print("Testing BatchSolver resume from a journal...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = journal_path_for(os.path.join(tmp, "submission.json"))
+        write_journal(path)
+
+        data = [dict(item) for item in DATA]
+        finished = BatchSolver._restore_from_journal(None, data, path)
+        assert list(finished) == ["q0"]
+        assert data[1]["_resume_stage"] == "pending" and data[1]["_followup_model"] == "large"
+        assert data[2]["domain"] == "KT"
+        assert "_resume_stage" not in data[3]
+
+        # Another question set: the journal is discarded
+        changed = [dict(item, question="khác") for item in DATA]
+        assert BatchSolver._restore_from_journal(None, changed, path) == {}
+        assert not os.path.exists(path)
+
+
+def test_phased_resume_mid_pass():
+    print("Testing phased resume after a crash in the calculation pass (LLM calls counted)...")
+    from mock_api import MockConfig, start_server
+    from bench_pipeline import write_mock_keys
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    mock = start_server(MockConfig(seed=3, tool_rate=0.5), port)
+    saved_env = {k: os.environ.get(k) for k in ("VNPT_API_URL", "VNPT_API_KEYS", "VNPT_LLM_CACHE")}
+    os.environ["VNPT_API_URL"] = f"http://127.0.0.1:{port}"
+    os.environ["VNPT_API_KEYS"] = write_mock_keys()
+    os.environ["VNPT_LLM_CACHE"] = "0"
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(root, "public_test", "val_50.json"), "r", encoding="utf-8") as f:
+        questions = json.load(f)[:10]
+
+    def solver_with_log():
+        solver = BatchSolver()
+        solver._retriever_failed = True
+        batches = []
+        process = solver._process_single_batch
+        def logged(batch, model_name=None, retry_count=0, use_cache=True):
+            batches.append((retry_count, [it.get('id') or it.get('qid') for it in batch]))
+            return process(batch, model_name, retry_count=retry_count, use_cache=use_cache)
+        solver._process_single_batch = logged
+        return solver, batches
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "submission.json")
+
+            # Run 1 dies when the calculation pass starts (first pass fully journaled)
+            solver, batches = solver_with_log()
+            process = solver._process_single_batch
+            def crash(batch, model_name=None, retry_count=0, use_cache=True):
+                if retry_count == 1:
+                    raise KeyboardInterrupt("simulated crash")
+                return process(batch, model_name, retry_count=retry_count, use_cache=use_cache)
+            solver._process_single_batch = crash
+            try:
+                solver.solve_items([dict(q) for q in questions], output_path=output, pipeline="phased")
+                raise AssertionError("expected the simulated crash")
+            except KeyboardInterrupt:
+                pass
+            state = ResultJournal.load_resume_state(journal_path_for(output))
+            pending = {qid for qid, st in state["states"].items() if st["stage"] == "pending" and qid not in state["results"]}
+            print(f"Journal: {len(state['results'])} answered, {len(pending)} pending")
+            assert pending and len(state["results"]) + len(pending) == len(questions)
+
+            # Run 2: pending items go straight to the calculation pass
+            solver, batches = solver_with_log()
+            results = solver.solve_items([dict(q) for q in questions], output_path=output, pipeline="phased", resume=True)
+            calls = solver.client.get_request_count()
+            print(f"Resume: {calls} LLM calls, batches {batches}")
+            assert sorted(r['id'] for r in results) == sorted(q['qid'] for q in questions)
+            assert batches and all(retry == 1 for retry, _ in batches) # No first-pass re-run
+            assert {qid for _, ids in batches for qid in ids} == pending
+            assert calls == len(batches) # One call per calculation batch, no classification
+    finally:
+        mock.shutdown()
+        os.remove(os.environ["VNPT_API_KEYS"])
+        for k, v in saved_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+if __name__ == "__main__":
+    test_replay_and_resume_state()
+    test_torn_tail()
+    test_restore_from_journal()
+    test_phased_resume_mid_pass()
+    print("\nAll Tests Passed!")
@@ -0,0 +1,106 @@
+import sys
+import os
+import time
+import socket
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.llm_cache import ResponseCache, request_key
+
+
+def payload(**overrides):
+    base = {"model": "vnptai_hackathon_small", "messages": [{"role": "user", "content": "1 + 1 = ?"}],
+            "temperature": 0.0, "max_completion_tokens": 100, "top_p": 1.0, "top_k": 20, "n": 1, "logprobs": False}
+    base.update(overrides)
+    return base
+
+
+def test_request_key():
+    print("Testing request_key (model / params are part of the key)...")
+    key = request_key(payload())
+    assert key == request_key(dict(reversed(list(payload().items())))) # Dict order does not matter
+    for change in [{"model": "vnptai_hackathon_large"}, {"temperature": 0.5}, {"max_completion_tokens": 200},
+                   {"seed": 42}, {"top_k": 1}, {"messages": [{"role": "user", "content": "1 + 2 = ?"}]},
+                   {"tools": [{"type": "function", "function": {"name": "f"}}]}]:
+        assert request_key(payload(**change)) != key, change
+
+
+def test_hit_miss_expiry_eviction():
+    print("Testing ResponseCache hit / miss / ttl / LRU bound / persistence...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "llm_cache.db")
+        cache = ResponseCache(path, ttl=0.3, max_entries=3)
+        k_small, k_large = request_key(payload()), request_key(payload(model="vnptai_hackathon_large"))
+        cache.put(k_small, "vnptai_hackathon_small", {"content": "2"})
+        assert cache.get(k_small) == {"content": "2"}
+        assert cache.get(k_large) is None # Same prompt, other model
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        time.sleep(0.35)
+        assert cache.get(k_small) is None and cache.expired == 1
+
+        cache = ResponseCache(path, ttl=None, max_entries=3)
+        cache.EVICT_EVERY = 1
+        for i in range(3):
+            cache.put(f"k{i}", "m", {"content": str(i)})
+            time.sleep(0.01)
+        assert cache.get("k0") # k0 is now the most recently used
+        cache.put("k3", "m", {"content": "3"})
+        assert cache.get("k1") is None and cache.get("k0") and cache.get("k3")
+        print(f"Stats: {cache.stats()}")
+        cache.close()
+
+        reopened = ResponseCache(path, ttl=None)
+        assert reopened.get("k3") == {"content": "3"}
+        reopened.close()
+
+
+def test_client_cache():
+    print("Testing VNPTClient: hits skip the API and the rate limiter...")
+    from mock_api import MockConfig, start_server
+    from bench_pipeline import write_mock_keys
+    from src.api import VNPTClient
+    from src.utils import RateLimiter
+    from src.config import MODEL_SMALL, MODEL_LARGE
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    mock = start_server(MockConfig(seed=1), port)
+    saved_env = {k: os.environ.get(k) for k in ("VNPT_API_URL", "VNPT_API_KEYS")}
+    os.environ["VNPT_API_URL"] = f"http://127.0.0.1:{port}"
+    os.environ["VNPT_API_KEYS"] = write_mock_keys()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            client = VNPTClient(use_cache=False)
+            client.cache = ResponseCache(os.path.join(tmp, "llm_cache.db"))
+            limiter = RateLimiter(1000, name="cache-test")
+            messages = [{"role": "user", "content": "Thủ đô của Việt Nam là gì?"}]
+
+            first = client.chat_completion(messages, model=MODEL_SMALL, temperature=0.0, rate_limiter=limiter)
+            assert client.chat_completion(messages, model=MODEL_SMALL, temperature=0.0, rate_limiter=limiter) == first
+            assert client.get_request_count() == 1 and limiter.stats()["acquired"] == 1
+
+            client.chat_completion(messages, model=MODEL_LARGE, temperature=0.0) # Other model: miss
+            client.chat_completion(messages, model=MODEL_SMALL, temperature=0.0, seed=7) # Other params: miss
+            client.chat_completion(messages, model=MODEL_SMALL, temperature=0.7) # Sampling: never cached
+            client.chat_completion(messages, model=MODEL_SMALL, temperature=0.7)
+            client.chat_completion(messages, model=MODEL_SMALL, temperature=0.0, use_cache=False) # Forced refresh
+            print(f"Requests: {client.get_request_count()}, cache: {client.get_cache_stats()}")
+            assert client.get_request_count() == 6
+            assert client.cache.stats()["entries"] == 3
+    finally:
+        mock.shutdown()
+        os.remove(os.environ["VNPT_API_KEYS"])
+        for k, v in saved_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+if __name__ == "__main__":
+    test_request_key()
+    test_hit_miss_expiry_eviction()
+    test_client_cache()
+    print("\nAll Tests Passed!")
@@ -0,0 +1,62 @@
+import sys
+import os
+import json
+import socket
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.batch_solver import BatchSolver
+
+# Streaming vs phased pipeline parity against scripts/mock_api.py. The mock answers (and
+# turns into execute_python requests) deterministically per question ID, so both modes must
+# end with the same answer for every question whatever their batching / scheduling.
+
+
+def run_mode(mode, questions):
+    solver = BatchSolver()
+    solver._retriever_failed = True # No ChromaDB / Reranker: the comparison is about scheduling
+    results = solver.solve_items([dict(q) for q in questions], pipeline=mode)
+    return {r['id']: r for r in results}
+
+
+def test_streaming_phased_parity():
+    print("Testing streaming and phased pipelines give identical answers...")
+    from mock_api import MockConfig, LatencyModel, start_server
+    from bench_pipeline import write_mock_keys
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    mock = start_server(MockConfig(seed=7, tool_rate=0.3, latency=LatencyModel("lognormal", 20)), port)
+    saved_env = {k: os.environ.get(k) for k in ("VNPT_API_URL", "VNPT_API_KEYS", "VNPT_LLM_CACHE")}
+    os.environ["VNPT_API_URL"] = f"http://127.0.0.1:{port}"
+    os.environ["VNPT_API_KEYS"] = write_mock_keys()
+    os.environ["VNPT_LLM_CACHE"] = "0" # Each mode must reach the API itself
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(root, "public_test", "val_50.json"), "r", encoding="utf-8") as f:
+        questions = json.load(f)[:24]
+    try:
+        phased = run_mode("phased", questions)
+        streaming = run_mode("streaming", questions)
+    finally:
+        mock.shutdown()
+        os.remove(os.environ["VNPT_API_KEYS"])
+        for k, v in saved_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+    assert sorted(phased) == sorted(streaming) == sorted(q['qid'] for q in questions)
+    # Fallback answers ('A', confidence 0) would match trivially
+    assert not any("Fallback" in str(r.get('reasoning', '')) for r in list(phased.values()) + list(streaming.values()))
+    diff = {qid: (phased[qid]['answer'], streaming[qid]['answer']) for qid in phased
+            if phased[qid]['answer'] != streaming[qid]['answer']}
+    print(f"Answers: {sum(1 for qid in phased if qid not in diff)}/{len(phased)} identical, differences: {diff}")
+    assert not diff
+    assert {qid: r.get('domain') for qid, r in phased.items()} == {qid: r.get('domain') for qid, r in streaming.items()}
+
+
+if __name__ == "__main__":
+    test_streaming_phased_parity()
+    print("\nAll Tests Passed!")
@@ -0,0 +1,50 @@
+import sys
+import os
+import json
+import time
+import tempfile
+import multiprocessing
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.utils import QuotaTracker
+
+PER_PROCESS = 400
+
+
+def add_usage_worker(path, start):
+    """Adds PER_PROCESS requests while the background flusher keeps merging into the file."""
+    start.wait()
+    tracker = QuotaTracker(path, flush_interval=0.005)
+    for i in range(PER_PROCESS):
+        tracker.add_usage(1, endpoint="small", model="vnptai_hackathon_small", tokens=3)
+        if i % 50 == 0:
+            time.sleep(0.01) # Let flushes of both processes interleave
+    tracker.close()
+
+
+def test_two_processes_one_file():
+    print("Testing two processes incrementing the same quota file...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "quota_tracker.json")
+        ctx = multiprocessing.get_context("fork") # fcntl locking is POSIX-only anyway
+        start = ctx.Event()
+        procs = [ctx.Process(target=add_usage_worker, args=(path, start)) for _ in range(2)]
+        for p in procs:
+            p.start()
+        start.set()
+        for p in procs:
+            p.join(timeout=60)
+            assert p.exitcode == 0
+
+        with open(path, "r") as f:
+            state = json.load(f)
+        day = state[QuotaTracker(path, flush_interval=0).get_today_key()]
+        print(f"File: {day}")
+        assert day["requests"] == 2 * PER_PROCESS
+        assert day["tokens"] == 2 * PER_PROCESS * 3
+        assert day["endpoints"]["small"] == {"requests": 2 * PER_PROCESS, "tokens": 2 * PER_PROCESS * 3}
+        assert day["models"]["vnptai_hackathon_small"]["requests"] == 2 * PER_PROCESS
+
+
+if __name__ == "__main__":
+    test_two_processes_one_file()
+    print("\nAll Tests Passed!")
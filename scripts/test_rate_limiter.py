@@ -0,0 +1,84 @@
+import sys
+import os
+import time
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.utils import RateLimiter
+
+
+def test_burst_then_spacing():
+    print("Testing GCRA admission (burst, then one request per emission interval)...")
+    limiter = RateLimiter(5, interval=1.0, burst=3)
+    admitted = [limiter.try_acquire() for _ in range(4)]
+    print(f"Admitted: {admitted}")
+    assert admitted == [True] * 3 + [False]
+
+    waited = limiter.acquire()
+    print(f"Waited {waited:.3f}s for the next slot")
+    assert 0.2 < waited < 0.5 # One emission interval: 1.0 / (5 - 3 + 1)
+    stats = limiter.stats()
+    assert stats["acquired"] == 4 and stats["rejected"] == 1
+    assert RateLimiter(60, interval=3600).burst == 6 # Default burst is a tenth of the limit
+
+
+def max_in_window(admits, interval):
+    """Largest number of admit timestamps inside any half-open window [t, t + interval)."""
+    best, j = 0, 0
+    for i, t in enumerate(admits):
+        while j < len(admits) and admits[j] < t + interval - 1e-9:
+            j += 1
+        best = max(best, j - i)
+    return best
+
+
+def test_sliding_window_bound():
+    print("Testing no window of 'interval' seconds ever admits more than 'limit'...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rate_limits.sqlite")
+        for limit, burst in [(10, None), (10, 1), (10, 10), (60, 6), (7, 3)]:
+            for state_path in (None, path):
+                limiter = RateLimiter(limit, interval=1.0, burst=burst, name=f"w{limit}-{burst}", state_path=state_path)
+                admits, now = [], 1000.0
+                # Poll faster than the emission interval for a few windows, with a pause mid-way
+                for step in range(2000):
+                    now += 0.003 if step != 900 else 2.0
+                    if limiter.state.attempt(limiter._cells(1, 0), now) <= 0:
+                        admits.append(now)
+                worst = max_in_window(admits, 1.0)
+                print(f"limit={limit} burst={limiter.burst} admitted={len(admits)} worst window={worst}")
+                assert worst <= limit
+                assert worst >= limit - 1 # ...while still using the quota
+
+
+def test_token_limit():
+    print("Testing token budget...")
+    limiter = RateLimiter(100, interval=10.0, token_limit=1000, token_burst=900)
+    assert limiter.try_acquire(tokens=800)
+    assert not limiter.try_acquire(tokens=800) # Request budget is fine, token budget is not
+    assert limiter.try_acquire(tokens=50)
+    try:
+        limiter.acquire(tokens=900, timeout=0.5)
+        raise AssertionError("expected TimeoutError")
+    except TimeoutError as e:
+        print(f"Timeout: {e}")
+
+
+def test_shared_state():
+    print("Testing one quota shared through the SQLite state...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rate_limits.sqlite")
+        a = RateLimiter(4, interval=60.0, burst=4, name="shared", state_path=path)
+        b = RateLimiter(4, interval=60.0, burst=4, name="shared", state_path=path)
+        other = RateLimiter(4, interval=60.0, burst=4, name="other", state_path=path)
+        assert [a.try_acquire(), b.try_acquire(), a.try_acquire(), b.try_acquire()] == [True] * 4
+        assert not a.try_acquire() and not b.try_acquire()
+        assert other.try_acquire() # Different name, different quota
+
+
+if __name__ == "__main__":
+    t0 = time.time()
+    test_burst_then_spacing()
+    test_sliding_window_bound()
+    test_token_limit()
+    test_shared_state()
+    print(f"\nAll Tests Passed! ({time.time() - t0:.1f}s)")
@@ -0,0 +1,109 @@
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.sandbox import PythonWorkerPool
+
+
+def wait_idle(pool, count, timeout=30.0):
+    """Waits until 'count' workers are idle (replacements start in the background)."""
+    deadline = time.time() + timeout
+    while pool._idle.qsize() < count and time.time() < deadline:
+        time.sleep(0.05)
+    return pool._idle.qsize() >= count
+
+
+def test_timeout_kill():
+    print("Testing timed-out jobs are stopped and the worker replaced...")
+    pool = PythonWorkerPool(size=1, memory_mb=512, preload=("math",))
+    try:
+        t0 = time.time()
+        out = pool.run("while True:\n    pass", timeout=1)
+        print(f"Output: {out} ({time.time() - t0:.2f}s)")
+        assert "timed out" in out and time.time() - t0 < 3.5
+        assert pool.stats["timeouts"] == 1 and pool.stats["recycled"] == 1
+        assert pool.run("print(6 * 7)") == "42" # Replacement worker serves the next job
+    finally:
+        pool.close()
+
+
+def test_memory_limit():
+    print("Testing RLIMIT_AS memory cap...")
+    pool = PythonWorkerPool(size=1, memory_mb=512, preload=("math",))
+    try:
+        out = pool.run("x = bytearray(2 * 1024 ** 3)\nprint(len(x))")
+        print(f"Output: {out}")
+        assert out.startswith("Error") and "MemoryError" in out
+        assert pool.run("print(len(bytearray(10 * 1024 ** 2)))") == str(10 * 1024 ** 2)
+    finally:
+        pool.close()
+
+
+def test_isolation_and_recycling():
+    print("Testing per-job builtins and recycling of tainted workers...")
+    pool = PythonWorkerPool(size=1, max_jobs=3, memory_mb=512, preload=("math", "decimal"))
+    try:
+        # Globals and the builtins dict are per job
+        assert pool.run("x = 1\n__builtins__['abs'] = None\nprint(x)") == "1"
+        assert pool.run("print(abs(-2), 'x' in globals())") == "2 False"
+        assert pool.stats["tainted"] == 0
+
+        # Rebinding a module attribute / the builtins module: the worker is not reused
+        assert pool.run("import math\nmath.pi = 3\nprint(math.pi)") == "3"
+        assert pool.stats["tainted"] == 1 and pool.stats["recycled"] == 1
+        assert pool.run("import math\nprint(round(math.pi, 5))") == "3.14159"
+        assert pool.run("import builtins\nbuiltins.len = lambda x: 0\nprint(len([1]))") == "1" # Job sees its copy
+        assert pool.run("print(len([1, 2]))") == "2"
+        assert pool.stats["tainted"] == 2
+
+        # Decimal precision does not leak into the next job
+        pool.run("from decimal import getcontext\ngetcontext().prec = 5\nprint(1)")
+        assert pool.run("from decimal import Decimal\nprint(Decimal(1) / Decimal(3))") == "0.3333333333333333333333333333"
+
+        # max_jobs: clean workers are replaced too
+        recycled = pool.stats["recycled"]
+        for _ in range(3):
+            pool.run("print(1)")
+        assert pool.stats["recycled"] == recycled + 1
+        print(f"Stats: {pool.stats}")
+    finally:
+        pool.close()
+
+
+def test_background_respawn():
+    print("Testing replacements start off the caller's thread...")
+    pool = PythonWorkerPool(size=2, memory_mb=512, preload=("math",))
+    try:
+        pool.warm_up()
+        t0 = time.time()
+        pool.run("import math\nmath.e = 0\nprint(1)")
+        pool.run("print(2)") # Served by the other worker while the replacement boots
+        print(f"Two jobs (one recycling) in {time.time() - t0:.3f}s")
+        assert wait_idle(pool, 2) and pool.stats["recycled"] == 1
+    finally:
+        pool.close()
+
+
+def test_parallel_map():
+    print("Testing parallel map (order kept, jobs overlap)...")
+    pool = PythonWorkerPool(size=4, memory_mb=512, preload=("math",))
+    try:
+        pool.warm_up()
+        codes = [f"import time\ntime.sleep(0.5)\nprint({i})" for i in range(4)] + ["print(1/0)"]
+        t0 = time.time()
+        outs = pool.map(codes, timeout=5)
+        elapsed = time.time() - t0
+        print(f"Outputs: {outs} in {elapsed:.2f}s")
+        assert outs[:4] == ["0", "1", "2", "3"] and "ZeroDivisionError" in outs[4]
+        assert elapsed < 1.5 # Sequential would take 2s+
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    test_timeout_kill()
+    test_memory_limit()
+    test_isolation_and_recycling()
+    test_background_respawn()
+    test_parallel_map()
+    print("\nAll Tests Passed!")
@@ -0,0 +1,174 @@
+import sys
+import os
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import urllib.request
+
+# Smoke test for server mode (predict.py --serve) against scripts/mock_api.py.
+# Starts the mock API and the solver server in-process, then checks /health, /metrics
+# and a streamed /solve request. test_concurrent_solve() checks that two /solve requests
+# arriving together are solved one after the other on the shared solver.
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_mock_api(port):
+    from mock_api import start_server
+    return start_server(port=port)
+
+
+def write_mock_keys():
+    keys = [{"llmApiName": name, "authorization": "Bearer mock", "tokenId": "mock", "tokenKey": "mock"}
+            for name in ("LLM small", "LLM large", "LLM embedings")]
+    fd, path = tempfile.mkstemp(suffix=".json", prefix="mock_keys_")
+    with os.fdopen(fd, "w") as f:
+        json.dump(keys, f)
+    return path
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def post_solve(base, questions, out):
+    req = urllib.request.Request(f"{base}/solve", data=json.dumps(questions).encode("utf-8"),
+                                 headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req) as r:
+        out.extend(json.loads(raw) for raw in r)
+
+
+def test_concurrent_solve():
+    print("[Test] Two concurrent /solve requests on one solver...")
+    mock_port = free_port()
+    mock = start_mock_api(mock_port)
+    saved_env = {k: os.environ.get(k) for k in ("VNPT_API_URL", "VNPT_API_KEYS", "VNPT_LLM_CACHE")}
+    os.environ["VNPT_API_URL"] = f"http://127.0.0.1:{mock_port}"
+    os.environ["VNPT_API_KEYS"] = write_mock_keys()
+    os.environ["VNPT_LLM_CACHE"] = "0"
+    tmp = tempfile.TemporaryDirectory()
+    httpd = None
+    try:
+        from src.server import create_server
+        from src.batch_solver import BatchSolver
+        from src.domain_cache import DomainCache
+        from src.utils import RateLimiter
+
+        solver = BatchSolver()
+        solver._retriever_failed = True
+        solver.domain_cache = DomainCache(os.path.join(tmp.name, "domain_cache.json"))
+        solver.limiter_small = RateLimiter(10000, name="small")
+        solver.limiter_large = RateLimiter(10000, name="large")
+
+        # Records how many runs overlap on the shared solver
+        active, peak, lock = [0], [0], threading.Lock()
+        solve_items = solver.solve_items
+        def tracked(*args, **kwargs):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            try:
+                return solve_items(*args, **kwargs)
+            finally:
+                with lock:
+                    active[0] -= 1
+        solver.solve_items = tracked
+
+        httpd = create_server(port=0, solver=solver, warm_up=False)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{httpd.server_address[1]}"
+
+        with open(os.path.join(PROJECT_ROOT, "public_test", "val_50.json"), "r", encoding="utf-8") as f:
+            questions = json.load(f)
+        batches = [questions[:4], questions[4:8]]
+        outputs = [[], []]
+        threads = [threading.Thread(target=post_solve, args=(base, b, out)) for b, out in zip(batches, outputs)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=120)
+
+        for batch, lines in zip(batches, outputs):
+            answers = [l for l in lines if not l.get("done")]
+            print(f"[Test] ids {[a['id'] for a in answers]}, tail={lines[-1] if lines else None}")
+            assert lines and lines[-1] == {"done": True, "count": len(batch)}
+            assert sorted(a["id"] for a in answers) == sorted(q.get("id") or q.get("qid") for q in batch)
+        assert peak[0] == 1, f"{peak[0]} runs overlapped on the shared solver"
+        assert httpd.RequestHandlerClass.metrics.errors_total == 0
+    finally:
+        if httpd:
+            httpd.shutdown()
+        mock.shutdown()
+        os.remove(os.environ["VNPT_API_KEYS"])
+        for k, v in saved_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+        tmp.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server mode smoke test (uses scripts/mock_api.py).")
+    parser.add_argument("--input", default=os.path.join(PROJECT_ROOT, "public_test", "test.json"), help="Questions JSON")
+    parser.add_argument("--limit", type=int, default=5, help="Questions per /solve request")
+    parser.add_argument("--requests", type=int, default=2, help="Sequential /solve requests (first one is cold)")
+    parser.add_argument("--mock-port", type=int, default=5055)
+    parser.add_argument("--warm-up", action="store_true", help="Load Retriever/Reranker before serving")
+    parser.add_argument("--concurrent", action="store_true", help="Only run the concurrent /solve check")
+    args = parser.parse_args()
+    if args.concurrent:
+        test_concurrent_solve()
+        print("[Test] OK")
+        return
+
+    mock = start_mock_api(args.mock_port)
+    os.environ["VNPT_API_URL"] = f"http://127.0.0.1:{args.mock_port}"
+    os.environ["VNPT_API_KEYS"] = write_mock_keys()
+
+    from src.server import create_server
+    httpd = create_server(port=0, warm_up=args.warm_up)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{httpd.server_address[1]}"
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        questions = json.load(f)[:args.limit]
+
+    with urllib.request.urlopen(f"{base}/health") as r:
+        print(f"[Test] /health -> {json.loads(r.read())}")
+
+    for i in range(args.requests):
+        req = urllib.request.Request(f"{base}/solve", data=json.dumps(questions).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+        t0 = time.time()
+        first = None
+        lines = []
+        with urllib.request.urlopen(req) as r:
+            for raw in r:
+                if first is None:
+                    first = time.time() - t0
+                lines.append(json.loads(raw))
+        total = time.time() - t0
+        answers = [l for l in lines if not l.get("done")]
+        print(f"[Test] /solve #{i+1}: {len(answers)}/{len(questions)} answers, "
+              f"first result after {first:.2f}s, total {total:.2f}s, tail={lines[-1]}")
+        assert lines[-1].get("done") and len(answers) == len(questions), "Incomplete stream"
+
+    with urllib.request.urlopen(f"{base}/metrics") as r:
+        print("[Test] /metrics:\n" + r.read().decode("utf-8"))
+
+    httpd.shutdown()
+    mock.shutdown()
+    os.remove(os.environ["VNPT_API_KEYS"])
+    print("[Test] OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import sys
+import os
+import random
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.tokens import TokenCounter, HeuristicBackend
+
+
+def test_calibration_converges():
+    print("Testing calibration factor converges to the API's ratio...")
+    counter = TokenCounter(min_observations=3)
+    rng = random.Random(0)
+    assert counter.factor("small") == 1.0
+    for i in range(200):
+        raw = rng.uniform(200, 2000)
+        counter.observe("small", raw, int(raw * 1.3 * rng.uniform(0.95, 1.05)))
+        if i < 2:
+            assert counter.factor("small") == 1.0 # Not enough observations yet
+    print(f"Factors: {counter.stats()}")
+    assert abs(counter.factor("small") - 1.3) < 0.03
+    assert counter.factor("large") == 1.0 # Per model
+    assert counter.count("x" * 40, "small") == counter.raw("x" * 40) * counter.factor("small")
+
+    # The model's tokenizer changes: recent observations take over
+    for _ in range(150):
+        counter.observe("small", 1000, 800)
+    assert abs(counter.factor("small") - 0.8) < 0.01
+
+
+def test_calibration_clamped():
+    print("Testing calibration factor stays within [0.2, 5.0]...")
+    counter = TokenCounter(min_observations=1)
+    for _ in range(50):
+        counter.observe("huge", 10, 10000)
+        counter.observe("tiny", 10000, 10)
+    assert counter.factor("huge") == 5.0 and counter.factor("tiny") == 0.2
+
+    # Bad observations are ignored
+    counter.observe("tiny", 0, 100)
+    counter.observe("tiny", 100, 0)
+    counter.observe(None, 100, 100)
+    assert counter.factor("tiny") == 0.2 and None not in counter.stats()
+
+
+def test_calibration_persisted():
+    print("Testing calibration save / load (per backend)...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "token_calibration.json")
+        counter = TokenCounter(calibration_path=path, min_observations=1)
+        for _ in range(5):
+            counter.observe("small", 100, 150)
+        counter.save()
+        assert abs(TokenCounter(calibration_path=path).factor("small") - 1.5) < 1e-9
+
+        class OtherBackend(HeuristicBackend):
+            name = "other"
+        assert TokenCounter(OtherBackend(), calibration_path=path).factor("small") == 1.0 # Learned for another backend
+
+
+if __name__ == "__main__":
+    test_calibration_converges()
+    test_calibration_clamped()
+    test_calibration_persisted()
+    print("\nAll Tests Passed!")
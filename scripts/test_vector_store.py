@@ -0,0 +1,118 @@
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.vector_store import VectorStore
+
+
+class FakeCollection:
+    """In-memory stand-in for a ChromaDB collection (insertion-ordered get with limit/offset)."""
+    def __init__(self):
+        self.rows = {} # id -> (document, metadata, embedding)
+        self.fail_upserts = 0
+        self.get_calls = []
+
+    def upsert(self, embeddings, documents, metadatas, ids):
+        if self.fail_upserts:
+            self.fail_upserts -= 1
+            raise RuntimeError("simulated upsert failure")
+        for doc_id, doc, meta, emb in zip(ids, documents, metadatas, embeddings):
+            self.rows[doc_id] = (doc, meta, emb)
+
+    def get(self, ids=None, where=None, limit=None, offset=0, include=('documents', 'metadatas')):
+        self.get_calls.append((limit, offset))
+        keys = [k for k in self.rows if ids is None or k in set(ids)]
+        if where:
+            keys = [k for k in keys if all(self.rows[k][1].get(f) == v for f, v in where.items())]
+        keys = keys[offset or 0:]
+        if limit is not None:
+            keys = keys[:limit]
+        out = {"ids": keys}
+        if 'documents' in include:
+            out["documents"] = [self.rows[k][0] for k in keys]
+        if 'metadatas' in include:
+            out["metadatas"] = [self.rows[k][1] for k in keys]
+        return out
+
+    def delete(self, where=None, ids=None):
+        for k in self.get(ids=ids, where=where, include=[])["ids"]:
+            del self.rows[k]
+
+    def count(self):
+        return len(self.rows)
+
+
+class FakeVectorStore(VectorStore):
+    def _init_chroma(self):
+        self.client = None
+        self.collection = FakeCollection()
+
+
+def make_store(tmp, n_docs=0):
+    store = FakeVectorStore(persist_directory=tmp)
+    if n_docs:
+        texts = [f"Văn bản số {i}" for i in range(n_docs)]
+        store.add_batch(texts, [[float(i)] for i in range(n_docs)],
+                        [{"source": "a" if i % 3 else "b", "n": i} for i in range(n_docs)])
+    return store
+
+
+def test_iter_documents_pagination():
+    print("Testing iter_documents pagination across page boundaries...")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = make_store(tmp, 9)
+        expected = store.collection.get()
+
+        pages = list(store.iter_documents(batch_size=4))
+        print(f"Page sizes: {[len(ids) for _, _, ids in pages]}")
+        assert [len(ids) for _, _, ids in pages] == [4, 4, 1]
+        assert [i for _, _, ids in pages for i in ids] == expected["ids"] # Every document once, in order
+        assert [d for docs, _, _ in pages for d in docs] == expected["documents"]
+        assert [m for _, metas, _ in pages for m in metas] == expected["metadatas"]
+
+        # Exact multiple of the page size: one extra empty read ends the loop
+        store.collection.get_calls.clear()
+        pages = list(store.iter_documents(batch_size=3))
+        assert [len(ids) for _, _, ids in pages] == [3, 3, 3]
+        assert store.collection.get_calls == [(3, 0), (3, 3), (3, 6), (3, 9)]
+
+        # Fields not requested come back as None; filters paginate too
+        docs, metas, ids = next(store.iter_documents(batch_size=4, include=()))
+        assert docs is None and metas is None and len(ids) == 4
+        filtered = [i for _, _, ids in store.iter_documents(batch_size=2, where={"source": "b"}) for i in ids]
+        assert filtered == store.collection.get(where={"source": "b"})["ids"] and len(filtered) == 3
+
+        assert [i for ids in store.iter_ids(batch_size=4) for i in ids] == expected["ids"]
+        assert store.get_all_documents() == (expected["documents"], expected["metadatas"], expected["ids"])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        assert list(make_store(tmp).iter_documents(batch_size=4)) == []
+
+
+def test_failed_upsert_clears_pending_marker():
+    print("Testing a failed upsert does not leave the ledger marked stale...")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = make_store(tmp, 5)
+        digests = store.id_digests()
+        rebuilds = []
+        rebuild = store.rebuild_id_ledger
+        store.rebuild_id_ledger = lambda: (rebuilds.append(1), rebuild())
+
+        store.collection.fail_upserts = 1
+        try:
+            store.add_batch(["Văn bản mới"], [[0.5]])
+            raise AssertionError("expected the upsert error")
+        except RuntimeError:
+            pass
+        assert store.ledger.pending_writes(store._ledger_conn.cursor()) == 0
+        assert store.id_digests() == digests and not rebuilds # Ledger still trusted
+
+        # The retry goes through and is recorded
+        assert store.add_batch(["Văn bản mới"], [[0.5]]) == 1
+        assert store.ledger.total(store._ledger_conn.cursor()) == 6 and not rebuilds
+
+
+if __name__ == "__main__":
+    test_iter_documents_pagination()
+    test_failed_upsert_clears_pending_marker()
+    print("\nAll Tests Passed!")
@@ -1,9 +1,19 @@
 import json
 import os
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from tenacity import retry, stop_after_attempt, wait_exponential
 from .logger import setup_logger
-from .config import MAX_RETRIES
+from .concurrency import get_limiter
+from .config import (
+    MAX_RETRIES, LLM_CACHE_ENABLED, LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES,
+    RATE_LIMIT_EMBEDDING, RATE_LIMIT_INTERVAL_EMBEDDING, RATE_LIMIT_STATE_PATH,
+    QUOTA_TRACKER_PATH, QUOTA_FLUSH_INTERVAL
+)
+from .utils import RateLimiter, get_quota_tracker
+from .tracing import get_tracer, charge_wait
 
 logger = setup_logger(__name__)
 
@@ -12,7 +22,9 @@ class VNPTClient:
     Client for interacting with the VNPT AI Hackathon API.
     Handles authentication, request construction, and retries.
     """
-    def __init__(self, key_file_path='api_keys/api-keys.json'):
+    def __init__(self, key_file_path='api_keys/api-keys.json', use_cache=None):
+        # Allow override from Env Var (Mock Testing / Server deployments)
+        key_file_path = os.getenv('VNPT_API_KEYS', key_file_path)
         self.keys = self._load_keys(key_file_path)
         # [MODIFIED] Allow override from Env Var for Mock Testing
         self.api_root = os.getenv('VNPT_API_URL', "https://api.idg.vnpt.vn/data-service")
@@ -22,10 +34,45 @@ class VNPTClient:
         self.base_url = f"{self.api_root}/v1/chat/completions"
         self.embedding_url = f"{self.api_root}/vnptai-hackathon-embedding"
         self.request_count = 0
+        # Chat token usage reported by the server (cached_tokens: prompt prefix served from its cache)
+        self.usage = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+        self._usage_lock = threading.Lock()
+
+        # Keep-alive connection pool shared by all worker threads (avoids a TCP/TLS handshake per call)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Embedding quota is shared with the Indexer (same 'embedding' key in the shared state)
+        self.embedding_limiter = RateLimiter(RATE_LIMIT_EMBEDDING, RATE_LIMIT_INTERVAL_EMBEDDING,
+                                             name="embedding", state_path=RATE_LIMIT_STATE_PATH)
+        self.quota = get_quota_tracker(QUOTA_TRACKER_PATH, flush_interval=QUOTA_FLUSH_INTERVAL)
+
+        # Opt-in response cache for deterministic calls (temperature=0). Env VNPT_LLM_CACHE=1/0 overrides config.
+        if use_cache is None:
+            env = os.getenv('VNPT_LLM_CACHE')
+            use_cache = LLM_CACHE_ENABLED if env is None else env.lower() in ('1', 'true', 'yes')
+        self.cache = None
+        if use_cache:
+            from .llm_cache import ResponseCache
+            self.cache = ResponseCache(LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES)
+            logger.info(f"[API] LLM response cache enabled ({LLM_CACHE_PATH})")
 
     def get_request_count(self):
         return self.request_count
 
+    def get_usage_stats(self):
+        """Chat token totals from the API 'usage' fields, with the prefix-cache hit ratio."""
+        with self._usage_lock:
+            stats = dict(self.usage)
+        stats["prefix_hit_ratio"] = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+        return stats
+
+    def get_cache_stats(self):
+        """Hit/miss statistics of the response cache (None if disabled)."""
+        return self.cache.stats() if self.cache else None
+
     def _load_keys(self, key_file_path):
         try:
             with open(key_file_path, 'r') as f:
@@ -58,8 +105,14 @@ class VNPTClient:
         }
 
     @retry(stop=stop_after_attempt(MAX_RETRIES), wait=wait_exponential(multiplier=1, min=4, max=10))
-    def chat_completion(self, messages, model='vnptai_hackathon_small', temperature=0.1, max_tokens=512, top_p=1.0, top_k=50, n=1, response_format=None, logprobs=False, tools=None, tool_choice=None, seed=None):
-        self.request_count += 1
+    def chat_completion(self, messages, model='vnptai_hackathon_small', temperature=0.1, max_tokens=512, top_p=1.0, top_k=50, n=1, response_format=None, logprobs=False, tools=None, tool_choice=None, seed=None, use_cache=True, rate_limiter=None, rate_tokens=0):
+        """
+        Sends a chat completion request and returns the response 'message' dict.
+        Deterministic requests (temperature=0) are served from / stored in the response cache
+        when it is enabled. use_cache=False forces a fresh call (the new response replaces the cached one).
+        'rate_limiter' (RateLimiter) is charged one request and 'rate_tokens' only when the request
+        actually goes to the API, so cache hits never spend quota.
+        """
         if 'small' in model:
             key_type = 'small'
             endpoint = f"{self.base_url}/vnptai-hackathon-small"
@@ -89,12 +142,48 @@ class VNPTClient:
         if seed is not None:
             payload["seed"] = seed
 
+        cache_key = None
+        if self.cache and temperature == 0:
+            from .llm_cache import request_key
+            cache_key = request_key(payload)
+            if use_cache:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    get_tracer().annotate(cache_hit=True)
+                    return cached
+
+        # Admission waits are charged to the calling questions as 'queue', not 'llm'
+        if rate_limiter:
+            waited = rate_limiter.acquire(1, rate_tokens)
+            get_tracer().annotate(rate_wait_s=round(waited, 4))
+            charge_wait(waited)
+
+        self.request_count += 1
         logger.debug(f"  [API] Sending request to {endpoint} (timeout=100)...")
-        response = requests.post(endpoint, headers=headers, json=payload, timeout=100)
+        # Shared AIMD limit per endpoint: backs off on 429/5xx and honours Retry-After
+        t_queue = time.perf_counter()
+        with get_limiter(key_type).slot() as slot:
+            charge_wait(time.perf_counter() - t_queue)
+            response = self.session.post(endpoint, headers=headers, json=payload, timeout=100)
+            slot.record(response)
         logger.debug(f"  [API] Response received from {endpoint} (status={response.status_code}).")
         response.raise_for_status()
         
         data = response.json()
+        usage = data.get('usage') or {}
+        self.quota.add_usage(1, endpoint=key_type, model=model, tokens=usage.get('total_tokens', 0))
+        with self._usage_lock:
+            self.usage["prompt_tokens"] += usage.get('prompt_tokens') or 0
+            self.usage["completion_tokens"] += usage.get('completion_tokens') or 0
+            self.usage["cached_tokens"] += (usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0
+        # Attributes of the caller's 'llm_call' span (if any)
+        get_tracer().annotate(cache_hit=False, prompt_tokens=usage.get('prompt_tokens'), completion_tokens=usage.get('completion_tokens'),
+                              cached_tokens=(usage.get('prompt_tokens_details') or {}).get('cached_tokens'))
+        if usage.get('prompt_tokens'):
+            # Learn how far our token estimate is from the model's real tokenizer
+            from .tokens import get_token_counter
+            counter = get_token_counter()
+            counter.observe(model, counter.count_messages(messages, tools), usage['prompt_tokens'])
         if 'choices' not in data:
             logger.error(f"API Error Response: {data}")
             raise ValueError(f"API Error: Missing 'choices'. Response: {data}")
@@ -104,11 +193,15 @@ class VNPTClient:
         
         if logprobs and 'logprobs' in choice:
              message['logprobs'] = choice['logprobs']
+
+        if cache_key:
+            self.cache.put(cache_key, model, message)
              
         return message
 
     @retry(stop=stop_after_attempt(MAX_RETRIES), wait=wait_exponential(multiplier=1, min=4, max=10))
     def get_embedding(self, text):
+        self.embedding_limiter.wait_for_token()
         self.request_count += 1
         key_type = 'embedding'
         headers = self._get_headers(key_type)
@@ -120,9 +213,13 @@ class VNPTClient:
 
         # print(f"[API] Getting embedding... (Length: {len(text)})") # Debug Log
         try:
-            response = requests.post(self.embedding_url, headers=headers, json=payload, timeout=60) # Explicit timeout
+            with get_limiter(key_type).slot() as slot:
+                response = self.session.post(self.embedding_url, headers=headers, json=payload, timeout=60) # Explicit timeout
+                slot.record(response)
             response.raise_for_status()
-            return response.json()
+            data = response.json()
+            self.quota.add_usage(1, endpoint=key_type, model=payload["model"], tokens=(data.get('usage') or {}).get('total_tokens', 0))
+            return data
         except Exception as e:
             print(f"[API Error] Embedding failed: {e}")
             raise
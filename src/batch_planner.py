@@ -0,0 +1,141 @@
+import math
+import threading
+from collections import defaultdict
+
+from .text_utils import estimate_item_tokens
+
+
+def first_fit_decreasing(sizes: list, max_tokens: float, max_items: int = None) -> list:
+    """
+    Packs item sizes into bins of 'max_tokens' (and at most 'max_items' items).
+
+    Items are placed largest first, each into the first bin that still has room; an item
+    larger than a whole bin gets a bin of its own. "Largest" is the item's dominant share
+    of a bin (tokens / max_tokens vs 1 / max_items), so the item cap is packed for too.
+    The plain sequential layout is kept if it happens to need fewer bins.
+
+    Args:
+        sizes (list): Estimated tokens per item.
+        max_tokens (float): Token budget per bin.
+        max_items (int, optional): Item cap per bin.
+
+    Returns:
+        list: Bins as lists of indexes into 'sizes' (each bin in input order).
+    """
+    slot = 1.0 / max_items if max_items else 0.0
+    order = sorted(range(len(sizes)), key=lambda i: max(sizes[i] / max_tokens, slot), reverse=True)
+    bins = [] # [indexes, tokens]
+    for i in order:
+        for b in bins:
+            if b[1] + sizes[i] <= max_tokens and (not max_items or len(b[0]) < max_items):
+                b[0].append(i)
+                b[1] += sizes[i]
+                break
+        else:
+            bins.append([[i], sizes[i]])
+    sequential = sequential_fill(sizes, max_tokens, max_items)
+    if len(sequential) < len(bins):
+        return sequential
+    return [sorted(b[0]) for b in bins]
+
+
+def sequential_fill(sizes: list, max_tokens: float, max_items: int = None) -> list:
+    """The fill-until-full layout in data order (the builders' previous behaviour)."""
+    bins, current, tokens = [], [], 0
+    for i, t in enumerate(sizes):
+        if current and (tokens + t > max_tokens or (max_items and len(current) >= max_items)):
+            bins.append(current)
+            current, tokens = [], 0
+        current.append(i)
+        tokens += t
+    if current:
+        bins.append(current)
+    return bins
+
+
+class PackingStats:
+    """
+    Thread-safe accumulator of batch packing results.
+
+    - fill: estimated tokens / (batches x token budget), i.e. how full the calls are.
+    - lower_bound: batches needed if every group packed perfectly (per token and item caps).
+    - greedy: batches sequential_fill would have used for the same input (planner calls only).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = defaultdict(lambda: {"batches": 0, "items": 0, "tokens": 0.0, "capacity": 0.0,
+                                            "lower_bound": 0, "greedy": 0})
+
+    def record(self, stage, batches, items, tokens, capacity, lower_bound, greedy=None):
+        with self._lock:
+            s = self._stages[stage]
+            s["batches"] += batches
+            s["items"] += items
+            s["tokens"] += tokens
+            s["capacity"] += capacity
+            s["lower_bound"] += lower_bound
+            s["greedy"] += batches if greedy is None else greedy
+
+    def summary(self):
+        """{stage: {batches, items, fill, lower_bound, greedy}}"""
+        with self._lock:
+            return {
+                stage: {
+                    "batches": s["batches"],
+                    "items": s["items"],
+                    "fill": round(s["tokens"] / s["capacity"], 3) if s["capacity"] else 0.0,
+                    "lower_bound": s["lower_bound"],
+                    "greedy": s["greedy"]
+                }
+                for stage, s in self._stages.items()
+            }
+
+
+def clamped_tokens(sizes: list, max_tokens: float) -> float:
+    """Tokens counted towards fill: an item larger than a batch fills exactly one batch."""
+    return sum(min(t, max_tokens) for t in sizes)
+
+
+def min_batches(sizes: list, max_tokens: float, max_items: int = None) -> int:
+    """Lower bound on the number of batches for one group (token budget and item cap)."""
+    bound = math.ceil(clamped_tokens(sizes, max_tokens) / max_tokens) if max_tokens else 1
+    if max_items:
+        bound = max(bound, math.ceil(len(sizes) / max_items))
+    return max(bound, 1) if sizes else 0
+
+
+def plan_batches(items: list, max_tokens: float, max_items: int = None, model: str = None,
+                 group_key=lambda item: item.get('domain', 'K'), stats: PackingStats = None, stage: str = "batches") -> list:
+    """
+    Splits items into LLM call batches: one group per domain (batches stay domain-pure,
+    so _process_single_batch sends one request per batch), first-fit decreasing inside a group.
+
+    Args:
+        items (list): Prepared items ('_formatted_text').
+        max_tokens (float): Estimated prompt token budget per batch.
+        max_items (int, optional): Item cap per batch (BATCH_SIZE_*).
+        model (str, optional): Model the batches go to (token calibration).
+        group_key (callable): item -> group; items of different groups never share a batch.
+        stats (PackingStats, optional): Receives the packing result under 'stage'.
+        stage (str): Stats label.
+
+    Returns:
+        list: Batches (lists of items), grouped by key, items in input order within a batch.
+    """
+    groups = defaultdict(list)
+    for item in items:
+        groups[group_key(item)].append(item)
+
+    batches = []
+    tokens = lower = greedy = 0
+    for group in groups.values():
+        sizes = [estimate_item_tokens(item, model) for item in group]
+        for b in first_fit_decreasing(sizes, max_tokens, max_items):
+            batches.append([group[i] for i in b])
+        tokens += clamped_tokens(sizes, max_tokens)
+        lower += min_batches(sizes, max_tokens, max_items)
+        greedy += len(sequential_fill(sizes, max_tokens, max_items))
+
+    if stats is not None and items:
+        stats.record(stage, len(batches), len(items), tokens, len(batches) * max_tokens, lower, greedy)
+    return batches
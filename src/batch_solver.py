@@ -4,6 +4,7 @@ from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import re
 import os
+import threading
 
 from .api import VNPTClient
 from .data import DataLoader
@@ -15,17 +16,34 @@ from .config import (
     MAX_TOKENS_SMALL, TARGET_MAX_TOKENS_LARGE, MAX_RETRIES,
     MAX_WORKERS_RAG, MAX_WORKERS_INFERENCE, MAX_WORKERS_CALC, RETRY_BATCH_TOKENS,
     CLASSIFICATION_BATCH_SIZE, RATE_LIMIT_SMALL, RATE_LIMIT_LARGE, RATE_LIMIT_INTERVAL_CHAT,
-    MAX_OUTPUT_TOKENS_SMALL, MAX_OUTPUT_TOKENS_LARGE
+    RATE_LIMIT_TOKENS_SMALL, RATE_LIMIT_TOKENS_LARGE, RATE_LIMIT_STATE_PATH,
+    MAX_OUTPUT_TOKENS_SMALL, MAX_OUTPUT_TOKENS_LARGE, PIPELINE_MODE,
+    JOURNAL_FSYNC_EVERY, JOURNAL_FSYNC_INTERVAL,
+    DOMAIN_CACHE_PATH, DOMAIN_PRECLASSIFIER_ENABLED, DOMAIN_PRECLASSIFIER_THRESHOLD,
+    DOMAIN_PRECLASSIFIER_MIN_SAMPLES, DOMAIN_PRECLASSIFIER_MIN_ACCURACY, PYTHON_POOL_ENABLED,
+    DEDUP_ENABLED, DEDUP_NEAR_THRESHOLD, TRACE_EXPORT_PATH
 )
 from .logger import setup_logger
+from .journal import ResultJournal, journal_path_for, write_submission, input_digest, STATE_FIELDS
+from .domain_cache import DomainCache, DomainPreClassifier
+from .concurrency import limiter_stats, pool_size
+from .code_cache import get_code_cache
+from .tokens import get_token_counter
+from .tracing import get_tracer, charged, attach_timeline, timeline_by_domain
+from .batch_planner import plan_batches, PackingStats
+from .coalesce import DuplicateCoalescer
+from .pipeline import StreamingPipeline
 from .text_utils import (
-    estimate_tokens, parse_partial_json, parse_partial_computations, parse_partial_retrievals
+    estimate_tokens, estimate_item_tokens, parse_partial_json, parse_partial_computations, parse_partial_retrievals
 )
 from tenacity import RetryError
 from requests.exceptions import HTTPError
 
 logger = setup_logger(__name__)
 
+# Tracing spans in pipeline order (statistics output)
+SPAN_ORDER = ["question", "rag", "embedding", "vector", "bm25", "fusion", "rerank", "llm_call", "tool_exec", "finalize"]
+
 class BatchSolver:
     """
     Handles the batch processing of questions using a hybrid approach of RAG, 
@@ -42,16 +60,65 @@ class BatchSolver:
         """Initializes the BatchSolver with necessary components."""
         self.client = VNPTClient()
         self.data_loader = DataLoader()
-        try:
-            self.retriever = Retriever()
-        except Exception as e:
-            import traceback
-            logger.error(f"Could not initialize Retriever: {e}")
-            logger.error(traceback.format_exc())
-            self.retriever = None
+        # Retriever (ChromaDB + BM25 + Reranker) is built on first real use, so batches
+        # that never need RAG (e.g. pure reading comprehension) skip the startup cost.
+        self._retriever = None
+        self._retriever_failed = False
+        self._retriever_lock = threading.Lock()
             
-        self.limiter_small = RateLimiter(limit=RATE_LIMIT_SMALL, interval=RATE_LIMIT_INTERVAL_CHAT)
-        self.limiter_large = RateLimiter(limit=RATE_LIMIT_LARGE, interval=RATE_LIMIT_INTERVAL_CHAT)
+        # Sliding-window quotas (requests + estimated prompt tokens), shared with other processes
+        self.limiter_small = RateLimiter(limit=RATE_LIMIT_SMALL, interval=RATE_LIMIT_INTERVAL_CHAT, token_limit=RATE_LIMIT_TOKENS_SMALL,
+                                         name="small", state_path=RATE_LIMIT_STATE_PATH)
+        self.limiter_large = RateLimiter(limit=RATE_LIMIT_LARGE, interval=RATE_LIMIT_INTERVAL_CHAT, token_limit=RATE_LIMIT_TOKENS_LARGE,
+                                         name="large", state_path=RATE_LIMIT_STATE_PATH)
+
+        # Domain labels keyed by question text; a local classifier trained on them
+        # pre-labels confident questions so only the rest cost a large-model call.
+        self.domain_cache = DomainCache(DOMAIN_CACHE_PATH)
+        self.pre_classifier = None
+        self._pre_classifier_size = -1
+        self._pre_classifier_lock = threading.Lock()
+        self._pre_classifier_thread = None
+        self.schedule_pre_classifier_refresh()
+        self.domain_sources = {"cache": 0, "heuristic": 0, "local": 0, "llm": 0}
+        self.packing_stats = PackingStats()
+        self.dedup_stats = None
+        self.latency_by_domain = {} # domain -> per-question latency distribution of the last run
+        self._domain_stats_lock = threading.Lock()
+
+    @property
+    def retriever(self):
+        """Lazily initialized Retriever (None if initialization failed)."""
+        if self._retriever is None and not self._retriever_failed:
+            with self._retriever_lock:
+                if self._retriever is None and not self._retriever_failed:
+                    try:
+                        self._retriever = Retriever()
+                    except Exception as e:
+                        import traceback
+                        logger.error(f"Could not initialize Retriever: {e}")
+                        logger.error(traceback.format_exc())
+                        self._retriever_failed = True
+        return self._retriever
+
+    def warm_up(self):
+        """
+        Eagerly loads the Retriever, Reranker and the execute_python worker pool (used by
+        server mode so the first request does not pay the model/index loading cost).
+        """
+        retriever = self.retriever
+        if retriever and hasattr(retriever, '_ensure_reranker_loaded'):
+            try:
+                retriever._ensure_reranker_loaded()
+            except Exception as e:
+                logger.warning(f"Reranker warm-up failed: {e}")
+        if PYTHON_POOL_ENABLED:
+            try:
+                from .sandbox import get_python_pool
+                get_python_pool().warm_up()
+            except Exception as e:
+                logger.warning(f"Python worker pool warm-up failed: {e}")
+        return retriever is not None
 
     def prepare_item(self, item: dict) -> dict:
         """
@@ -63,6 +130,10 @@ class BatchSolver:
         Returns:
             dict: The processed item with an added '_formatted_text' field containing the prompt snippet.
         """
+        # [RESUME] Context restored from the journal: skip RAG
+        if item.get('_formatted_text'):
+            return item
+
         qid = item.get('id') or item.get('qid')
         q_text = item['question']
         choices = item.get('choices', [])
@@ -81,7 +152,8 @@ class BatchSolver:
             item['use_large_model'] = False
             if self.retriever:
                 try:
-                    relevant_docs = self.retriever.search(q_text, k=5)
+                    with get_tracer().span("rag", trace_id=qid, source="prepare"), charged([item], "rag"):
+                        relevant_docs = self.retriever.search(q_text, k=5)
                     if relevant_docs:
                          doc_str = "\n".join([f"- {d['text']}" for d in relevant_docs])
                          context_text = f"[Tài liệu tham khảo]\n{doc_str}\n\n"
@@ -104,7 +176,7 @@ class BatchSolver:
         item['_formatted_text'] = item_text
         return item
 
-    def solve(self, input_path: str, output_path: str, limit: int = None, model_name: str = MODEL_SMALL):
+    def solve(self, input_path: str, output_path: str, limit: int = None, model_name: str = MODEL_SMALL, pipeline: str = None, resume: bool = False):
         """
         Main execution flow for solving a dataset.
 
@@ -113,6 +185,8 @@ class BatchSolver:
             output_path (str): Path where the output JSON will be saved.
             limit (int, optional): Maximum number of items to process (for testing).
             model_name (str): The default model to use (default: MODEL_SMALL).
+            pipeline (str, optional): 'streaming' or 'phased' (default: PIPELINE_MODE).
+            resume (bool): Continue the previous run from its journal instead of starting over.
         """
         data = self.data_loader.load_data(input_path)
         if not data:
@@ -121,13 +195,229 @@ class BatchSolver:
         
         if limit:
             data = data[:limit]
+
+        self.solve_items(data, output_path=output_path, model_name=model_name, pipeline=pipeline, resume=resume)
+
+        csv_path = output_path.replace('.json', '.csv')
+        logger.info(f"Saved submission to: {output_path} and {csv_path}")
             
+        # PRINT STATISTICS
+        inf_req = self.client.get_request_count()
+        rag_req = self._retriever.get_request_count() if self._retriever else 0
+        total_req = inf_req + rag_req
+        logger.info(f"\n[Statistics]\n- Inference Requests: {inf_req}\n- Embedding Requests: {rag_req}\n- Total Requests: {total_req}")
+        logger.info("- Domain Sources: " + ", ".join(f"{k}={v}" for k, v in self.domain_sources.items()))
+        for limiter in (self.limiter_small, self.limiter_large, self.client.embedding_limiter):
+            rl = limiter.stats()
+            if rl['acquired']:
+                logger.info(f"- Rate Limit [{rl['name']}]: {rl['acquired']} acquired, avg wait {rl['wait_avg_s']}s, "
+                            f"histogram {rl['wait_histogram']}")
+        if self.dedup_stats and self.dedup_stats['groups']:
+            ds = self.dedup_stats
+            copies = ds['exact'] + ds['near']
+            logger.info(f"- Duplicates: {copies} questions answered from {ds['groups']} representatives "
+                        f"({ds['exact']} exact, {ds['near']} near): saved {copies} RAG lookups and "
+                        f"~{-(-copies // BATCH_SIZE_SMALL)} inference calls")
+        for stage, ps in self.packing_stats.summary().items():
+            logger.info(f"- Batch Packing [{stage}]: {ps['items']} items in {ps['batches']} batches "
+                        f"(fill {ps['fill']:.1%}, lower bound {ps['lower_bound']}, sequential fill {ps['greedy']})")
+        calibration = get_token_counter().stats()
+        if calibration:
+            logger.info(f"- Token Calibration (API tokens / estimate): {calibration}")
+        code_cache = get_code_cache()
+        if code_cache:
+            cs = code_cache.stats()
+            if cs['hits'] or cs['misses'] or cs['bypassed']:
+                logger.info(f"- Code Cache: {cs['hits']} hits / {cs['misses']} misses, {cs['bypassed']} non-deterministic bypassed")
+        for endpoint, snap in limiter_stats().items():
+            logger.info(f"- Concurrency [{endpoint}]: limit {snap['limit']} (peak {snap['peak_limit']}), "
+                        f"{snap['overloads']} overloads, waited {snap['wait_time_s']}s")
+        usage = self.client.get_usage_stats()
+        if usage['prompt_tokens']:
+            logger.info(f"- Token Usage: {usage['prompt_tokens']} prompt ({usage['cached_tokens']} from server prefix cache, "
+                        f"{usage['prefix_hit_ratio']:.1%}), {usage['completion_tokens']} completion")
+        cache_stats = self.client.get_cache_stats()
+        if cache_stats:
+            logger.info(f"- LLM Cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses (hit rate {cache_stats['hit_rate']:.1%}, {cache_stats['entries']} entries)")
+        for domain, ls in self.latency_by_domain.items():
+            stages = ", ".join(f"{stage} {sec:.3f}s" for stage, sec in ls['stages'].items())
+            logger.info(f"- Latency [{domain}]: {ls['count']} questions, p50 {ls['p50']:.3f}s / p95 {ls['p95']:.3f}s / "
+                        f"p99 {ls['p99']:.3f}s (mean {ls['mean']:.3f}s: {stages})")
+        tracer = get_tracer()
+        trace = tracer.summary()
+        # Pipeline order first, anything else after
+        for name in sorted(trace, key=lambda n: (SPAN_ORDER.index(n) if n in SPAN_ORDER else len(SPAN_ORDER), n)):
+            ts = trace[name]
+            logger.info(f"- Span [{name}]: {ts['count']} x, p50 {ts['p50']:.3f}s / p95 {ts['p95']:.3f}s / p99 {ts['p99']:.3f}s "
+                        f"(max {ts['max']:.3f}s, total {ts['total_s']:.1f}s)")
+        tracer.export(TRACE_EXPORT_PATH)
+
+    def solve_items(self, data: list, output_path: str = None, model_name: str = MODEL_SMALL, on_result=None, pipeline: str = None, resume: bool = False) -> list:
+        """
+        Solves in-memory question items (test.json schema).
+
+        Args:
+            data (list): Question items with 'id'/'qid', 'question' and 'choices'.
+            output_path (str, optional): If set, results are journaled as they complete and the
+                                         submission (JSON & CSV) is written at the end.
+            model_name (str): The default model to use (default: MODEL_SMALL).
+            on_result (callable, optional): Called once per question with its result dict
+                                            as soon as the answer is final (used for streaming).
+            pipeline (str, optional): 'streaming' (per-question dataflow) or 'phased'
+                                      (strict global phases). Defaults to PIPELINE_MODE.
+            resume (bool): Reuse the journal next to output_path: finished items are skipped,
+                           unfinished ones re-enter at their last stage (prepared context,
+                           domain and pending tool outputs are restored).
+
+        Returns:
+            list: Final result dicts in input order.
+        """
         logger.info(f"Processing {len(data)} questions...")
 
+        # Answers are journaled as they complete (append-only); the submission files are
+        # materialized once at the end.
+        journal = None
+        finished = {}
+        if output_path:
+            journal_path = journal_path_for(output_path)
+            if resume:
+                finished = self._restore_from_journal(data, journal_path)
+            fresh = not (resume and os.path.exists(journal_path))
+            journal = ResultJournal(journal_path, fsync_every=JOURNAL_FSYNC_EVERY, fsync_interval=JOURNAL_FSYNC_INTERVAL, truncate=fresh)
+            if fresh:
+                journal.append_run(data)
+            logger.info(f"Journaling results to {journal.path}")
+
+        # Duplicates are answered from their representative (no RAG / classification / inference)
+        to_solve = data
+        coalescer = None
+        if DEDUP_ENABLED:
+            coalescer = DuplicateCoalescer(DEDUP_NEAR_THRESHOLD, split=self.data_loader.extract_context_and_question)
+            to_solve = coalescer.coalesce(data)
+            self.dedup_stats = ds = coalescer.stats
+            if coalescer.groups:
+                logger.info(f"[Dedup] {ds['exact'] + ds['near']} duplicate questions ({ds['exact']} exact, "
+                            f"{ds['near']} near) folded into {ds['groups']} representatives.")
+
+        # [TRACE] One root span per question (run start -> final answer) and the delivery itself
+        tracer = get_tracer()
+        t_run = tracer.now()
+        if tracer.enabled:
+            user_callback = on_result
+            def on_result(result):
+                if result.get('id') not in finished: # Answers restored by resume were not solved in this run
+                    tracer.record("question", t_run, trace_id=result.get('id'), domain=result.get('domain'),
+                                  duplicate_of=result.get('duplicate_of'))
+                if user_callback:
+                    with tracer.span("finalize", trace_id=result.get('id')):
+                        user_callback(result)
+
+        deliver = on_result
+        if coalescer and coalescer.groups:
+            def deliver(result):
+                copies = coalescer.expand(result)
+                if journal:
+                    journal.append_results([c for c in copies if c['id'] not in finished])
+                if on_result:
+                    for r in [result] + copies:
+                        on_result(r)
+
+        try:
+            if (pipeline or PIPELINE_MODE) == 'streaming':
+                results = StreamingPipeline(self, model_name=model_name, journal=journal, on_result=deliver).run(to_solve, finished=finished)
+            else:
+                todo = [item for item in to_solve if (item.get('id') or item.get('qid')) not in finished]
+                results = [finished[q] for q in (item.get('id') or item.get('qid') for item in to_solve) if q in finished]
+                if deliver:
+                    for r in results:
+                        deliver(r)
+                if todo:
+                    results += self._solve_items_phased(todo, journal, model_name, deliver)
+            if coalescer:
+                results += [finished.get(c['id'], c) for r in results for c in coalescer.expand(r)]
+        finally:
+            if journal:
+                journal.close()
+            self.domain_cache.save()
+            self.schedule_pre_classifier_refresh() # New labels feed the next run
+            code_cache = get_code_cache()
+            if code_cache:
+                code_cache.save()
+            get_token_counter().save()
+
+        order = {item.get('id') or item.get('qid'): idx for idx, item in enumerate(data)}
+        results = sorted(results, key=lambda r: order.get(r.get('id'), len(order)))
+        self.latency_by_domain = timeline_by_domain(results)
+        self._save_results(results, output_path)
+        return results
+
+    def _restore_from_journal(self, data: list, journal_path: str) -> dict:
+        """
+        Loads the previous run's journal for resume.
+        Restores per-item state (STATE_FIELDS) into 'data' in place and returns {qid: result}
+        for finished items. Nothing is restored if the journal belongs to another question set.
+        """
+        if not os.path.exists(journal_path):
+            logger.info(f"[Resume] No journal at {journal_path}. Starting a fresh run.")
+            return {}
+
+        state = ResultJournal.load_resume_state(journal_path)
+        if state['input_digest'] != input_digest(data):
+            logger.warning("[Resume] Journal belongs to a different question set. Starting a fresh run.")
+            os.remove(journal_path)
+            return {}
+
+        finished = {}
+        stages = {}
+        for item in data:
+            qid = item.get('id') or item.get('qid')
+            if qid in state['results']:
+                finished[qid] = state['results'][qid]
+            elif qid in state['states']:
+                st = state['states'][qid]
+                item.update({k: st[k] for k in STATE_FIELDS if k in st})
+                item['_resume_stage'] = st.get('stage')
+                stages[item['_resume_stage']] = stages.get(item['_resume_stage'], 0) + 1
+
+        fresh = len(data) - len(finished) - sum(stages.values())
+        logger.info(f"[Resume] {len(finished)} finished, " +
+                    ", ".join(f"{n} {stage}" for stage, n in sorted(stages.items())) +
+                    f"{', ' if stages else ''}{fresh} not started.")
+        return finished
+
+    def _solve_items_phased(self, data: list, journal, model_name: str, on_result=None) -> list:
+        """Legacy phased flow: all RAG + classification, then all inference, then calc pass, then retries."""
+        def record(results):
+            if journal:
+                journal.append_results(results)
+
+        valid_ids = {item.get('id') or item.get('qid') for item in data}
+        emitted_ids = set()
+
+        def emit(results, pending_items=()):
+            """Streams results that will not be revisited by a later pass."""
+            if not on_result:
+                return
+            pending_ids = {p.get('id') or p.get('qid') for p in pending_items}
+            for r in results:
+                qid = r.get('id')
+                if qid in valid_ids and qid not in pending_ids and qid not in emitted_ids:
+                    emitted_ids.add(qid)
+                    on_result(r)
+
         # 0. Preserve Original Order
         for idx, item in enumerate(data):
             item['_index'] = idx
 
+        # [RESUME] Items journaled as 'pending' already carry their tool outputs, domain and
+        # follow-up model: they go straight to the calculation pass.
+        resumed_pending = [item for item in data if item.get('_resume_stage') == 'pending'
+                           and item.get('domain') and item.get('_formatted_text')]
+        if resumed_pending:
+            resumed_ids = {item.get('id') or item.get('qid') for item in resumed_pending}
+            data = [item for item in data if (item.get('id') or item.get('qid')) not in resumed_ids]
+            logger.info(f"[Resume] {len(resumed_pending)} pending items go straight to the calculation pass.")
+
         # 1. Parallel Preparation (RAG) & Classification
         # We run these concurrently to maximize throughput.
         logger.info("1. Preparing Data & Running RAG + Classification (Parallel)...")
@@ -163,55 +453,33 @@ class BatchSolver:
             qid = item.get('id') or item.get('qid')
             item['domain'] = domain_map.get(qid, 'K') # Default K
             
+        if journal:
+            journal.append_states(prepared_data, 'prepared')
+
         # Sort by Domain
         prepared_data.sort(key=lambda x: x['domain'])
         logger.info("[Optimization] Sorted data by Domain to reduce API call fragmentation.")
 
         # 2. Batch Creation (Split by Model Type)
-        # We separate items based on whether they need the Large model (complex) or Small model (standard).
-        batches_small = []
-        batches_large = []
-        
-        current_batch_s = []
-        current_tokens_s = 0
-        
-        current_batch_l = []
-        current_tokens_l = 0
-
-        for item in prepared_data:
-            item_text = item['_formatted_text']
-            t = estimate_tokens(item_text)
-            
-            if item.get('use_large_model', False):
-                # Add to Large Batch
-                if (current_tokens_l + t > TARGET_MAX_TOKENS_LARGE) or (len(current_batch_l) >= BATCH_SIZE_LARGE):
-                    batches_large.append(current_batch_l)
-                    current_batch_l = []
-                    current_tokens_l = 0
-                current_batch_l.append(item)
-                current_tokens_l += t
-            else:
-                # Add to Small Batch
-                if (current_tokens_s + t > MAX_TOKENS_SMALL) or (len(current_batch_s) >= BATCH_SIZE_SMALL):
-                    batches_small.append(current_batch_s)
-                    current_batch_s = []
-                    current_tokens_s = 0
-                current_batch_s.append(item)
-                current_tokens_s += t
-            
-        if current_batch_s: batches_small.append(current_batch_s)
-        if current_batch_l: batches_large.append(current_batch_l)
+        # We separate items based on whether they need the Large model (complex) or Small model (standard),
+        # then bin-pack each domain (first-fit decreasing on estimated tokens).
+        batches_small = plan_batches([it for it in prepared_data if not it.get('use_large_model', False)],
+                                     MAX_TOKENS_SMALL, BATCH_SIZE_SMALL, model=model_name,
+                                     stats=self.packing_stats, stage="first_small")
+        batches_large = plan_batches([it for it in prepared_data if it.get('use_large_model', False)],
+                                     TARGET_MAX_TOKENS_LARGE, BATCH_SIZE_LARGE, model=MODEL_LARGE,
+                                     stats=self.packing_stats, stage="first_large")
 
         logger.info(f"Split into {len(batches_small)} Small Batches and {len(batches_large)} Large Batches.")
 
         all_results = []
-        global_pending_calc_items = []
+        global_pending_calc_items = list(resumed_pending)
 
         # 3. Parallel First Pass (Model Inference)
         # Execute batches in parallel. Thread pool size is kept moderate to respect rate limits.
         logger.info("2. Running First Pass (Inference)...")
         
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS_INFERENCE) as executor:
+        with ThreadPoolExecutor(max_workers=pool_size(MAX_WORKERS_INFERENCE)) as executor:
             # Prepare futures for BOTH models (Small and Large pipelines)
             future_to_batch = {}
             
@@ -229,8 +497,14 @@ class BatchSolver:
                 try:
                     results, pending = future.result() 
                     all_results.extend(results)
+                    record(results)
+                    emit(results, pending)
                     # Collect items that requested calculations for a second pass
+                    for p_item in pending:
+                        p_item['_followup_model'] = model_name # Journaled: a resumed run re-queues on the same model
                     global_pending_calc_items.extend(pending)
+                    if journal and pending:
+                        journal.append_states(pending, 'pending')
                 except Exception as e:
                     m_type, failed_batch = future_to_batch[future]
                     logger.error(f"[{m_type}] Batch FATAL Error: {e}")
@@ -238,55 +512,42 @@ class BatchSolver:
                     # FALLBACK: Fill missing items with Default 'A' to prevent submission gaps
                     for fb_item in failed_batch:
                          qid = fb_item.get('id') or fb_item.get('qid')
-                         all_results.append({
+                         all_results.append(attach_timeline({
                              "id": qid,
                              "answer": "A",
                              "confidence": 0,
                              "reasoning": f"System Error Fallback: {str(e)}",
                              "domain": fb_item.get('domain', 'K')
-                         })
+                         }, fb_item))
                     logger.warning(f"  [Fallback] Added {len(failed_batch)} default answers for failed batch.")
-
-                  # INCREMENTAL SAVE (CRITICAL)
-                if len(all_results) % 10 == 0: # Save every 10 items (or every batch)
-                    self._save_results(all_results, output_path)
+                    record(all_results[-len(failed_batch):])
 
         # 4. Consolidated Second Pass (Calculations)
         # Items that needed calculation (via tool call) are re-batched and processed.
         if global_pending_calc_items:
             logger.info(f"\n3. Running Second Pass (Calculations) for {len(global_pending_calc_items)} items...")
             
-            # Optimization: Sort by Domain again to ensure pure batches
-            global_pending_calc_items.sort(key=lambda x: x.get('domain', 'K'))
-
-            # Re-batch the pending items
+            # Re-batch the pending items (domain-pure, bin-packed) per follow-up model
+            # (resumed items keep the model of the pass that asked for the tool)
             calc_batches = []
-            c_batch = []
-            c_tok = 0
-            
-            for item in global_pending_calc_items:
-                t = estimate_tokens(item['_formatted_text'])
-                if c_tok + t > MAX_TOKENS_SMALL:
-                    calc_batches.append(c_batch)
-                    c_batch = []
-                    c_tok = 0
-                c_batch.append(item)
-                c_tok += t
-            if c_batch: calc_batches.append(c_batch)
+            calc_models = {item.get('_followup_model') or model_name for item in global_pending_calc_items}
+            for calc_model in sorted(calc_models):
+                group = [item for item in global_pending_calc_items if (item.get('_followup_model') or model_name) == calc_model]
+                calc_batches += [(calc_model, b) for b in plan_batches(group, MAX_TOKENS_SMALL, model=calc_model,
+                                                                      stats=self.packing_stats, stage="calc")]
             
             logger.info(f"   grouped into {len(calc_batches)} large batches for efficiency.")
             
-            with ThreadPoolExecutor(max_workers=MAX_WORKERS_CALC) as executor:
+            with ThreadPoolExecutor(max_workers=pool_size(MAX_WORKERS_CALC)) as executor:
                 # Use retry_count=1 to prevent infinite retrieval loops (quota exhausted)
-                future_to_cbatch = {executor.submit(self._process_single_batch, b, model_name, retry_count=1): b for b in calc_batches}
+                future_to_cbatch = {executor.submit(self._process_single_batch, b, calc_model, retry_count=1): b for calc_model, b in calc_batches}
                 
                 for future in tqdm(as_completed(future_to_cbatch), total=len(calc_batches), desc="[Small Model] Calc Pass"):
                     try:
                         res, _ = future.result() # Ignore further pending items from this pass
                         all_results.extend(res) 
-                        
-                        # INCREMENTAL SAVE
-                        self._save_results(all_results, output_path)
+                        emit(res)
+                        record(res) # INCREMENTAL SAVE
                             
                     except Exception as e:
                         logger.error(f"Calc Batch Error: {e}")
@@ -303,6 +564,9 @@ class BatchSolver:
         # This acts as a fallback for API failures or missing responses.
         retry_loop_count = 0
         
+        # Resumed pending items are checked for missing answers like the rest
+        prepared_data.extend(resumed_pending)
+
         # Create map for finding items by ID
         item_map = {item.get('id') or item.get('qid'): item for item in prepared_data}
         
@@ -329,43 +593,27 @@ class BatchSolver:
             logger.info(f"\n4. [Retry Loop {retry_loop_count}/{MAX_RETRIES}] Found {len(items_to_retry)} items to retry.")
             logger.info(f"   Using Small Model ('{MODEL_SMALL}') for Retry...")
             
-            # Constant Batch Size for Retry
-            # Use constant from config
-            Target_Max_Tokens = RETRY_BATCH_TOKENS
-            
-            retry_batches = []
-            current_retry_batch = []
-            curr_tokens = 0
-            
-            for item in items_to_retry:
-                t_count = estimate_tokens(item.get('_formatted_text', ''))
-                if curr_tokens + t_count > Target_Max_Tokens:
-                    retry_batches.append(current_retry_batch)
-                    current_retry_batch = []
-                    curr_tokens = 0
-                current_retry_batch.append(item)
-                curr_tokens += t_count
-                
-            if current_retry_batch:
-                retry_batches.append(current_retry_batch)
+            # Constant Batch Size for Retry (RETRY_BATCH_TOKENS from config)
+            retry_batches = plan_batches(items_to_retry, RETRY_BATCH_TOKENS, model=MODEL_SMALL,
+                                         stats=self.packing_stats, stage="retry")
             
             # Run Retry Batches
             large_results = []
             retry_pending_calc = [] # Collect pending calcs from retry
 
-            with ThreadPoolExecutor(max_workers=MAX_WORKERS_CALC) as executor: 
-                f_map = {executor.submit(self._process_single_batch, b, MODEL_SMALL, retry_count=0): b for b in retry_batches}
+            with ThreadPoolExecutor(max_workers=pool_size(MAX_WORKERS_CALC)) as executor: 
+                f_map = {executor.submit(self._process_single_batch, b, MODEL_SMALL, retry_count=0, use_cache=False): b for b in retry_batches}
                 for f in tqdm(as_completed(f_map), total=len(retry_batches), desc=f"[Retry {retry_loop_count}] Processing"):
                      try:
                         res, pending = f.result()
                         large_results.extend(res)
+                        for p_item in pending:
+                            p_item['_followup_model'] = MODEL_LARGE
                         retry_pending_calc.extend(pending)
-                        
-                        # INCREMENTAL SAVE (RETRY ANSWERING)
-                        temp_map = {r['id']: r for r in all_results}
-                        for lr in large_results:
-                            temp_map[lr['id']] = lr 
-                        self._save_results(list(temp_map.values()), output_path)
+                        if journal and pending:
+                            journal.append_states(pending, 'pending')
+                        emit(res, pending)
+                        record(res) # INCREMENTAL SAVE (RETRY ANSWERING)
                         
                      except Exception as e:
                          logger.error(f"Retry Batch Error: {e}")
@@ -375,34 +623,18 @@ class BatchSolver:
                 logger.info(f"   [Retry] Handling {len(retry_pending_calc)} pending calculations...")
                 
                 # Re-batch for calc
-                calc_batches = []
-                c_batch = []
-                c_tok = 0
+                calc_batches = plan_batches(retry_pending_calc, MAX_TOKENS_SMALL, model=MODEL_LARGE,
+                                            stats=self.packing_stats, stage="retry_calc")
                 
-                for item in retry_pending_calc:
-                    t = estimate_tokens(item['_formatted_text'])
-                    if c_tok + t > MAX_TOKENS_SMALL:
-                         calc_batches.append(c_batch)
-                         c_batch = []
-                         c_tok = 0
-                    c_batch.append(item)
-                    c_tok += t
-                if c_batch: calc_batches.append(c_batch)
-                
-                with ThreadPoolExecutor(max_workers=MAX_WORKERS_CALC) as executor:
+                with ThreadPoolExecutor(max_workers=pool_size(MAX_WORKERS_CALC)) as executor:
                     f_map = {executor.submit(self._process_single_batch, b, MODEL_LARGE, retry_count=1): b for b in calc_batches}
                     for f in tqdm(as_completed(f_map), total=len(calc_batches), desc=f"[Retry {retry_loop_count}] Calc Pass"):
                         try:
                             res, _ = f.result()
                             large_results.extend(res)
+                            emit(res)
                             
-                            # INCREMENTAL SAVE (RETRY LOOP)
-                            # Update all_results with new large_results before saving
-                            temp_map = {r['id']: r for r in all_results}
-                            for lr in large_results:
-                                temp_map[lr['id']] = lr # Overwrite with newer result
-                            
-                            self._save_results(list(temp_map.values()), output_path)
+                            record(res) # INCREMENTAL SAVE (RETRY LOOP)
 
                         except Exception as e:
                             logger.error(f"Retry Calc Error: {e}")
@@ -426,58 +658,17 @@ class BatchSolver:
             all_results = updated_results
 
 
-        # 4. Save Output (JSON & CSV)
-        self._save_results(all_results, output_path)
-        csv_path = output_path.replace('.json', '.csv')
-        logger.info(f"Saved submission to: {output_path} and {csv_path}")
-
-            
-        # PRINT STATISTICS
-        inf_req = self.client.get_request_count()
-        rag_req = self.retriever.get_request_count() if self.retriever else 0
-        total_req = inf_req + rag_req
-        logger.info(f"\n[Statistics]\n- Inference Requests: {inf_req}\n- Embedding Requests: {rag_req}\n- Total Requests: {total_req}")
+        emit(all_results) # Anything not streamed yet (e.g. fallbacks)
 
+        order = {item.get('id') or item.get('qid'): item['_index'] for item in data}
+        return sorted(all_results, key=lambda r: order.get(r.get('id'), len(order)))
 
     def _save_results(self, all_results: list, output_path: str):
-        """Helper to save results in JSON and CSV formats, ensuring order."""
+        """Materializes the submission (JSON & CSVs) from the final, ordered results."""
+        if not output_path:
+            return
         try:
-            # Sort by original index to ensure "top-to-bottom" order
-            sorted_results = sorted(all_results, key=lambda x: x.get('_index', 999999))
-            
-            # 1. Save JSON
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(sorted_results, f, ensure_ascii=False, indent=2)
-
-            # 2. Save Standard CSV (qid, answer)
-            import csv
-            csv_path = output_path.replace('.json', '.csv')
-            with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(['qid', 'answer'])
-                for item in sorted_results:
-                    q_id = item.get('id') or item.get('qid')
-                    ans = item.get('answer', '')
-                    if q_id:
-                        writer.writerow([q_id, ans])
-
-            # 3. Save Time CSV (qid, answer, time)
-            time_csv_path = output_path.replace('submission.json', 'submission_time.csv')
-            if 'submission' not in time_csv_path:
-                 time_csv_path = output_path.replace('.json', '_time.csv')
-
-            with open(time_csv_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                # writer.writerow(['qid', 'answer', 'time']) # Header optional? Guidelines say YES.
-                # Re-reading guidelines: "qid,answer,time"
-                writer.writerow(['qid', 'answer', 'time'])
-                for item in sorted_results:
-                    q_id = item.get('id') or item.get('qid')
-                    ans = item.get('answer', '')
-                    t_infer = item.get('time', 0.0)
-                    if q_id:
-                        writer.writerow([q_id, ans, f"{t_infer:.4f}"])
-                        
+            write_submission([{k: v for k, v in r.items() if not k.startswith('_')} for r in all_results], output_path)
         except Exception as e:
             logger.error(f"  [Save Helper Error]: {e}")
 
@@ -532,20 +723,26 @@ class BatchSolver:
         # Retry Loop for Classification API
         for attempt in range(3):
             try:
-                # Use Large Model Limiter (or Small if changed)
-                if 'small' in MODEL_LARGE: self.limiter_small.wait_for_token()
-                else: self.limiter_large.wait_for_token()
+                # Use Large Model Limiter (or Small if changed); charged by the client on a cache miss only
+                prompt_tokens = estimate_tokens(classification_prompt, MODEL_LARGE)
+                rate_limiter = self.limiter_small if 'small' in MODEL_LARGE else self.limiter_large
 
                 try:
-                    response = self.client.chat_completion(
-                        messages=messages,
-                        model=MODEL_LARGE,
-                        temperature=0.0,
-                        seed=42,
-                        max_tokens=1000,
-                        tools=[tool_schema],
-                        tool_choice={"type": "function", "function": {"name": "submit_classification"}}
-                    )
+                    with get_tracer().span("llm_call", kind="classify", model=MODEL_LARGE, batch_size=len(batch),
+                                           qids=[item.get('id') or item.get('qid') for item in batch], attempt=attempt), \
+                         charged(batch, "classify"):
+                        response = self.client.chat_completion(
+                            messages=messages,
+                            model=MODEL_LARGE,
+                            temperature=0.0,
+                            seed=42,
+                            max_tokens=1000,
+                            tools=[tool_schema],
+                            tool_choice={"type": "function", "function": {"name": "submit_classification"}},
+                            use_cache=(attempt == 0), # Retries must reach the API (cached response may be the bad one)
+                            rate_limiter=rate_limiter,
+                            rate_tokens=prompt_tokens
+                        )
                 except ValueError as ve:
                     # Catch Content Safety Filter (400 Bad Request) during Classification
                     error_str = str(ve).lower()
@@ -555,6 +752,7 @@ class BatchSolver:
                         for item in batch:
                             qid = item.get('id') or item.get('qid')
                             fallback_map[qid] = 'S'
+                        # Not cached: only labels the model returned are persisted (and train the pre-classifier)
                         return fallback_map
                     else:
                         raise ve
@@ -573,6 +771,7 @@ class BatchSolver:
                                     dom = it.get('domain')
                                     if qId and dom:
                                         final_map[qId] = dom
+                                self.domain_cache.put_many(batch, final_map)
                                 return final_map
                             except json.JSONDecodeError as e:
                                 logger.error(f"Classification JSON Error: {e}")
@@ -612,6 +811,88 @@ class BatchSolver:
                          logger.error(f"  [Classification] Single item failed: {e}. Defaulting to 'K'.")
                          qid = batch[0].get('id') or batch[0].get('qid')
                          return {qid: 'K'}
+    def schedule_pre_classifier_refresh(self):
+        """
+        Retrains the local domain pre-classifier in a background thread if the domain cache
+        grew since the last fit. Called at startup and after each run; the current model
+        keeps serving until the new one is ready, so solving never waits on training.
+
+        Returns:
+            threading.Thread: The training thread, or None if nothing was started.
+        """
+        if not DOMAIN_PRECLASSIFIER_ENABLED:
+            return None
+        with self._pre_classifier_lock:
+            if self._pre_classifier_thread and self._pre_classifier_thread.is_alive():
+                return None
+            if len(self.domain_cache) == self._pre_classifier_size:
+                return None
+            self._pre_classifier_size = len(self.domain_cache)
+            self._pre_classifier_thread = threading.Thread(target=self._refresh_pre_classifier,
+                                                           name="pre-classifier", daemon=True)
+            self._pre_classifier_thread.start()
+            return self._pre_classifier_thread
+
+    def _refresh_pre_classifier(self):
+        """(Re)trains the local domain pre-classifier on the current domain cache."""
+        clf = DomainPreClassifier(threshold=DOMAIN_PRECLASSIFIER_THRESHOLD,
+                                  min_samples=DOMAIN_PRECLASSIFIER_MIN_SAMPLES,
+                                  min_accuracy=DOMAIN_PRECLASSIFIER_MIN_ACCURACY)
+        try:
+            usable = clf.fit(*self.domain_cache.training_data())
+        except Exception as e:
+            logger.error(f"   [PreClassifier] Training failed: {e}")
+            usable = False
+        self.pre_classifier = clf if usable else None
+
+    def _known_domains(self, items: list) -> tuple:
+        """
+        Resolves domains that do not need the LLM classifier.
+
+        Priority: domain already on the item (previous pass / resumed run) > domain cache
+        (question text hash) > reading comprehension heuristic > confident local pre-classifier.
+
+        Args:
+            items (list): Question items.
+
+        Returns:
+            tuple: ({qid: domain} for resolved items, [items that still need the LLM])
+        """
+        known = {}
+        rest = []
+        counts = {"cache": 0, "heuristic": 0, "local": 0, "llm": 0}
+        for item in items:
+            qid = item.get('id') or item.get('qid')
+            if item.get('domain'):
+                known[qid] = item['domain']
+                continue
+            cached = self.domain_cache.get(item)
+            if cached:
+                known[qid] = cached
+                counts["cache"] += 1
+            elif "đoạn thông tin" in str(item.get('question', '')).lower():
+                known[qid] = "RC"
+                counts["heuristic"] += 1
+            else:
+                rest.append(item)
+
+        if rest and self.pre_classifier:
+            try:
+                local = self.pre_classifier.predict(rest)
+            except Exception as e:
+                logger.error(f"   [PreClassifier] Prediction failed: {e}")
+                local = {}
+            if local:
+                known.update(local)
+                counts["local"] += len(local)
+                rest = [it for it in rest if (it.get('id') or it.get('qid')) not in local]
+        counts["llm"] = len(rest)
+
+        with self._domain_stats_lock:
+            for k, v in counts.items():
+                self.domain_sources[k] += v
+        return known, rest
+
     def _classify_dataset_parallel(self, data: list) -> dict:
         """
         Classifies the entire dataset in parallel batches.
@@ -622,41 +903,9 @@ class BatchSolver:
         Returns:
             dict: Global map {qid: domain}
         """
-        # 1. Filter items needing classification
-        # 1. Load Cache
-        cache_file = "domain_cache.json"
-        cached_map = {}
-        # DISABLE CACHE LOADING FOR SAFETY (Private test might reuse IDs with diff content)
-        # if os.path.exists(cache_file):
-        #     try:
-        #         with open(cache_file, "r", encoding="utf-8") as f:
-        #             cached_map = json.load(f)
-        #         logger.info(f"   [Classification] Loaded {len(cached_map)} cached domains from {cache_file}")
-        #     except Exception:
-        #         logger.warning("   [Classification] Could not read cache file.")
-        
-        logger.info("[Classification] Cache DISABLED to ensure fresh classification for Private Test.")
-        
-        items_to_classify = []
-        bypass_map = {} # qid -> domain
+        # 1. Resolve from cache / heuristics / local pre-classifier
+        bypass_map, items_to_classify = self._known_domains(data)
         
-        for item in data:
-            qid = item.get('id') or item.get('qid')
-            q_text_lower = str(item.get('question', '')).lower()
-            
-            # Priority 1: Check Manual Cache
-            if qid in cached_map:
-                bypass_map[qid] = cached_map[qid]
-                
-            # Priority 2: Heuristic (Reading Comp)
-            elif "đoạn thông tin" in q_text_lower:
-                bypass_map[qid] = "RC"
-                cached_map[qid] = "RC" # Auto-cache this too
-            
-            # Priority 3: API Process
-            else:
-                items_to_classify.append(item)
-                
         if not items_to_classify:
             return bypass_map
 
@@ -671,34 +920,22 @@ class BatchSolver:
         global_map = {}
         global_map.update(bypass_map)
         
-        new_updates = False
-        
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS_INFERENCE) as executor:
+        with ThreadPoolExecutor(max_workers=pool_size(MAX_WORKERS_INFERENCE)) as executor:
             future_to_batch = {executor.submit(self._classify_batch_domains, b): b for b in batches}
             
             for future in tqdm(as_completed(future_to_batch), total=len(batches), desc="Classifying", leave=False):
                 try:
                     res_map = future.result()
                     global_map.update(res_map)
-                    
-                    # Update cache in memory
-                    cached_map.update(res_map)
-                    new_updates = True
                 except Exception as e:
                     logger.error(f"Classification Batch Error: {e}")
 
-        # 4. Save Cache
-        if new_updates:
-            try:
-                with open(cache_file, "w", encoding="utf-8") as f:
-                    json.dump(cached_map, f, ensure_ascii=False, indent=2)
-                logger.info(f"   [Classification] Updated cache with {len(items_to_classify)} new items.")
-            except Exception as e:
-                logger.error(f"   [Classification] Failed to save cache: {e}")
+        # 4. Save Cache (labels were added by _classify_batch_domains)
+        self.domain_cache.save()
                     
         return global_map
 
-    def _process_single_batch(self, batch: list, model_name: str = MODEL_SMALL, retry_count: int = 0) -> tuple:
+    def _process_single_batch(self, batch: list, model_name: str = MODEL_SMALL, retry_count: int = 0, use_cache: bool = True) -> tuple:
         """
         Processes a single batch of questions:
         1. Classifies questions (if not already classified).
@@ -709,32 +946,15 @@ class BatchSolver:
             batch (list): The list of items to process.
             model_name (str): The model to use for inference.
             retry_count (int): The current retry intent (0 for first pass, 1 for calc pass).
+            use_cache (bool): Allow LLM response cache hits (False for retries of missing answers).
 
         Returns:
             tuple: (final_results, final_pending_items)
         """
-        import time
-        t_start = time.time()
-        
         # 1. Classify
         items_to_classify = []
-        bypass_map = {} # qid -> domain
-        
-        for item in batch:
-            qid = item.get('id') or item.get('qid')
-            
-            # Optimization: If domain already assigned (e.g. from previous pass), skip classification
-            if item.get('domain'):
-                bypass_map[qid] = item['domain']
-                continue
-
-            q_text_lower = str(item.get('question', '')).lower()
-            
-            # Heuristic: Check for "đoạn thông tin" -> Reading Comprehension
-            if "đoạn thông tin" in q_text_lower:
-                bypass_map[qid] = "RC"
-            else:
-                items_to_classify.append(item)
+        # Domain already assigned (e.g. from previous pass), cached, RC heuristic or confident local label
+        bypass_map, items_to_classify = self._known_domains(batch)
 
         domain_map = {}
         if items_to_classify:
@@ -766,23 +986,22 @@ class BatchSolver:
             domain_prompt_intro = DOMAIN_MAPPING.get(domain, PROMPT_GENERAL)
             logger.info(f"  [Solving] Domain: {domain} - Count: {len(sub_batch)}")
             
-            res, pending = self._solve_sub_batch(sub_batch, model_name, domain_prompt_intro, retry_count)
+            res, pending = self._solve_sub_batch(sub_batch, model_name, domain_prompt_intro, retry_count, use_cache=use_cache)
             final_results.extend(res)
             final_pending_items.extend(pending)
                 
         
-        # [TIMING] Record End Time and Assign to Items
-        t_end = time.time()
-        duration = t_end - t_start
-        # Amortize time across batch (If batch=1, it's exact)
-        avg_time = duration / max(len(final_results), 1) 
-        
-        for item in final_results:
-            item['time'] = avg_time
+        # [TIMING] Each answer carries its question's own timeline (RAG, classify/LLM share, tools),
+        # accumulated over all passes so far
+        by_id = {item.get('id') or item.get('qid'): item for item in batch}
+        for result in final_results:
+            item = by_id.get(result.get('id'))
+            if item is not None:
+                attach_timeline(result, item)
 
         return final_results, final_pending_items
 
-    def _solve_sub_batch(self, batch: list, model_name: str, system_prompt_intro: str, retry_count: int = 0) -> tuple:
+    def _solve_sub_batch(self, batch: list, model_name: str, system_prompt_intro: str, retry_count: int = 0, use_cache: bool = True) -> tuple:
         """
         Solves a specific sub-batch using the provided system_prompt_intro.
         Constructs the tool schema and manages the API call loop.
@@ -792,6 +1011,7 @@ class BatchSolver:
             model_name (str): Model to use.
             system_prompt_intro (str): The domain-specific system instruction.
             retry_count (int): 0 allows retrieval, >0 disables retrieval to prevent loops.
+            use_cache (bool): Allow LLM response cache hits on the first attempt.
 
         Returns:
             tuple: (answers, pending_items)
@@ -860,12 +1080,10 @@ class BatchSolver:
         }
 
         # Build Prompt
-        prompt = system_prompt_intro + "\n\n"
-        prompt += f"[HỆ THỐNG] Lượt tìm kiếm thông tin còn lại: {remaining_retrievals}\n"
-        if remaining_retrievals == 0:
-            prompt += "(Bạn ĐÃ HẾT lượt tìm kiếm. Vui lòng trả lời dựa trên thông tin hiện có.)\n"
-            
-        prompt += "\nDANH SÁCH CÂU HỎI:\n\n"
+        # [PREFIX CACHE] Invariant content first, byte-identical across batches of a domain:
+        # system message = domain prompt; the user message carries the questions and ends
+        # with the per-call retrieval budget (dynamic content last).
+        prompt = "DANH SÁCH CÂU HỎI:\n\n"
         
         # Map QIDs to Items for easy lookup
         item_map = {item.get('id') or item.get('qid'): item for item in batch}
@@ -873,36 +1091,46 @@ class BatchSolver:
         for item in batch:
             prompt += item.get('_formatted_text', '')
 
-        messages = [{"role": "user", "content": prompt}]
+        prompt += f"[HỆ THỐNG] Lượt tìm kiếm thông tin còn lại: {remaining_retrievals}\n"
+        if remaining_retrievals == 0:
+            prompt += "(Bạn ĐÃ HẾT lượt tìm kiếm. Vui lòng trả lời dựa trên thông tin hiện có.)\n"
+
+        messages = [
+            {"role": "system", "content": system_prompt_intro},
+            {"role": "user", "content": prompt}
+        ]
         
         # Retry loop for MALFORMED JSON
         local_max_retries = MAX_RETRIES
         for attempt in range(local_max_retries + 1):
             final_answers = [] # Initialize here to avoid UnboundLocalError
             try:
-                # Enforce Rate Limit before calling API based on Model Name
-                logger.debug(f"  [RateLimiter] Checking limit for {model_name}...")
-                if 'small' in model_name:
-                    self.limiter_small.wait_for_token()
-                else:
-                    self.limiter_large.wait_for_token()
-                logger.debug(f"  [RateLimiter] Token acquired for {model_name}.")
+                # Rate limit by model name; the client charges it only when the response cache misses
+                prompt_tokens = estimate_tokens(system_prompt_intro + prompt, model_name)
+                rate_limiter = self.limiter_small if 'small' in model_name else self.limiter_large
 
                 # Select Max Output Tokens based on model
                 # Note: imports are from .config which now handles the overrides
                 max_out = MAX_OUTPUT_TOKENS_SMALL if 'small' in model_name else MAX_OUTPUT_TOKENS_LARGE
 
                 try:
-                    response = self.client.chat_completion(
-                        messages=messages,
-                        model=model_name,
-                        temperature=0.0,
-                        seed=42,
-                        max_tokens=max_out,
-                        tools=[batch_tool],
-                        tool_choice={"type": "function", "function": {"name": "submit_batch_results"}},
-                        logprobs=True
-                    )
+                    # Each question is charged its prompt-token share of the batched call
+                    with get_tracer().span("llm_call", kind="solve", model=model_name, domain=batch[0].get('domain'), batch_size=len(batch),
+                                           qids=list(item_map), retry_count=retry_count, attempt=attempt), \
+                         charged(batch, "llm", [estimate_item_tokens(it, model_name) for it in batch]):
+                        response = self.client.chat_completion(
+                            messages=messages,
+                            model=model_name,
+                            temperature=0.0,
+                            seed=42,
+                            max_tokens=max_out,
+                            tools=[batch_tool],
+                            tool_choice={"type": "function", "function": {"name": "submit_batch_results"}},
+                            logprobs=True,
+                            use_cache=use_cache and attempt == 0, # Malformed-JSON retries refresh the cached entry
+                            rate_limiter=rate_limiter,
+                            rate_tokens=prompt_tokens
+                        )
                 except ValueError as ve:
                     # Catch Content Safety Filter (400 Bad Request)
                     error_str = str(ve).lower()
@@ -921,9 +1149,8 @@ class BatchSolver:
                          return fallback_results, []
                     
                     if "429" in error_str or "too many requests" in error_str:
-                        logger.warning(f"  [Quota Exceeded] 429 Error. Sleeping 60s to cool down...")
-                        import time
-                        time.sleep(60)
+                        # The client already reported the 429 to the endpoint limiter (shared cool-down)
+                        logger.warning(f"  [Quota Exceeded] 429 Error. Backing off via concurrency limiter...")
                         continue # Retry the loop
                         
                     else:
@@ -1008,13 +1235,14 @@ class BatchSolver:
                             py_codes = args.get('execute_python', [])
                             if py_codes and retry_count < 2:
                                 logger.info(f"  [Batch] Handling {len(py_codes)} python execution requests...")
-                                for pc in py_codes:
+                                # Execute all snippets of this response in parallel (sandboxed worker pool)
+                                with get_tracer().span("tool_exec", snippets=len(py_codes), qids=[pc.get('id') for pc in py_codes]), \
+                                     charged([item_map[pc.get('id')] for pc in py_codes if pc.get('id') in item_map], "tool"):
+                                    outputs = Executor.execute_many([pc.get('code') for pc in py_codes], timeout=5)
+                                for pc, output in zip(py_codes, outputs):
                                     qid = pc.get('id')
                                     code = pc.get('code')
                                     
-                                    # Execute Code using safe subprocess
-                                    output = Executor.execute(code, timeout=5)
-                                    
                                     if qid in item_map:
                                         item = item_map[qid]
                                         # Add result to context
@@ -1042,7 +1270,9 @@ class BatchSolver:
                                     
                                     if self.retriever and kws:
                                         try:
-                                            docs = self.retriever.search(kws, k=5)
+                                            with get_tracer().span("rag", trace_id=qid, source="tool"), \
+                                                 charged([item_map[qid]] if qid in item_map else [], "rag"):
+                                                docs = self.retriever.search(kws, k=5)
                                             doc_str = "\n".join([f"- {d['text']}" for d in docs])
                                             block = f"\n[THÔNG TIN BỔ SUNG TỪ '{kws}']:\n{doc_str}\n"
                                         except Exception as e:
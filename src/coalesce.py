@@ -0,0 +1,153 @@
+import re
+import unicodedata
+from collections import defaultdict
+
+# Groups duplicate questions inside one solve run (BatchSolver). Corpus-level near-duplicate
+# filtering for indexing lives in dedup.py.
+
+LABELS = ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J"]
+
+# Words, numbers (decimal separators kept) and the symbols that change a question's meaning
+_TOKEN = re.compile(r"\d+(?:[.,]\d+)*|\w+|[+\-*/=<>^√%≤≥≠×÷]")
+# Numbers and operators: texts that differ in any of them are never near duplicates
+_MATH_TOKEN = re.compile(r"\d+(?:[.,]\d+)*|[+\-*/=<>^√%≤≥≠×÷]")
+_CHOICE_PREFIX = re.compile(r"^\s*[A-Ja-j][.)]\s+") # "A. ", "b) " typed into the choice itself
+# Words that flip the expected answer ("đúng" vs "không đúng"): near duplicates must agree on them
+NEGATIONS = {"không", "sai", "chưa", "trừ", "ngoại", "not", "except", "false", "incorrect"}
+
+
+def normalize_text(text: str) -> str:
+    """
+    Case, Unicode form, punctuation and whitespace-insensitive form of a question or choice.
+    Operators, comparison signs and decimal points are kept ("5 - 3" != "5 + 3", "1.5" != "15").
+    """
+    text = unicodedata.normalize("NFC", text or "").lower()
+    return " ".join(_TOKEN.findall(text))
+
+
+def normalize_choice(choice) -> str:
+    return normalize_text(_CHOICE_PREFIX.sub("", str(choice)))
+
+
+def shingles(text: str, k: int = 5) -> set:
+    """Character k-grams of normalized text (word order and small edits change few of them)."""
+    if len(text) <= k:
+        return {text}
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _qid(item):
+    return item.get('id') or item.get('qid')
+
+
+class DuplicateCoalescer:
+    """
+    Groups questions that must have the same answer, so only one representative per group
+    is solved (RAG, classification and inference).
+
+    - Exact duplicates: same normalized question and the same set of normalized choices
+      (in any order).
+    - Near duplicates: same choice set, same numbers, operators and negation words, and character-shingle
+      Jaccard similarity >= 'threshold' (reworded punctuation, spacing, small typos) for both
+      the passage and the question stem when 'split' separates them.
+
+    The representative's answer letter is mapped back through the choice text, so copies
+    whose choices are permuted get their own label.
+
+    Args:
+        threshold (float): Minimum shingle Jaccard similarity for near duplicates (> 1 disables them).
+        split (callable, optional): question text -> (context, question) (reading comprehension).
+    """
+    def __init__(self, threshold=0.9, split=None):
+        self.threshold = threshold
+        self.split = split
+        self.groups = {} # representative qid -> (representative item, [copy items])
+        self.representatives = {} # copy qid -> representative qid
+        self.stats = {"questions": 0, "groups": 0, "exact": 0, "near": 0}
+
+    def coalesce(self, data: list) -> list:
+        """
+        Builds the duplicate groups and returns the items to solve (representatives and
+        unique questions, in input order).
+        """
+        exact = {} # (choice set, question) -> representative
+        buckets = defaultdict(list) # (choice set, numbers/operators, negation words) -> [[item, parts, shingles per part]]
+        unique = []
+        for item in data:
+            choices = tuple(sorted(normalize_choice(c) for c in item.get('choices', [])))
+            if len(set(choices)) != len(choices):
+                unique.append(item) # Repeated choice texts: labels cannot be remapped unambiguously
+                continue
+            question = normalize_text(item.get('question', ''))
+            rep, kind = exact.get((choices, question)), "exact"
+            if rep is None and self.threshold <= 1:
+                numbers, negations, parts = self._signature(item)
+                # "2 + 3" vs "2 + 4", "đúng" vs "không đúng": similar text, different answer
+                rep, kind = self._match(buckets[(choices, numbers, negations)], item, parts), "near"
+            if rep is None:
+                exact[(choices, question)] = item
+                unique.append(item)
+            else:
+                self.groups.setdefault(_qid(rep), (rep, []))[1].append(item)
+                self.representatives[_qid(item)] = _qid(rep)
+                self.stats[kind] += 1
+
+        self.stats["questions"] = len(data)
+        self.stats["groups"] = len(self.groups)
+        return unique
+
+    def _signature(self, item):
+        """(numbers and operators, negation words, normalized parts) of an item's question."""
+        text = item.get('question', '')
+        parts = [normalize_text(p) for p in (self.split(text) if self.split else (text,)) if p]
+        joined = " ".join(parts)
+        return tuple(_MATH_TOKEN.findall(joined)), frozenset(set(joined.split()) & NEGATIONS), parts
+
+    def _match(self, candidates, item, parts):
+        """Near-duplicate representative among same-signature candidates (else registers 'item')."""
+        shingled = None
+        for cand in candidates:
+            if len(cand[1]) != len(parts):
+                continue
+            # Shingles are built only once a text has something to be compared with
+            if cand[2] is None:
+                cand[2] = [shingles(p) for p in cand[1]]
+            if shingled is None:
+                shingled = [shingles(p) for p in parts]
+            if all(self._similar(a, b) for a, b in zip(shingled, cand[2])):
+                return cand[0]
+        candidates.append([item, parts, shingled])
+        return None
+
+    def _similar(self, a, b):
+        if min(len(a), len(b)) < self.threshold * max(len(a), len(b)):
+            return False # Jaccard is at most the size ratio
+        return jaccard(a, b) >= self.threshold
+
+    def expand(self, result: dict) -> list:
+        """Results for the copies of a representative's result (empty if it has none)."""
+        group = self.groups.get(result.get('id'))
+        if not group:
+            return []
+        rep, copies = group
+        return [self._remap(result, rep, copy) for copy in copies]
+
+    @staticmethod
+    def _remap(result, rep, copy):
+        answer = result.get('answer')
+        rep_choices = [normalize_choice(c) for c in rep.get('choices', [])]
+        copy_choices = [normalize_choice(c) for c in copy.get('choices', [])]
+        if answer in LABELS and LABELS.index(answer) < len(rep_choices):
+            answer = LABELS[copy_choices.index(rep_choices[LABELS.index(answer)])]
+        remapped = dict(result)
+        remapped.update({"id": _qid(copy), "answer": answer, "duplicate_of": result.get('id')})
+        if 'time' in result:
+            # The representative's work is its own: a copy is answered without any
+            remapped.update({"time": 0.0, "timeline": {"dedup": 0.0}})
+        return remapped
@@ -0,0 +1,149 @@
+import os
+import ast
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Imports / attributes whose results change between runs: such snippets are never memoized
+NONDETERMINISTIC_MODULES = {
+    "random", "secrets", "uuid", "time", "datetime", "calendar", "os", "sys", "subprocess",
+    "socket", "urllib", "requests", "http", "threading", "multiprocessing", "asyncio", "tempfile", "glob", "shutil"
+}
+NONDETERMINISTIC_ATTRS = {"random", "rand", "randn", "randint", "default_rng", "shuffle", "urandom", "now", "today", "perf_counter"}
+NONDETERMINISTIC_CALLS = {"open", "input", "id", "hash", "globals", "locals", "vars"}
+
+# Outputs that describe the run, not the code (never cached)
+TRANSIENT_OUTPUTS = ("Error: Execution timed out", "Error: Execution crashed", "System Error:")
+
+
+def code_key(code: str, timeout) -> tuple:
+    """
+    Returns (key, deterministic).
+
+    The key hashes the AST dump (formatting and comments do not matter) plus the timeout.
+    Code that does not parse is keyed by its stripped text (the SyntaxError is deterministic).
+    """
+    try:
+        tree = ast.parse(code or "")
+    except (SyntaxError, ValueError):
+        norm, deterministic = (code or "").strip(), True
+    else:
+        norm, deterministic = ast.dump(tree, annotate_fields=False), _is_deterministic(tree)
+    key = hashlib.sha256(f"{timeout}\x00{norm}".encode("utf-8")).hexdigest()
+    return key, deterministic
+
+
+def _is_deterministic(tree) -> bool:
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            if any(alias.name.split(".")[0] in NONDETERMINISTIC_MODULES for alias in node.names):
+                return False
+        elif isinstance(node, ast.ImportFrom):
+            module = (node.module or "").split(".")
+            if module[0] in NONDETERMINISTIC_MODULES or "random" in module:
+                return False
+        elif isinstance(node, ast.Attribute) and node.attr in NONDETERMINISTIC_ATTRS:
+            return False
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in NONDETERMINISTIC_CALLS:
+            return False
+        elif isinstance(node, ast.Name) and node.id == "__import__":
+            return False
+    return True
+
+
+class CodeResultCache:
+    """
+    Bounded LRU of execute_python outputs keyed by normalized code hash.
+
+    Args:
+        max_entries (int): LRU capacity.
+        path (str, optional): JSON file to load from / save to (None = memory only).
+    """
+    def __init__(self, max_entries=5000, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    for k, v in json.load(f).items():
+                        self._entries[k] = v
+                while len(self._entries) > max_entries:
+                    self._entries.popitem(last=False)
+            except Exception as e:
+                logger.warning(f"  [CodeCache] Could not read {path}: {e}")
+
+    def get(self, key):
+        with self._lock:
+            output = self._entries.get(key)
+            if output is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return output
+
+    def put(self, key, output):
+        if output is None or output.startswith(TRANSIENT_OUTPUTS):
+            return
+        with self._lock:
+            self._entries[key] = output
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def note_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def save(self):
+        """Writes the cache atomically if it changed (no-op without a path)."""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = dict(self._entries)
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"  [CodeCache] Failed to save {self.path}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "bypassed": self.bypassed, "entries": len(self._entries)}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_code_cache():
+    """Process-wide code result cache configured from config.py (None if disabled)."""
+    global _cache
+    from .config import CODE_CACHE_ENABLED, CODE_CACHE_MAX_ENTRIES, CODE_CACHE_PATH
+    if not CODE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                import atexit
+                _cache = CodeResultCache(max_entries=CODE_CACHE_MAX_ENTRIES, path=CODE_CACHE_PATH)
+                atexit.register(_cache.save)
+    return _cache
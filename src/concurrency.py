@@ -0,0 +1,241 @@
+import time
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+from requests.exceptions import Timeout, ConnectionError as RequestsConnectionError
+
+from .logger import setup_logger
+from .config import (
+    ADAPTIVE_CONCURRENCY, CONCURRENCY_MIN, CONCURRENCY_MAX, CONCURRENCY_BACKOFF,
+    CONCURRENCY_LATENCY_TOLERANCE, CONCURRENCY_RETRY_AFTER_DEFAULT, CONCURRENCY_RETRY_AFTER_MAX,
+    MAX_WORKERS_INFERENCE, MAX_WORKERS_CALC, MAX_WORKERS_RAG
+)
+
+logger = setup_logger(__name__)
+
+OVERLOAD_STATUS = {429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value):
+    """Retry-After header (delta seconds or HTTP date) -> seconds, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _Slot:
+    """Outcome of one request inside AdaptiveConcurrencyLimiter.slot()."""
+    def __init__(self):
+        self.overloaded = False
+        self.retry_after = None
+
+    def record(self, response):
+        """Inspects an HTTP response: 429/5xx count as overload, Retry-After is honoured."""
+        if response.status_code in OVERLOAD_STATUS:
+            self.overloaded = True
+            self.retry_after = parse_retry_after(response.headers.get('Retry-After'))
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on in-flight requests to one endpoint (shared by every thread that calls it).
+
+    - Additive increase: each healthy response adds 1/limit (~ +1 per round of requests)
+      while latency stays within 'latency_tolerance' x the observed baseline.
+    - Multiplicative decrease: 429/5xx/timeouts scale the limit by 'backoff'
+      (at most once per baseline latency, so one congestion event cuts once).
+    - Cool-down: new requests wait for Retry-After (or an exponential default when the
+      header is missing) instead of each worker sleeping on its own.
+
+    Args:
+        name (str): Endpoint name (logs / stats).
+        initial (int): Starting limit.
+        min_limit (int): Lower bound.
+        max_limit (int): Upper bound.
+        backoff (float): Multiplicative decrease factor.
+        latency_tolerance (float): Latency above tolerance x baseline stops growth.
+        default_retry_after (float): Cool-down when a 429 carries no Retry-After.
+        max_retry_after (float): Cap on any cool-down.
+    """
+    def __init__(self, name, initial, min_limit=1, max_limit=32, backoff=0.5, latency_tolerance=2.0,
+                 default_retry_after=5.0, max_retry_after=60.0):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.default_retry_after = default_retry_after
+        self.max_retry_after = max_retry_after
+
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.baseline_latency = None
+        self._last_decrease = 0.0
+        self._overload_streak = 0
+
+        self.successes = 0
+        self.overloads = 0
+        self.peak_limit = self.limit
+        self.wait_time = 0.0
+
+    def acquire(self):
+        """Blocks until a slot is free and no cool-down is active."""
+        t0 = time.time()
+        with self._cond:
+            while True:
+                now = time.time()
+                if now < self.blocked_until:
+                    self._cond.wait(self.blocked_until - now)
+                elif self.in_flight >= int(self.limit):
+                    self._cond.wait(1.0)
+                else:
+                    self.in_flight += 1
+                    self.wait_time += now - t0
+                    return
+
+    def release(self, latency=None, overloaded=False, retry_after=None):
+        with self._cond:
+            self.in_flight -= 1
+            now = time.time()
+            if overloaded:
+                self._on_overload_locked(now, retry_after)
+            elif latency is not None:
+                self._on_success_locked(latency)
+            self._cond.notify_all()
+
+    def on_overload(self, retry_after=None):
+        """Reports an overload seen outside slot() (e.g. a 429 surfaced as an error payload)."""
+        with self._cond:
+            self._on_overload_locked(time.time(), retry_after)
+            self._cond.notify_all()
+
+    def _on_success_locked(self, latency):
+        self.successes += 1
+        self._overload_streak = 0
+        if self.baseline_latency is None:
+            self.baseline_latency = latency
+        # Baseline follows improvements fast and degradations slowly
+        alpha = 0.3 if latency < self.baseline_latency else 0.02
+        self.baseline_latency += alpha * (latency - self.baseline_latency)
+        if latency <= self.latency_tolerance * self.baseline_latency and self.in_flight + 1 >= int(self.limit):
+            # Only grow when the current limit is actually used
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self.peak_limit = max(self.peak_limit, self.limit)
+
+    def _on_overload_locked(self, now, retry_after):
+        self.overloads += 1
+        self._overload_streak += 1
+        window = max(self.baseline_latency or 1.0, 1.0)
+        if now - self._last_decrease >= window:
+            old = self.limit
+            self.limit = max(float(self.min_limit), self.limit * self.backoff)
+            self._last_decrease = now
+            logger.warning(f"  [Concurrency] {self.name}: overload -> limit {old:.1f} -> {self.limit:.1f}")
+        if retry_after is None:
+            retry_after = self.default_retry_after * (2 ** min(self._overload_streak - 1, 4))
+        self.blocked_until = max(self.blocked_until, now + min(retry_after, self.max_retry_after))
+
+    @contextmanager
+    def slot(self):
+        """
+        Gates one request. Usage:
+            with limiter.slot() as slot:
+                response = session.post(...)
+                slot.record(response)
+        Timeouts / connection errors raised inside the block count as overload.
+        """
+        self.acquire()
+        outcome = _Slot()
+        t0 = time.time()
+        try:
+            yield outcome
+        except (Timeout, RequestsConnectionError):
+            outcome.overloaded = True
+            raise
+        finally:
+            self.release(latency=time.time() - t0, overloaded=outcome.overloaded, retry_after=outcome.retry_after)
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "limit": round(self.limit, 2),
+                "peak_limit": round(self.peak_limit, 2),
+                "in_flight": self.in_flight,
+                "successes": self.successes,
+                "overloads": self.overloads,
+                "baseline_latency_s": round(self.baseline_latency, 3) if self.baseline_latency else None,
+                "wait_time_s": round(self.wait_time, 3)
+            }
+
+
+class _NullLimiter:
+    """Stand-in when adaptive concurrency is disabled (worker pools alone bound concurrency)."""
+    @contextmanager
+    def slot(self):
+        yield _Slot()
+
+    def on_overload(self, retry_after=None):
+        pass
+
+    def snapshot(self):
+        return None
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+# Starting limits per endpoint: the widest fixed pool that used to call it (the calc / retry
+# passes ran MAX_WORKERS_CALC threads against both chat models)
+_INITIAL_LIMITS = {
+    "small": max(MAX_WORKERS_INFERENCE, MAX_WORKERS_CALC),
+    "large": max(MAX_WORKERS_INFERENCE, MAX_WORKERS_CALC),
+    "embedding": MAX_WORKERS_RAG
+}
+
+
+def get_limiter(endpoint, initial=None):
+    """
+    Process-wide limiter for an endpoint ('small', 'large', 'embedding').
+
+    Args:
+        endpoint (str): Endpoint name.
+        initial (int, optional): Starting limit if the limiter does not exist yet.
+    """
+    if not ADAPTIVE_CONCURRENCY:
+        return _NullLimiter()
+    with _limiters_lock:
+        if endpoint not in _limiters:
+            _limiters[endpoint] = AdaptiveConcurrencyLimiter(
+                endpoint, initial or _INITIAL_LIMITS.get(endpoint, CONCURRENCY_MIN),
+                min_limit=CONCURRENCY_MIN, max_limit=CONCURRENCY_MAX, backoff=CONCURRENCY_BACKOFF,
+                latency_tolerance=CONCURRENCY_LATENCY_TOLERANCE,
+                default_retry_after=CONCURRENCY_RETRY_AFTER_DEFAULT, max_retry_after=CONCURRENCY_RETRY_AFTER_MAX
+            )
+        return _limiters[endpoint]
+
+
+def limiter_stats():
+    """{endpoint: snapshot} of all limiters created so far."""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: lim.snapshot() for name, lim in limiters.items()}
+
+
+def pool_size(default):
+    """
+    Thread pool size for a phase whose requests are gated by the limiters. With adaptive
+    concurrency the pool is as wide as the limiter may grow (CONCURRENCY_MAX) and
+    limiter.slot() decides how many requests are in flight; otherwise the phase's own
+    worker setting applies.
+    """
+    return max(default, CONCURRENCY_MAX) if ADAPTIVE_CONCURRENCY else default
@@ -32,6 +32,41 @@ RATE_LIMIT_EMBEDDING = 500  # req/minute
 RATE_LIMIT_INTERVAL_CHAT = 3600 # 1 hour
 RATE_LIMIT_INTERVAL_EMBEDDING = 60 # 1 minute
 
+# Rate Limiter State (sliding-window GCRA; SQLite file shared by all processes, None = per process)
+RATE_LIMIT_STATE_PATH = os.path.join(BASE_DIR, "cache", "rate_limits.db")
+RATE_LIMIT_TOKENS_SMALL = None  # Estimated prompt tokens per chat interval (None = not limited)
+RATE_LIMIT_TOKENS_LARGE = None
+
+# Usage Accounting (per endpoint / model, flushed in the background)
+QUOTA_TRACKER_PATH = os.path.join(BASE_DIR, "cache", "quota_tracker.json")
+QUOTA_FLUSH_INTERVAL = 5.0  # Seconds
+
+# execute_python Sandbox (warm worker pool)
+PYTHON_POOL_ENABLED = True
+PYTHON_POOL_SIZE = 4
+PYTHON_POOL_MAX_JOBS = 50  # Jobs per worker before it is recycled
+PYTHON_POOL_MEMORY_MB = 2048  # RLIMIT_AS per worker
+PYTHON_POOL_PRELOAD = ("math", "cmath", "fractions", "decimal", "itertools", "statistics", "numpy", "sympy")
+
+# execute_python Result Cache (AST-normalized code hash; non-deterministic snippets bypass it)
+CODE_CACHE_ENABLED = True
+CODE_CACHE_MAX_ENTRIES = 5000
+CODE_CACHE_PATH = os.path.join(BASE_DIR, "cache", "code_results.json")  # None = memory only
+
+# Token Counting (batch packing). Heuristic counts unless a tokenizer is given; the
+# per-model scale is learned from API usage.prompt_tokens and persisted.
+TOKENIZER_PATH = None  # tokenizer.json path or Hugging Face name of the served model's tokenizer
+TOKEN_CALIBRATION_PATH = os.path.join(BASE_DIR, "cache", "token_calibration.json")
+
+# Duplicate Coalescing: repeated questions (same stem, choices in any order) are solved once
+DEDUP_ENABLED = True
+DEDUP_NEAR_THRESHOLD = 0.9  # Char-shingle Jaccard for near duplicates (> 1 = exact duplicates only)
+
+# Tracing: per-question spans (RAG -> embedding/vector/bm25/rerank -> LLM call -> tool exec -> finalize)
+TRACING_ENABLED = True
+TRACE_EXPORT_PATH = os.path.join(OUTPUT_DIR, "trace.jsonl")  # '.prom' = Prometheus text summary; None = log summary only
+TRACE_MAX_SPANS = 200000  # Spans kept for export (summaries cover all)
+
 # Retriever Settings
 RETRIEVER_K = 5
 RETRIEVER_FETCH_K = 50
@@ -44,5 +79,41 @@ MAX_WORKERS_INFERENCE = 4  # Reduced to fit Total 8
 MAX_WORKERS_CALC = 8     # Sequential pass can use full 8
 RETRY_BATCH_TOKENS = 18000  # Max tokens per batch for retry loops
 
+# Solve Pipeline
+# 'streaming': each question flows independently through prepare -> classify -> solve -> follow-up
+# 'phased': strict phases (all RAG, then all inference, then calc pass, then retries)
+# Default stays 'phased' until streaming has parity tests; opt in with --pipeline streaming
+PIPELINE_MODE = "phased"
+PIPELINE_BATCH_LINGER = 0.5 # Seconds a partial batch waits for more items of the same domain
+
+# Result Journal (append-only JSONL next to the submission, fsync batched)
+JOURNAL_FSYNC_EVERY = 50     # Max answers between two fsyncs
+JOURNAL_FSYNC_INTERVAL = 2.0 # Max seconds between two fsyncs
+
+# LLM Response Cache (opt-in; deterministic temperature=0 calls only; env VNPT_LLM_CACHE=1 enables)
+LLM_CACHE_ENABLED = False
+LLM_CACHE_PATH = os.path.join(BASE_DIR, "cache", "llm_cache.db")
+LLM_CACHE_TTL = 7 * 24 * 3600  # Seconds
+LLM_CACHE_MAX_ENTRIES = 50000
+
+# Domain Classification Cache (keyed by question text) + local pre-classifier
+DOMAIN_CACHE_PATH = os.path.join(BASE_DIR, "cache", "domain_cache.json")
+DOMAIN_PRECLASSIFIER_ENABLED = True
+DOMAIN_PRECLASSIFIER_THRESHOLD = 0.9  # Min probability to skip the LLM classifier
+DOMAIN_PRECLASSIFIER_MIN_SAMPLES = 200  # Cached labels needed before training
+DOMAIN_PRECLASSIFIER_MIN_ACCURACY = 0.95  # Held-out accuracy of confident predictions
+
+# Adaptive Concurrency (AIMD limit on in-flight requests per endpoint; MAX_WORKERS_* are the starting limits)
+ADAPTIVE_CONCURRENCY = True
+CONCURRENCY_MIN = 1
+CONCURRENCY_MAX = 32  # Ceiling per endpoint; gated pools are sized to this and the limiter sets the width
+CONCURRENCY_BACKOFF = 0.5  # Multiplicative decrease on 429/5xx/timeouts
+CONCURRENCY_LATENCY_TOLERANCE = 2.0  # No growth while latency > tolerance x baseline
+CONCURRENCY_RETRY_AFTER_DEFAULT = 5.0  # Cool-down (s) when a 429 has no Retry-After (doubles per repeat)
+CONCURRENCY_RETRY_AFTER_MAX = 60.0
+
 # GPU Safety
 MAX_GPU_WORKERS = 3 # Limit concurrent Reranker calls to avoid OOM
+
+def get_max_gpu_workers():
+    return MAX_GPU_WORKERS
@@ -0,0 +1,304 @@
+import os
+import re
+import zlib
+import json
+import pickle
+import hashlib
+import threading
+
+import numpy as np
+
+# Universal hashing modulo a Mersenne prime. Shingle hashes are 32-bit and the
+# coefficients stay below 2^31, so a*x+b never overflows uint64.
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+
+_WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+_NUMBER_PATTERN = re.compile(r'\d+(?:[.,/]\d+)*')
+
+
+def doc_id_for(text: str) -> str:
+    """Stable document ID (same scheme as VectorStore.add_batch)."""
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+class MinHashDeduplicator:
+    """
+    Near-duplicate chunk detector based on MinHash signatures and LSH banding.
+
+    The corpus contains the same laws crawled from several sources (VBPL, LuatVietnam, ...)
+    and overlapping wiki dumps. The first chunk seen in a cluster is kept as the canonical
+    chunk; later members are dropped before embedding and recorded as aliases
+    ('alias_sources' / 'alias_count') in the canonical chunk's metadata.
+
+    New canonicals stay provisional until confirm() reports them written to the DB: only
+    confirmed signatures are saved, and rollback() forgets a failed canonical and hands back
+    the duplicates it swallowed so one of them can be indexed instead.
+
+    Attributes:
+        threshold (float): Minimum estimated Jaccard similarity to treat two chunks as duplicates.
+        num_perm (int): Number of MinHash permutations (signature length).
+        bands (int): Number of LSH bands. num_perm must be divisible by bands.
+        shingle_size (int): Word n-gram size used for shingling.
+        min_words (int): Chunks shorter than this are only deduplicated on exact matches.
+        state_path (str): Optional pickle path to persist signatures/buckets across runs.
+    """
+
+    def __init__(self, threshold=0.85, num_perm=64, bands=8, shingle_size=5, min_words=40, state_path=None, seed=1):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be divisible by bands")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.min_words = min_words
+        self.state_path = state_path
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)
+
+        # doc_id -> (signature, numbers_key)
+        self._signatures = {}
+        # One dict per band: band_key -> [doc_id, ...]
+        self._buckets = [dict() for _ in range(bands)]
+        # canonical_id -> [alias_info, ...] for canonicals that were already written
+        self.pending_alias_updates = {}
+        # canonical_id -> [dropped duplicate docs] for canonicals not yet confirmed as written
+        self._provisional = {}
+
+        self._lock = threading.Lock()
+        self.stats = {"seen": 0, "kept": 0, "exact_dupes": 0, "near_dupes": 0}
+
+        if state_path and os.path.exists(state_path):
+            self.load()
+
+    # --- Signatures ---
+
+    def _words(self, text):
+        return _WORD_PATTERN.findall(text.lower())
+
+    def _shingle_hashes(self, words):
+        k = self.shingle_size
+        if len(words) <= k:
+            shingles = [" ".join(words)]
+        else:
+            shingles = {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+        return np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64)
+
+    def signature(self, text):
+        """Computes the MinHash signature (uint32 array of length num_perm) of a text."""
+        hv = self._shingle_hashes(self._words(text))
+        if hv.size == 0:
+            return np.zeros(self.num_perm, dtype=np.uint32)
+        phv = (np.outer(self._a, hv) + self._b[:, None]) % _MERSENNE_PRIME
+        return phv.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, sig):
+        keys = []
+        for band in range(self.bands):
+            chunk = sig[band * self.rows:(band + 1) * self.rows].tobytes()
+            keys.append(hashlib.blake2b(chunk, digest_size=8).digest())
+        return keys
+
+    @staticmethod
+    def _numbers_key(text):
+        # Legal articles that differ only in dates/amounts are NOT duplicates.
+        return hashlib.md5("|".join(sorted(set(_NUMBER_PATTERN.findall(text)))).encode('utf-8')).digest()
+
+    # --- Pipeline API ---
+
+    def filter(self, docs):
+        """
+        Removes exact and near-duplicate chunks from a list of docs.
+
+        Args:
+            docs (list): Items of the form {"text": str, "metadata": dict} (output of parse_file).
+
+        Returns:
+            list: The docs to embed. Canonical docs carry alias info in their metadata.
+        """
+        kept = []
+        kept_by_id = {}
+
+        with self._lock:
+            for doc in docs:
+                self.stats["seen"] += 1
+                text = doc['text']
+                doc_id = doc_id_for(text)
+
+                # 1. Exact duplicate
+                if doc_id in self._signatures:
+                    self.stats["exact_dupes"] += 1
+                    self._record_alias(doc_id, doc, kept_by_id)
+                    continue
+
+                sig = self.signature(text)
+                numbers_key = self._numbers_key(text)
+                band_keys = self._band_keys(sig)
+
+                # 2. Near duplicate (only for chunks long enough to be meaningful)
+                canonical_id = None
+                if len(self._words(text)) >= self.min_words:
+                    canonical_id = self._find_candidate(sig, numbers_key, band_keys)
+
+                if canonical_id:
+                    self.stats["near_dupes"] += 1
+                    self._record_alias(canonical_id, doc, kept_by_id)
+                    continue
+
+                # 3. New canonical chunk
+                self._signatures[doc_id] = (sig, numbers_key)
+                for band, key in enumerate(band_keys):
+                    self._buckets[band].setdefault(key, []).append(doc_id)
+                self._provisional[doc_id] = []
+
+                kept.append(doc)
+                kept_by_id[doc_id] = doc
+                self.stats["kept"] += 1
+
+        return kept
+
+    def _find_candidate(self, sig, numbers_key, band_keys):
+        checked = set()
+        for band, key in enumerate(band_keys):
+            for cand_id in self._buckets[band].get(key, ()):
+                if cand_id in checked:
+                    continue
+                checked.add(cand_id)
+                cand_sig, cand_numbers = self._signatures[cand_id]
+                if cand_numbers != numbers_key:
+                    continue
+                if float(np.mean(cand_sig == sig)) >= self.threshold:
+                    return cand_id
+        return None
+
+    def _record_alias(self, canonical_id, doc, kept_by_id):
+        if canonical_id in self._provisional:
+            self._provisional[canonical_id].append(doc) # Fallback if the canonical is never written
+        meta = doc.get('metadata') or {}
+        alias = {
+            "source": meta.get("source", "unknown"),
+            "source_file": meta.get("source_file", ""),
+            "title": meta.get("title", "")
+        }
+
+        if canonical_id in kept_by_id:
+            # Canonical is in this buffer: patch its metadata before embedding
+            canonical_meta = kept_by_id[canonical_id].setdefault('metadata', {})
+            if alias["source"] == canonical_meta.get("source") and alias["source_file"] == canonical_meta.get("source_file"):
+                return
+            merge_alias_metadata(canonical_meta, [alias])
+        else:
+            # Canonical already written to ChromaDB: patch later
+            self.pending_alias_updates.setdefault(canonical_id, []).append(alias)
+
+    def confirm(self, texts):
+        """Marks the canonicals of these texts as written (their signatures become persistent)."""
+        with self._lock:
+            for text in texts:
+                self._provisional.pop(doc_id_for(text), None)
+
+    def rollback(self, texts):
+        """
+        Forgets the signatures of canonicals that were never written (failed embedding or upsert).
+
+        Returns:
+            list: The duplicate docs dropped in favour of those canonicals, to be filtered again.
+        """
+        fallbacks = []
+        with self._lock:
+            for text in texts:
+                doc_id = doc_id_for(text)
+                if doc_id not in self._provisional:
+                    continue
+                fallbacks.extend(self._provisional.pop(doc_id))
+                sig, _ = self._signatures.pop(doc_id)
+                for band, key in enumerate(self._band_keys(sig)):
+                    bucket = self._buckets[band].get(key)
+                    if bucket and doc_id in bucket:
+                        bucket.remove(doc_id)
+                        if not bucket:
+                            del self._buckets[band][key]
+                self.pending_alias_updates.pop(doc_id, None)
+                self.stats["kept"] -= 1
+        return fallbacks
+
+    def pop_alias_updates(self):
+        """Returns and clears the alias updates for canonicals already stored in the DB."""
+        with self._lock:
+            updates = self.pending_alias_updates
+            self.pending_alias_updates = {}
+        return updates
+
+    def report(self):
+        s = self.stats
+        removed = s["exact_dupes"] + s["near_dupes"]
+        ratio = (removed / s["seen"] * 100) if s["seen"] else 0.0
+        return (f"[Dedup] Seen {s['seen']} chunks, kept {s['kept']}, "
+                f"removed {removed} ({s['exact_dupes']} exact, {s['near_dupes']} near) = {ratio:.1f}%")
+
+    # --- Persistence ---
+
+    def save(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            # Canonicals not (yet) confirmed as written must not filter their duplicates on the next run
+            pending = self._provisional
+            state = {
+                "params": (self.num_perm, self.bands, self.shingle_size),
+                "signatures": {k: v for k, v in self._signatures.items() if k not in pending},
+                "buckets": [{key: [d for d in ids if d not in pending] for key, ids in band.items()
+                             if any(d not in pending for d in ids)} for band in self._buckets]
+            }
+            tmp_path = self.state_path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.state_path)
+
+    def load(self):
+        try:
+            with open(self.state_path, 'rb') as f:
+                state = pickle.load(f)
+            if tuple(state.get("params", ())) != (self.num_perm, self.bands, self.shingle_size):
+                print(f"[Dedup] State {self.state_path} built with different parameters. Ignoring.")
+                return
+            self._signatures = state["signatures"]
+            self._buckets = state["buckets"]
+            print(f"[Dedup] Loaded {len(self._signatures)} signatures from {self.state_path}")
+        except Exception as e:
+            print(f"[Dedup] Could not load state {self.state_path}: {e}")
+
+    def reset(self):
+        """Drops all state (e.g. after documents were deleted from the index)."""
+        with self._lock:
+            self._signatures = {}
+            self._buckets = [dict() for _ in range(self.bands)]
+            self.pending_alias_updates = {}
+            self._provisional = {}
+        if self.state_path and os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+
+def merge_alias_metadata(metadata, aliases):
+    """
+    Merges alias records into a (ChromaDB-compatible, flat) metadata dict in place.
+    Aliases are stored as a JSON string since Chroma only accepts scalar metadata values.
+    """
+    try:
+        existing = json.loads(metadata.get("alias_sources", "[]"))
+    except (TypeError, ValueError):
+        existing = []
+
+    known = {(a.get("source"), a.get("source_file")) for a in existing}
+    for alias in aliases:
+        key = (alias.get("source"), alias.get("source_file"))
+        if key not in known:
+            known.add(key)
+            existing.append(alias)
+
+    metadata["alias_sources"] = json.dumps(existing, ensure_ascii=False)
+    metadata["alias_count"] = len(existing)
+    return metadata
@@ -0,0 +1,191 @@
+import os
+import re
+import json
+import hashlib
+import threading
+
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def question_key(item: dict) -> str:
+    """
+    Content key of a question (sha256 of the whitespace-normalized question text).
+    IDs are not used: the private test may reuse IDs with different content.
+    """
+    text = re.sub(r"\s+", " ", str(item.get('question', ''))).strip().lower()
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _feature_text(item: dict, max_chars: int = 1500) -> str:
+    """Question + choices, truncated (long reading passages add little signal)."""
+    choices = item.get('choices') or []
+    text = str(item.get('question', '')) + " " + " ".join(str(c) for c in choices)
+    return text[:max_chars]
+
+
+class DomainCache:
+    """
+    Persistent domain labels keyed by question content.
+
+    File format: {question_key: {"domain": code, "text": feature text}}. The text is kept
+    so the local pre-classifier can be trained from previously labeled questions.
+    Legacy {qid: domain} entries (old domain_cache.json) carry no text and are ignored.
+
+    Args:
+        path (str): JSON file path.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            self._entries = {k: v for k, v in raw.items() if isinstance(v, dict) and v.get('domain')}
+            logger.info(f"   [Classification] Loaded {len(self._entries)} cached domains from {self.path}")
+        except Exception as e:
+            logger.warning(f"   [Classification] Could not read cache file {self.path}: {e}")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, item: dict):
+        """Cached domain code for a question, or None."""
+        with self._lock:
+            entry = self._entries.get(question_key(item))
+            if entry:
+                self.hits += 1
+                return entry['domain']
+            self.misses += 1
+            return None
+
+    def put_many(self, items: list, domain_map: dict):
+        """Stores {qid: domain} labels for the given items."""
+        with self._lock:
+            for item in items:
+                qid = item.get('id') or item.get('qid')
+                domain = domain_map.get(qid)
+                if domain:
+                    self._entries[question_key(item)] = {"domain": domain, "text": _feature_text(item)}
+                    self._dirty = True
+
+    def training_data(self, exclude=("RC",)) -> tuple:
+        """Returns (keys, texts, labels) of cached entries."""
+        with self._lock:
+            rows = [(k, e['text'], e['domain']) for k, e in self._entries.items()
+                    if e.get('text') and e['domain'] not in exclude]
+        keys = [r[0] for r in rows]
+        texts = [r[1] for r in rows]
+        labels = [r[2] for r in rows]
+        return keys, texts, labels
+
+    def save(self):
+        """Writes the cache atomically (tmp file + rename) if it changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = dict(self._entries)
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            logger.info(f"   [Classification] Saved {len(snapshot)} cached domains to {self.path}")
+        except Exception as e:
+            logger.error(f"   [Classification] Failed to save cache: {e}")
+
+
+class DomainPreClassifier:
+    """
+    Cheap local domain classifier (word + char n-gram TF-IDF -> logistic regression)
+    trained from cached LLM labels. Only predictions above 'threshold' are used; the rest
+    still go to the LLM classifier.
+
+    Before use, confident-prediction accuracy is measured on a held-out slice (~20% of the
+    cache, split by key hash). If it is below 'min_accuracy' the classifier stays disabled.
+
+    Args:
+        threshold (float): Min class probability to accept a local label.
+        min_samples (int): Min cached labels required to train.
+        min_accuracy (float): Min held-out accuracy of confident predictions.
+    """
+    def __init__(self, threshold=0.9, min_samples=200, min_accuracy=0.95):
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.min_accuracy = min_accuracy
+        self.model = None
+        self.trained_on = 0
+
+    @staticmethod
+    def _build():
+        from sklearn.pipeline import make_pipeline, make_union
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        return make_pipeline(
+            make_union(
+                TfidfVectorizer(analyzer="word", ngram_range=(1, 2), min_df=1, sublinear_tf=True, max_features=50000),
+                TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 4), min_df=2, sublinear_tf=True, max_features=100000),
+            ),
+            LogisticRegression(C=5.0, max_iter=1000)
+        )
+
+    def fit(self, keys: list, texts: list, labels: list) -> bool:
+        """Trains on cached labels. Returns True if the classifier is usable."""
+        self.model = None
+        if len(texts) < self.min_samples or len(set(labels)) < 2:
+            logger.info(f"   [PreClassifier] Not enough cached labels to train ({len(texts)}/{self.min_samples}).")
+            return False
+        try:
+            import numpy as np
+            self._build() # Fail early if sklearn is missing
+        except ImportError:
+            logger.warning("   [PreClassifier] scikit-learn not installed. Local pre-classification disabled.")
+            return False
+
+        # Held-out check (deterministic split by key hash)
+        holdout = np.array([int(k[:2], 16) < 52 for k in keys]) # ~20%
+        train_labels = [l for l, h in zip(labels, holdout) if not h]
+        if holdout.any() and len(set(train_labels)) >= 2:
+            model = self._build()
+            model.fit([t for t, h in zip(texts, holdout) if not h], train_labels)
+            test_texts = [t for t, h in zip(texts, holdout) if h]
+            test_labels = np.array([l for l, h in zip(labels, holdout) if h])
+            probs = model.predict_proba(test_texts)
+            confident = probs.max(axis=1) >= self.threshold
+            preds = model.classes_[probs.argmax(axis=1)]
+            coverage = confident.mean()
+            accuracy = (preds[confident] == test_labels[confident]).mean() if confident.any() else 0.0
+            logger.info(f"   [PreClassifier] Held-out: coverage {coverage:.1%}, confident accuracy {accuracy:.1%} ({len(test_texts)} samples)")
+            if accuracy < self.min_accuracy:
+                logger.warning(f"   [PreClassifier] Accuracy below {self.min_accuracy:.0%}. Local pre-classification disabled.")
+                return False
+
+        self.model = self._build()
+        self.model.fit(texts, labels)
+        self.trained_on = len(texts)
+        logger.info(f"   [PreClassifier] Trained on {len(texts)} cached labels ({len(set(labels))} domains).")
+        return True
+
+    def predict(self, items: list) -> dict:
+        """Returns {qid: domain} for items predicted above the confidence threshold."""
+        if self.model is None or not items:
+            return {}
+        probs = self.model.predict_proba([_feature_text(it) for it in items])
+        out = {}
+        for item, p in zip(items, probs):
+            best = p.argmax()
+            if p[best] >= self.threshold:
+                out[item.get('id') or item.get('qid')] = str(self.model.classes_[best])
+        return out
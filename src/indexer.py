@@ -11,8 +11,12 @@ import requests
 from tqdm import tqdm
 from src.api import VNPTClient
 from src.vector_store import VectorStore
-from src.utils import QuotaTracker, RateLimiter
+from src.utils import get_quota_tracker
+from src.concurrency import get_limiter, pool_size, OVERLOAD_STATUS
+from src.config import QUOTA_TRACKER_PATH, QUOTA_FLUSH_INTERVAL
+from src.dedup import MinHashDeduplicator
 import re
+import queue
 import threading
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
@@ -540,22 +544,106 @@ def parse_file(filepath):
         
     return all_docs
 
+class ChromaWriter(threading.Thread):
+    """
+    Dedicated DB writer fed by a bounded queue.
+    Embedding threads hand over finished batches and go straight back to the network,
+    while this thread upserts into ChromaDB continuously in right-sized groups.
+    The bounded queue applies backpressure if the DB falls behind.
+    'on_written(texts)' is called after every successful upsert.
+    """
+    _STOP = object()
+
+    def __init__(self, vector_store, write_batch_size=1000, max_queue=64, flush_interval=2.0, max_attempts=5, on_written=None):
+        super().__init__(name="ChromaWriter", daemon=True)
+        self.vector_store = vector_store
+        self.on_written = on_written
+        self.write_batch_size = write_batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.queue = queue.Queue(maxsize=max_queue)
+
+        self.written = 0
+        self.write_time = 0.0
+        self.failed_batches = [] # Kept in memory (never silently dropped)
+
+    def submit(self, texts, embs, metas):
+        """Blocks if the queue is full (backpressure on embedding threads)."""
+        self.queue.put((texts, embs, metas))
+
+    def close(self):
+        """Flushes the remaining buffer and waits for the writer to finish."""
+        self.queue.put(self._STOP)
+        self.join()
+
+    def run(self):
+        buf_texts, buf_embs, buf_metas = [], [], []
+        last_flush = time.time()
+
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+
+            if item is self._STOP:
+                break
+
+            if item:
+                texts, embs, metas = item
+                buf_texts.extend(texts)
+                buf_embs.extend(embs)
+                buf_metas.extend(metas)
+
+            idle = (time.time() - last_flush) >= self.flush_interval
+            if len(buf_texts) >= self.write_batch_size or (buf_texts and idle):
+                self._write(buf_texts, buf_embs, buf_metas)
+                buf_texts, buf_embs, buf_metas = [], [], []
+                last_flush = time.time()
+
+        if buf_texts:
+            self._write(buf_texts, buf_embs, buf_metas)
+
+    def _write(self, texts, embs, metas):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                t0 = time.time()
+                self.written += self.vector_store.add_batch(texts, embs, metas)
+                self.write_time += time.time() - t0
+                if self.on_written:
+                    self.on_written(texts)
+                return
+            except Exception as e:
+                wait = min(2 ** attempt, 30)
+                print(f"[Writer] Upsert of {len(texts)} docs failed (Attempt {attempt}/{self.max_attempts}): {e}. Retrying in {wait}s...")
+                time.sleep(wait)
+
+        print(f"[Writer] Giving up on {len(texts)} docs after {self.max_attempts} attempts. Keeping batch for re-try.")
+        self.failed_batches.append((texts, embs, metas))
+
+    def retry_failed(self):
+        """Last attempt for batches that exhausted their retries."""
+        failed = self.failed_batches
+        self.failed_batches = []
+        for texts, embs, metas in failed:
+            self._write(texts, embs, metas)
+        return sum(len(b[0]) for b in self.failed_batches)
+
 class Indexer:
-    def __init__(self, data_dir="data"):
+    def __init__(self, data_dir="data", dedup=True, dedup_threshold=0.85, dedup_state=None):
         self.client = VNPTClient()
         self.vector_store = VectorStore()
         self.data_dir = data_dir
         self.chunker = RecursiveChunker(chunk_size=800, chunk_overlap=200)
-        self.quota_tracker = QuotaTracker()
+        self.quota_tracker = get_quota_tracker(QUOTA_TRACKER_PATH, flush_interval=QUOTA_FLUSH_INTERVAL)
+        # Near-duplicate elimination (same laws crawled from VBPL / LuatVietnam / wiki dumps)
+        self.deduplicator = MinHashDeduplicator(threshold=dedup_threshold, state_path=dedup_state) if dedup else None
 
 
 
-    def _process_batch(self, batch, batch_idx, rate_limiter, session=None):
+    def _process_batch(self, batch, batch_idx, rate_limiter, session=None, limiter=None, max_attempts=100):
         """Helper to process a single batch in a thread."""
         try:
-            # Wait for rate limit permission
-            rate_limiter.wait_for_token()
-
             batch_texts = [d['text'] for d in batch]
             batch_metas = [d['metadata'] for d in batch]
             
@@ -567,21 +655,34 @@ class Indexer:
                 "encoding_format": "float"
             }
             
-            # Send Request (Use Session if available)
-            if session:
-                response = session.post(endpoint, headers=headers, json=payload, timeout=60)
+            limiter = limiter or get_limiter('embedding')
+            for attempt in range(max_attempts):
+                # Wait for rate limit permission
+                rate_limiter.wait_for_token()
+
+                # Send Request (Use Session if available). The shared limiter cuts concurrency
+                # on 429/5xx and holds every thread until Retry-After has passed.
+                with limiter.slot() as slot:
+                    if session:
+                        response = session.post(endpoint, headers=headers, json=payload, timeout=60)
+                    else:
+                        response = requests.post(endpoint, headers=headers, json=payload, timeout=60)
+                    slot.record(response)
+
+                if response.status_code not in OVERLOAD_STATUS:
+                    break
+                if response.status_code == 429:
+                    print(f"\n[429] Too Many Requests (Batch {batch_idx}, attempt {attempt + 1}). Backing off...")
             else:
-                response = requests.post(endpoint, headers=headers, json=payload, timeout=60)
-            
-            if response.status_code == 429:
-                print(f"\n[CRITICAL] 429 Too Many Requests (Batch {batch_idx}).")
+                print(f"\n[CRITICAL] Batch {batch_idx} still overloaded after {max_attempts} attempts.")
                 return False
                 
             response.raise_for_status()
             data = response.json()
             
-            # Success
-            self.quota_tracker.add_usage(1)
+            # Success (in-memory counter; flushed in the background)
+            self.quota_tracker.add_usage(1, endpoint="embedding", model=payload["model"],
+                                         tokens=(data.get('usage') or {}).get('total_tokens', 0))
             
             # Sort embeddings by index to match input order
             embeddings_sorted = sorted(data['data'], key=lambda x: x['index'])
@@ -664,32 +765,51 @@ class Indexer:
         # 2 Setup Indexing Resources
         BATCH_SIZE = 20 # Target Batch Size
         MAX_WORKERS = max_workers
-        LIMIT_PER_MINUTE = 500 
         
-        rate_limiter = RateLimiter(LIMIT_PER_MINUTE)
+        # Same 'embedding' quota as the solver's Retriever, even when both run at once: the client's
+        # limiter (RATE_LIMIT_EMBEDDING / RATE_LIMIT_INTERVAL_EMBEDDING on the shared state)
+        rate_limiter = self.client.embedding_limiter
+        # In-flight embedding requests follow the server's capacity (starts at max_workers);
+        # the thread pool only bounds how far it may grow.
+        limiter = get_limiter('embedding', initial=max_workers)
+        EMBED_WORKERS = pool_size(MAX_WORKERS)
         
         # Initialize Session with Robust Retry Strategy
         from urllib3.util.retry import Retry
         session = requests.Session()
         
+        # 429/5xx are handled in _process_batch (via the limiter), not hidden inside urllib3
         retry_strategy = Retry(
             total=1000,
             backoff_factor=1,
-            status_forcelist=[401, 429, 500, 502, 503, 504],
+            status_forcelist=[401],
             allowed_methods=["POST"]
         )
         
         adapter = requests.adapters.HTTPAdapter(
-            pool_connections=MAX_WORKERS, 
-            pool_maxsize=MAX_WORKERS,
+            pool_connections=EMBED_WORKERS, 
+            pool_maxsize=EMBED_WORKERS,
             max_retries=retry_strategy
         )
         session.mount('https://', adapter)
         
+        # Dedicated writer: upserts continuously while embedding threads keep the network busy
+        # Dedup signatures only become persistent once their chunk is actually written
+        writer = ChromaWriter(self.vector_store, on_written=self.deduplicator.confirm if self.deduplicator else None)
+        writer.start()
+        retry_docs = [] # Duplicates whose canonical failed to embed: filtered and embedded again
+        t_start = time.time()
+
         # Helper to Flush Buffer
         def flush_buffer(docs_to_index):
             if not docs_to_index: return 0
             
+            # Drop near-duplicates BEFORE paying for embeddings
+            if self.deduplicator:
+                docs_to_index = self.deduplicator.filter(docs_to_index)
+                print(self.deduplicator.report())
+                if not docs_to_index: return 0
+
             print(f"\n[STREAM] Flushing buffer of {len(docs_to_index)} docs...")
             
             # Create batches
@@ -697,65 +817,99 @@ class Indexer:
             
             # Process Batches in Parallel
             processed_count = 0
-            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as executor:
                 # Submit all batches
-                futures = {executor.submit(self._process_batch, b, i, rate_limiter, session): i for i, b in enumerate(batches)}
-                
-                db_buffer_docs = []
-                db_buffer_embs = []
-                db_buffer_metas = []
+                futures = {executor.submit(self._process_batch, b, i, rate_limiter, session, limiter): i for i, b in enumerate(batches)}
                 
                 for future in tqdm(as_completed(futures), total=len(batches), desc="Indexing Stream"):
+                    result = None
                     try:
                         result = future.result()
                         if result:
-                            # Unpack result: (texts, embs, metas)
+                            # Unpack result: (texts, embs, metas) and hand over to the writer
                             texts, embs, metas = result
-                            db_buffer_docs.extend(texts)
-                            db_buffer_embs.extend(embs)
-                            db_buffer_metas.extend(metas)
+                            writer.submit(texts, embs, metas)
                             processed_count += len(texts)
                     except Exception as ex:
                         print(f"Batch Error: {ex}")
-                
-                # Write to DB if data
-                if db_buffer_docs:
-                    print(f"Writing {len(db_buffer_docs)} vetted docs to ChromaDB...")
-                    self.vector_store.add_batch(db_buffer_docs, db_buffer_embs, db_buffer_metas)
-            
+                    if not result and self.deduplicator:
+                        retry_docs.extend(self.deduplicator.rollback([d['text'] for d in batches[futures[future]]]))
+
+            if retry_docs:
+                print(f"[Dedup] {len(retry_docs)} duplicates of failed chunks queued for the next flush.")
             return processed_count
 
-        # 3. Main Streaming Loop
-        print(f"Streaming {len(files_to_process)} files with {max_workers} threads...")
+        # The writer is always drained, even if parsing or embedding raises: queued batches are
+        # already paid for and would die with the daemon thread
+        try:
+            # 3. Main Streaming Loop
+            print(f"Streaming {len(files_to_process)} files with {max_workers} threads...")
         
-        # We process files in chunks to avoid opening too many at once
-        FILE_CHUNK_SIZE = 10 # Process 10 files at a time
+            # We process files in chunks to avoid opening too many at once
+            FILE_CHUNK_SIZE = 10 # Process 10 files at a time
         
-        for i in range(0, len(files_to_process), FILE_CHUNK_SIZE):
-            file_batch = files_to_process[i:i + FILE_CHUNK_SIZE]
+            for i in range(0, len(files_to_process), FILE_CHUNK_SIZE):
+                file_batch = files_to_process[i:i + FILE_CHUNK_SIZE]
             
-            # Parse this small batch of files
-            with ThreadPoolExecutor(max_workers=min(len(file_batch), MAX_WORKERS)) as executor:
-                future_to_file = {executor.submit(parse_file, f): f for f in file_batch}
+                # Parse this small batch of files
+                with ThreadPoolExecutor(max_workers=min(len(file_batch), MAX_WORKERS)) as executor:
+                    future_to_file = {executor.submit(parse_file, f): f for f in file_batch}
                 
-                for future in as_completed(future_to_file):
-                    result = future.result()
-                    if result:
-                        buffer_docs.extend(result)
+                    for future in as_completed(future_to_file):
+                        result = future.result()
+                        if result:
+                            buffer_docs.extend(result)
             
-            # Check if buffer is full
-            if len(buffer_docs) >= STREAM_BUFFER_SIZE:
-                cnt = flush_buffer(buffer_docs)
-                total_chunks_processed += cnt
-                buffer_docs = [] # Clear RAM
-                import gc
-                gc.collect()
-
-        # Final Flush
-        if buffer_docs:
-            cnt = flush_buffer(buffer_docs)
-            total_chunks_processed += cnt
+                buffer_docs.extend(retry_docs)
+                retry_docs.clear()
+
+                # Check if buffer is full
+                if len(buffer_docs) >= STREAM_BUFFER_SIZE:
+                    cnt = flush_buffer(buffer_docs)
+                    total_chunks_processed += cnt
+                    buffer_docs = [] # Clear RAM
+                    import gc
+                    gc.collect()
+
+            # Final Flush (one extra round for duplicates of chunks that failed in it)
+            for _ in range(2):
+                buffer_docs.extend(retry_docs)
+                retry_docs.clear()
+                if buffer_docs:
+                    cnt = flush_buffer(buffer_docs)
+                    total_chunks_processed += cnt
+                    buffer_docs = []
+        finally:
+            # Drain the writer before touching existing documents
+            writer.close()
+            if writer.failed_batches:
+                still_failed = writer.retry_failed()
+                if still_failed:
+                    print(f"[Writer] WARNING: {still_failed} docs could not be written to ChromaDB.")
+                    if self.deduplicator:
+                        # Not persisted: the next run indexes them (or one of their duplicates) again
+                        for texts, _, _ in writer.failed_batches:
+                            self.deduplicator.rollback(texts)
+
+            # Attach aliases found for canonical chunks written in earlier buffers
+            if self.deduplicator:
+                alias_updates = self.deduplicator.pop_alias_updates()
+                if alias_updates:
+                    updated = self.vector_store.add_aliases(alias_updates)
+                    print(f"[Dedup] Recorded aliases on {updated} existing chunks.")
+                self.deduplicator.save()
+                print(self.deduplicator.report())
+
+        # Throughput Report (end-to-end: parse + embed + write)
+        elapsed = max(time.time() - t_start, 1e-6)
+        print(f"\n[Throughput] Embedded {total_chunks_processed} chunks, wrote {writer.written} in {elapsed:.1f}s "
+              f"({writer.written / elapsed:.1f} docs/s end-to-end). DB write time: {writer.write_time:.1f}s.")
+        snap = limiter.snapshot()
+        if snap:
+            print(f"[Concurrency] Embedding limit {snap['limit']} (peak {snap['peak_limit']}), {snap['overloads']} overloads.")
             
+        self.quota_tracker.save()
+        print(f"[Quota] Today's embedding requests: {self.quota_tracker.get_usage(endpoint='embedding')}")
         print(f"\n[DONE] Total chunks indexed: {total_chunks_processed}")
 
     def delete_file(self, filename):
@@ -763,6 +917,9 @@ class Indexer:
         filename = os.path.basename(filename) # Ensure we only use the basename
         print(f"Attempting to delete documents for file: {filename}")
         success = self.vector_store.delete_by_metadata({"source_file": filename})
+        if success and self.deduplicator:
+            # Persisted signatures may point to deleted canonicals
+            self.deduplicator.reset()
         if success:
              print(f"Successfully deleted all chunks for '{filename}'.")
              print("IMPORTANT: Please delete 'output/retriever_cache_v2.pkl' to clear BM25 cache if it exists.")
@@ -779,10 +936,14 @@ if __name__ == "__main__":
     parser.add_argument("--workers", type=int, default=10, help="Number of threads")
     parser.add_argument("--data-dir", type=str, default="data", help="Directory to index")
     parser.add_argument("--delete", type=str, default=None, help="Delete a file from the index")
+    parser.add_argument("--no-dedup", action="store_true", help="Disable MinHash near-duplicate elimination")
+    parser.add_argument("--dedup-threshold", type=float, default=0.85, help="Jaccard threshold for near-duplicates")
+    parser.add_argument("--dedup-state", type=str, default=None, help="Persist dedup signatures across runs (pickle path)")
     args = parser.parse_args()
     
     print("Initializing Indexer...")
-    indexer = Indexer(data_dir=args.data_dir)
+    indexer = Indexer(data_dir=args.data_dir, dedup=not args.no_dedup,
+                      dedup_threshold=args.dedup_threshold, dedup_state=args.dedup_state)
     print("Indexer Initialized.")
     
     if args.delete:
@@ -0,0 +1,166 @@
+import hashlib
+
+# IDs are spread over fixed segments so a mismatch can be narrowed down without
+# scanning the whole corpus. Content-hash IDs (md5 hex) are uniform over segments.
+NUM_SEGMENTS = 256
+
+_HEX = set("0123456789abcdef")
+
+
+def id_segment(doc_id: str) -> int:
+    """Maps a document ID to its digest segment (0..NUM_SEGMENTS-1)."""
+    prefix = doc_id[:2]
+    if len(prefix) == 2 and prefix[0] in _HEX and prefix[1] in _HEX:
+        return int(prefix, 16)
+    return hashlib.md5(doc_id.encode('utf-8')).digest()[0]
+
+
+def id_hash(doc_id: str) -> int:
+    """63-bit hash of an ID (fits a signed SQLite INTEGER)."""
+    return int.from_bytes(hashlib.md5(doc_id.encode('utf-8')).digest()[:8], 'big') >> 1
+
+
+class IdLedger:
+    """
+    Tracks the set of document IDs stored in a backend together with a rolling digest
+    (count + XOR of ID hashes) per segment, updated on every insert/delete.
+
+    The ledger works on a caller-provided SQLite cursor so updates can share the caller's
+    transaction (e.g. inside the BM25 database). Two stores are in sync when their segment
+    digests are equal; otherwise only the divergent segments need to be compared ID by ID.
+
+    When the ledger cannot share the store's transaction (ChromaDB), begin_write() / end_write()
+    bracket each store write: a write still pending after a crash means the ledger is stale.
+
+    Attributes:
+        table (str): Name of the ID table. The digest table is '<table>_digest'.
+    """
+
+    BATCH = 900 # SQLite limit variable number
+
+    def __init__(self, table="doc_ids"):
+        self.table = table
+        self.digest_table = f"{table}_digest"
+        self.state_table = f"{table}_state"
+
+    def ensure_schema(self, cursor):
+        """Creates tables if missing. Returns True if the ledger was (re)created and needs a backfill."""
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (self.table,))
+        exists = cursor.fetchone() is not None
+        if exists:
+            cursor.execute(f"PRAGMA table_info({self.table})")
+            columns = {row[1] for row in cursor.fetchall()}
+            if 'segment' not in columns:
+                # Older ID table without segments -> rebuild
+                cursor.execute(f"DROP TABLE {self.table}")
+                exists = False
+
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (id TEXT PRIMARY KEY, segment INTEGER) WITHOUT ROWID")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_segment ON {self.table} (segment)")
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {self.digest_table} (segment INTEGER PRIMARY KEY, count INTEGER, xor INTEGER)")
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {self.state_table} (key TEXT PRIMARY KEY, value INTEGER)")
+        if not exists:
+            cursor.execute(f"DELETE FROM {self.digest_table}")
+        return not exists
+
+    # --- Updates ---
+
+    def existing(self, cursor, ids):
+        """Return the subset of 'ids' present in the ledger."""
+        ids = list(ids)
+        present = set()
+        for i in range(0, len(ids), self.BATCH):
+            batch = ids[i:i + self.BATCH]
+            placeholders = ','.join(['?'] * len(batch))
+            cursor.execute(f"SELECT id FROM {self.table} WHERE id IN ({placeholders})", batch)
+            present.update(row[0] for row in cursor.fetchall())
+        return present
+
+    def add(self, cursor, ids):
+        """Registers IDs. Already known IDs are ignored. Returns the newly added IDs."""
+        present = self.existing(cursor, ids)
+        new_ids = list(dict.fromkeys(doc_id for doc_id in ids if doc_id not in present))
+        if new_ids:
+            cursor.executemany(f"INSERT INTO {self.table} (id, segment) VALUES (?, ?)",
+                               [(doc_id, id_segment(doc_id)) for doc_id in new_ids])
+            self._apply_digest(cursor, new_ids, sign=1)
+        return new_ids
+
+    def remove(self, cursor, ids):
+        """Unregisters IDs. Unknown IDs are ignored. Returns the removed IDs."""
+        present = list(self.existing(cursor, ids))
+        for i in range(0, len(present), self.BATCH):
+            batch = present[i:i + self.BATCH]
+            placeholders = ','.join(['?'] * len(batch))
+            cursor.execute(f"DELETE FROM {self.table} WHERE id IN ({placeholders})", batch)
+        if present:
+            self._apply_digest(cursor, present, sign=-1)
+        return present
+
+    def clear(self, cursor):
+        cursor.execute(f"DELETE FROM {self.table}")
+        cursor.execute(f"DELETE FROM {self.digest_table}")
+        cursor.execute(f"DELETE FROM {self.state_table}")
+
+    def begin_write(self, cursor):
+        """Marks a store write as in flight (commit before writing to the store)."""
+        cursor.execute(f"""
+            INSERT INTO {self.state_table} (key, value) VALUES ('pending_writes', 1)
+            ON CONFLICT(key) DO UPDATE SET value = value + 1
+        """)
+
+    def end_write(self, cursor):
+        """Clears one in-flight mark (commit together with the ID update)."""
+        cursor.execute(f"UPDATE {self.state_table} SET value = MAX(value - 1, 0) WHERE key = 'pending_writes'")
+
+    def _apply_digest(self, cursor, ids, sign):
+        per_segment = {}
+        for doc_id in ids:
+            seg = id_segment(doc_id)
+            count, xor = per_segment.get(seg, (0, 0))
+            per_segment[seg] = (count + sign, xor ^ id_hash(doc_id))
+
+        # SQLite has no XOR operator: a ^ b == (a | b) - (a & b) for non-negative ints
+        cursor.executemany(f"""
+            INSERT INTO {self.digest_table} (segment, count, xor) VALUES (?, ?, ?)
+            ON CONFLICT(segment) DO UPDATE SET
+                count = count + excluded.count,
+                xor = (xor | excluded.xor) - (xor & excluded.xor)
+        """, [(seg, count, xor) for seg, (count, xor) in per_segment.items()])
+
+    # --- Queries ---
+
+    def digests(self, cursor):
+        """Returns {segment: (count, xor)} for all non-empty segments."""
+        cursor.execute(f"SELECT segment, count, xor FROM {self.digest_table} WHERE count != 0")
+        return {seg: (count, xor) for seg, count, xor in cursor.fetchall()}
+
+    def pending_writes(self, cursor):
+        cursor.execute(f"SELECT value FROM {self.state_table} WHERE key = 'pending_writes'")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def total(self, cursor):
+        cursor.execute(f"SELECT COALESCE(SUM(count), 0) FROM {self.digest_table}")
+        return cursor.fetchone()[0]
+
+    def ids_in_segment(self, cursor, segment):
+        cursor.execute(f"SELECT id FROM {self.table} WHERE segment = ?", (segment,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def iter_ids(self, cursor, batch_size=10000):
+        """Keyset-paginated iteration over IDs (ordered). Yields lists of IDs."""
+        last_id = ""
+        while True:
+            cursor.execute(f"SELECT id FROM {self.table} WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size))
+            page = [row[0] for row in cursor.fetchall()]
+            if not page:
+                break
+            yield page
+            last_id = page[-1]
+
+
+def divergent_segments(digests_a: dict, digests_b: dict) -> list:
+    """Segments whose (count, xor) digest differs between two stores."""
+    segments = set(digests_a.keys()) | set(digests_b.keys())
+    return sorted(seg for seg in segments if digests_a.get(seg, (0, 0)) != digests_b.get(seg, (0, 0)))
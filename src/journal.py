@@ -0,0 +1,249 @@
+import os
+import csv
+import json
+import time
+import hashlib
+import threading
+
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+# Per-item fields needed to re-enter the pipeline without redoing RAG / classification
+STATE_FIELDS = ('_formatted_text', 'context', 'use_large_model', 'domain', '_timeline', '_followup_model')
+
+
+def input_digest(data: list) -> str:
+    """Fingerprint of a question set (IDs + question text). Resume is refused if it changed."""
+    h = hashlib.md5()
+    for item in data:
+        h.update(str(item.get('id') or item.get('qid')).encode('utf-8'))
+        h.update(b"\x00")
+        h.update(str(item.get('question', '')).encode('utf-8'))
+        h.update(b"\x01")
+    return h.hexdigest()
+
+
+def journal_path_for(output_path: str) -> str:
+    """Journal file that belongs to a submission path (output/submission.json -> output/submission.journal.jsonl)."""
+    base, _ = os.path.splitext(output_path)
+    return base + ".journal.jsonl"
+
+
+class ResultJournal:
+    """
+    Append-only JSONL journal of answer events.
+
+    Each completed answer is appended as one line instead of rewriting the whole submission
+    after every batch (O(n) per write instead of O(n^2) per run). Lines are flushed to the OS
+    immediately; fsync is batched (every 'fsync_every' events or 'fsync_interval' seconds)
+    so a power loss costs at most one batch of answers, and a process crash costs nothing.
+
+    Line format: {"event": <kind>, "id": qid, "data": {...}, "ts": epoch}
+      - "run":    run header (input digest, size); id is null.
+      - "state":  per-item progress ('prepared', 'classified', 'pending' + STATE_FIELDS).
+      - "result": a final answer.
+    Later events for the same ID override earlier ones (e.g. calc pass after first pass);
+    an item is finished when its latest event is a result.
+
+    Args:
+        path (str): Journal file path.
+        fsync_every (int): Max events between two fsyncs.
+        fsync_interval (float): Max seconds between two fsyncs.
+        truncate (bool): Start a new journal (True) or append to an existing one.
+    """
+    def __init__(self, path, fsync_every=50, fsync_interval=2.0, truncate=True):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.time()
+        self.events_written = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if not truncate:
+            self._drop_torn_tail(path)
+        self._f = open(path, 'w' if truncate else 'a', encoding='utf-8')
+
+    @staticmethod
+    def _drop_torn_tail(path):
+        """Cuts a partial last line (crash mid-write) so appended events start on a fresh line."""
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+            pos = size
+            while pos > 0:
+                step = min(4096, pos)
+                f.seek(pos - step)
+                chunk = f.read(step)
+                idx = chunk.rfind(b"\n")
+                if idx != -1:
+                    end = pos - step + idx + 1
+                    break
+                pos -= step
+            else:
+                end = 0
+            if end != size:
+                f.truncate(end)
+
+    def append(self, event: str, qid, data: dict):
+        """Appends a single event."""
+        self.append_many(event, [(qid, data)])
+
+    def append_many(self, event: str, records):
+        """Appends events for [(qid, data), ...] in one write."""
+        lines = []
+        ts = round(time.time(), 3)
+        for qid, data in records:
+            lines.append(json.dumps({"event": event, "id": qid, "data": data, "ts": ts}, ensure_ascii=False))
+        if not lines:
+            return
+
+        with self._lock:
+            if self._f.closed:
+                return
+            self._f.write("\n".join(lines) + "\n")
+            self._f.flush()
+            self.events_written += len(lines)
+            self._unsynced += len(lines)
+            if self._unsynced >= self.fsync_every or time.time() - self._last_sync >= self.fsync_interval:
+                self._sync_locked()
+
+    def append_results(self, results: list):
+        """Journals result dicts (internal '_' fields are dropped)."""
+        records = []
+        for r in results:
+            qid = r.get('id') or r.get('qid')
+            if qid:
+                records.append((qid, {k: v for k, v in r.items() if not k.startswith('_')}))
+        self.append_many("result", records)
+
+    def append_states(self, items: list, stage: str, fields=STATE_FIELDS):
+        """Journals per-item progress so a resumed run can skip RAG/classification/first pass."""
+        records = []
+        for item in items:
+            qid = item.get('id') or item.get('qid')
+            if qid:
+                data = {k: item[k] for k in fields if k in item}
+                data['stage'] = stage
+                records.append((qid, data))
+        self.append_many("state", records)
+
+    def append_run(self, data: list):
+        """Run header: ties the journal to its question set."""
+        self.append_many("run", [(None, {"input_digest": input_digest(data), "count": len(data)})])
+
+    def sync(self):
+        with self._lock:
+            if not self._f.closed:
+                self._sync_locked()
+
+    def _sync_locked(self):
+        os.fsync(self._f.fileno())
+        self._unsynced = 0
+        self._last_sync = time.time()
+
+    def close(self):
+        with self._lock:
+            if not self._f.closed:
+                self._f.flush()
+                self._sync_locked()
+                self._f.close()
+
+    # --- Recovery ---
+
+    @staticmethod
+    def read_events(path):
+        """
+        Yields journal events in write order. A torn last line (crash mid-write) is skipped.
+        """
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"[Journal] Skipping corrupt line {line_no} in {path}")
+
+    @classmethod
+    def replay(cls, path) -> dict:
+        """Rebuilds the latest answers: {qid: result} (last result per ID wins)."""
+        results = {}
+        for ev in cls.read_events(path):
+            if ev.get('event') == 'result' and ev.get('id'):
+                results[ev['id']] = ev.get('data') or {}
+        return results
+
+    @classmethod
+    def load_resume_state(cls, path) -> dict:
+        """
+        Rebuilds everything a resumed run needs.
+
+        Returns:
+            dict: {
+                "input_digest": digest of the last run header (None if absent),
+                "results": {qid: result} for finished items (latest event is a result),
+                "states": {qid: merged state fields + 'stage'} for unfinished items
+            }
+        """
+        input_digest_ = None
+        results = {}
+        states = {}
+        for ev in cls.read_events(path):
+            kind, qid, data = ev.get('event'), ev.get('id'), ev.get('data') or {}
+            if kind == 'run':
+                input_digest_ = data.get('input_digest')
+            elif not qid:
+                continue
+            elif kind == 'result':
+                results[qid] = data
+            elif kind == 'state':
+                results.pop(qid, None) # Item went back into the pipeline after this answer
+                states.setdefault(qid, {}).update(data)
+
+        for qid in results:
+            states.pop(qid, None)
+        return {"input_digest": input_digest_, "results": results, "states": states}
+
+
+def write_submission(results: list, output_path: str):
+    """
+    Materializes the submission files from final results (already in the desired order):
+    JSON, '<name>.csv' (qid, answer) and the time CSV (qid, answer, time).
+    """
+    # 1. Save JSON
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    # 2. Save Standard CSV (qid, answer)
+    csv_path = output_path.replace('.json', '.csv')
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['qid', 'answer'])
+        for item in results:
+            q_id = item.get('id') or item.get('qid')
+            if q_id:
+                writer.writerow([q_id, item.get('answer', '')])
+
+    # 3. Save Time CSV (qid, answer, time)
+    time_csv_path = output_path.replace('submission.json', 'submission_time.csv')
+    if 'submission' not in time_csv_path:
+        time_csv_path = output_path.replace('.json', '_time.csv')
+
+    with open(time_csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['qid', 'answer', 'time'])
+        for item in results:
+            q_id = item.get('id') or item.get('qid')
+            if q_id:
+                writer.writerow([q_id, item.get('answer', ''), f"{item.get('time', 0.0):.4f}"])
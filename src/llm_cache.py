@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def request_key(payload: dict) -> str:
+    """
+    Content hash of a chat request (model, messages, tools, tool_choice, sampling params).
+    Canonical JSON (sorted keys) so dict ordering does not change the key.
+    """
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent (SQLite) cache of chat completion responses for deterministic requests.
+
+    Entries expire after 'ttl' seconds and the table is bounded to 'max_entries'
+    (least recently used entries are evicted). Safe to share between threads.
+
+    Args:
+        path (str): SQLite file.
+        ttl (float): Entry lifetime in seconds (0/None = no expiry).
+        max_entries (int): Max cached responses.
+    """
+    EVICT_EVERY = 100 # Check the size bound every N stores (amortized)
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_entries=50000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stores = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                created REAL,
+                last_access REAL,
+                response TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        """Returns the cached response (dict) or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT created, response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            created, response = row
+            if self.ttl and now - created > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(response)
+
+    def put(self, key, model, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, created, last_access, response) VALUES (?, ?, ?, ?, ?)",
+                (key, model, now, now, json.dumps(response, ensure_ascii=False))
+            )
+            self.stores += 1
+            if self.stores % self.EVICT_EVERY == 0:
+                self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self):
+        if self.ttl:
+            cur = self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+            self.evictions += cur.rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            cur = self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)", (excess,)
+            )
+            self.evictions += cur.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "entries": size,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
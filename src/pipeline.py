@@ -0,0 +1,404 @@
+import time
+import queue
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+
+from .config import (
+    MODEL_SMALL, MODEL_LARGE, BATCH_SIZE_SMALL, BATCH_SIZE_LARGE,
+    MAX_TOKENS_SMALL, TARGET_MAX_TOKENS_LARGE, MAX_RETRIES,
+    MAX_WORKERS_RAG, MAX_WORKERS_INFERENCE, MAX_WORKERS_CALC, RETRY_BATCH_TOKENS,
+    CLASSIFICATION_BATCH_SIZE, PIPELINE_BATCH_LINGER
+)
+from .logger import setup_logger
+from .concurrency import pool_size
+from .text_utils import estimate_item_tokens
+from .tracing import attach_timeline
+from .batch_planner import first_fit_decreasing, min_batches, clamped_tokens
+
+logger = setup_logger(__name__)
+
+
+class _Batcher:
+    """
+    Groups items per key (e.g. domain) into batches bounded by item count and estimated tokens.
+    Items go first-fit into the key's open batches; a batch is released as soon as it reaches
+    its item cap, otherwise once the key has waited 'linger' seconds or when the caller knows
+    no more items can arrive (force). Released partial batches are repacked first-fit decreasing.
+
+    Attributes:
+        limits (callable): key -> (max_items or None, max_tokens).
+        model_of (callable): key -> model name (token counts use its calibration).
+        stats (PackingStats, optional): Receives the fill of released batches under 'stage'.
+    """
+    def __init__(self, limits, model_of=lambda key: None, stats=None, stage="batches"):
+        self.limits = limits
+        self.model_of = model_of
+        self.stats = stats
+        self.stage = stage
+        self.open = {} # key -> [bins ([items, sizes, tokens]), opened_at]
+
+    def __len__(self):
+        return sum(len(b[0]) for bins, _ in self.open.values() for b in bins)
+
+    def add(self, key, item) -> list:
+        """Adds an item. Returns the list of (key, items) batches that became full."""
+        max_items, max_tokens = self.limits(key)
+        t = estimate_item_tokens(item, self.model_of(key))
+
+        if key not in self.open:
+            self.open[key] = [[], time.time()]
+        bins = self.open[key][0]
+        for b in bins:
+            if b[2] + t <= max_tokens and (not max_items or len(b[0]) < max_items):
+                break
+        else:
+            b = [[], [], 0]
+            bins.append(b)
+        b[0].append(item)
+        b[1].append(t)
+        b[2] += t
+
+        if max_items and len(b[0]) >= max_items:
+            bins.remove(b)
+            if not bins:
+                del self.open[key]
+            self._record(key, [b[1]])
+            return [(key, b[0])]
+        return []
+
+    def due(self, linger: float, force: bool = False) -> list:
+        """Returns (and removes) partial batches that waited long enough (all of them if force)."""
+        now = time.time()
+        ready = []
+        for key in [k for k, (_, opened_at) in self.open.items() if force or now - opened_at >= linger]:
+            bins = self.open.pop(key)[0]
+            max_items, max_tokens = self.limits(key)
+            items = [it for b in bins for it in b[0]]
+            sizes = [t for b in bins for t in b[1]]
+            packed = first_fit_decreasing(sizes, max_tokens, max_items)
+            self._record(key, [[sizes[i] for i in p] for p in packed])
+            ready.extend((key, [items[i] for i in p]) for p in packed)
+        return ready
+
+    def _record(self, key, bins_sizes):
+        if self.stats is None:
+            return
+        max_items, max_tokens = self.limits(key)
+        sizes = [t for b in bins_sizes for t in b]
+        self.stats.record(self.stage, len(bins_sizes), len(sizes), clamped_tokens(sizes, max_tokens), len(bins_sizes) * max_tokens,
+                          min_batches(sizes, max_tokens, max_items))
+
+
+class _Job:
+    __slots__ = ('stage', 'model', 'retry_count', 'items')
+
+    def __init__(self, stage, model, retry_count, items):
+        self.stage = stage
+        self.model = model
+        self.retry_count = retry_count
+        self.items = items
+
+
+class StreamingPipeline:
+    """
+    Dataflow version of BatchSolver.solve: every question moves on its own through
+    prepare (RAG) -> classify -> solve -> tool follow-up -> finalize, instead of waiting
+    for the slowest item of each global phase.
+
+    Each stage has its own thread pool (concurrency limit). Worker threads only do the
+    work and post events; all bookkeeping runs on the coordinating thread, so no locks
+    are needed around pipeline state. Batches stay domain-pure: items are grouped per
+    (domain, model) and a partial batch is released after PIPELINE_BATCH_LINGER seconds
+    or as soon as nothing upstream can still add to it.
+
+    Semantics mirror the phased solver:
+    - First pass: model_name (or MODEL_LARGE for 'use_large_model' items), retrievals allowed.
+    - Follow-up (tool outputs): retry_count=1, further pending requests are ignored.
+    - Items left without any answer are retried on MODEL_SMALL (follow-ups of retries on MODEL_LARGE).
+    - A first-pass batch that fails hard falls back to 'A' so the submission has no gaps.
+
+    Args:
+        solver (BatchSolver): Provides prepare_item, _classify_batch_domains, _process_single_batch.
+        model_name (str): Default model for the first pass.
+        journal (ResultJournal, optional): Receives every finalized result (incremental save).
+        on_result (callable, optional): Called with each result as soon as it is final.
+        linger (float): Max seconds a partial batch waits for more items.
+    """
+    def __init__(self, solver, model_name=MODEL_SMALL, journal=None, on_result=None, linger=PIPELINE_BATCH_LINGER):
+        self.solver = solver
+        self.model_name = model_name
+        self.journal = journal
+        self.on_result = on_result
+        self.linger = linger
+
+        packing = solver.packing_stats
+        self.first = _Batcher(lambda key: (BATCH_SIZE_LARGE, TARGET_MAX_TOKENS_LARGE) if key[0]
+                              else (BATCH_SIZE_SMALL, MAX_TOKENS_SMALL),
+                              model_of=lambda key: MODEL_LARGE if key[0] else model_name,
+                              stats=packing, stage="first")
+        self.followup = _Batcher(lambda key: (None, MAX_TOKENS_SMALL), model_of=lambda key: key[0],
+                                 stats=packing, stage="followup")
+        self.retry = _Batcher(lambda key: (None, RETRY_BATCH_TOKENS), model_of=lambda key: MODEL_SMALL,
+                              stats=packing, stage="retry")
+
+    @staticmethod
+    def _qid(item):
+        return item.get('id') or item.get('qid')
+
+    def run(self, data: list, finished: dict = None) -> list:
+        """
+        Solves all items and returns the final result dicts in input order.
+
+        Args:
+            data (list): Question items. Items restored from a journal carry their saved
+                         state (STATE_FIELDS + '_resume_stage') and re-enter at that stage.
+            finished (dict, optional): {qid: result} already answered by a previous run.
+        """
+        self.events = queue.Queue()
+        self.item_map = {}
+        for idx, item in enumerate(data):
+            item['_index'] = idx
+            self.item_map[self._qid(item)] = item
+
+        self.final = {}         # qid -> result
+        self.provisional = {}   # qid -> first-pass answer of an item waiting for its follow-up
+        self.attempts = defaultdict(int)
+        self.prepared = set()
+        self.domains = {}
+        self.upstream = 0       # prepare/classify tasks not yet reported
+        self.in_flight = 0      # solve jobs not yet reported
+        self.stage_stats = defaultdict(lambda: [0, 0]) # stage -> [batches, items]
+        self.t_start = time.time()
+        self.t_first = None
+
+        self.progress = tqdm(total=len(self.item_map), desc="[Pipeline] Finalized")
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS_RAG) as rag_pool, \
+             ThreadPoolExecutor(max_workers=pool_size(MAX_WORKERS_INFERENCE)) as cls_pool, \
+             ThreadPoolExecutor(max_workers=pool_size(MAX_WORKERS_INFERENCE)) as solve_pool, \
+             ThreadPoolExecutor(max_workers=pool_size(MAX_WORKERS_CALC)) as followup_pool:
+            self.pools = {'solve': solve_pool, 'followup': followup_pool, 'retry': followup_pool}
+
+            to_start = []
+            resumed_pending = []
+            for item in data:
+                qid = self._qid(item)
+                if finished and qid in finished:
+                    self._finalize(finished[qid], journal=False)
+                elif item.get('_resume_stage') == 'pending' and item.get('domain'):
+                    # Tool outputs are already in the prompt: straight to the follow-up pass
+                    self.prepared.add(qid)
+                    self.domains[qid] = item['domain']
+                    resumed_pending.append(item)
+                else:
+                    to_start.append(item)
+
+            for item in to_start:
+                self.upstream += 1
+                rag_pool.submit(self._prepare_task, item) # Restored contexts skip RAG
+            self._submit_classification(to_start, cls_pool)
+            for item in resumed_pending:
+                for key, batch in self.followup.add((item.get('_followup_model') or self.model_name, item['domain']), item):
+                    self._submit('followup', key, batch)
+
+            while len(self.final) < len(self.item_map):
+                if not (self.upstream or self.in_flight or len(self.first) or len(self.followup) or len(self.retry)):
+                    break # Nothing left that could produce an answer
+
+                try:
+                    kind, payload = self.events.get(timeout=max(self.linger / 2, 0.01))
+                    self._handle(kind, payload)
+                    # Drain whatever else is ready before dispatching (larger batches)
+                    while True:
+                        kind, payload = self.events.get_nowait()
+                        self._handle(kind, payload)
+                except queue.Empty:
+                    pass
+                self._dispatch()
+        self.progress.close()
+
+        self._log_summary()
+        return sorted(self.final.values(), key=lambda r: self.item_map[r['id']]['_index'])
+
+    # --- Worker side (thread pools): do the work, post an event ---
+
+    def _prepare_task(self, item):
+        try:
+            self.events.put(('prepared', (self.solver.prepare_item(item), None)))
+        except Exception as e:
+            self.events.put(('prepared', (item, e)))
+
+    def _classify_task(self, chunk):
+        try:
+            domain_map = self.solver._classify_batch_domains(chunk)
+        except Exception as e:
+            logger.error(f"Classification Batch Error: {e}")
+            domain_map = {}
+        self.events.put(('classified', (chunk, domain_map)))
+
+    def _solve_task(self, job):
+        try:
+            results, pending = self.solver._process_single_batch(job.items, job.model, retry_count=job.retry_count,
+                                                                 use_cache=(job.stage != 'retry'))
+            self.events.put(('solved', (job, results, pending, None)))
+        except Exception as e:
+            self.events.put(('solved', (job, [], [], e)))
+
+    def _submit_classification(self, data, cls_pool):
+        # Known / cached / RC heuristic / confident local labels skip the LLM classifier
+        bypass, to_classify = self.solver._known_domains(data)
+
+        if bypass:
+            self.upstream += 1
+            self.events.put(('classified', ([self.item_map[q] for q in bypass], bypass)))
+        for i in range(0, len(to_classify), CLASSIFICATION_BATCH_SIZE):
+            self.upstream += 1
+            cls_pool.submit(self._classify_task, to_classify[i:i + CLASSIFICATION_BATCH_SIZE])
+
+    # --- Coordinator side (single thread) ---
+
+    def _handle(self, kind, payload):
+        if kind == 'prepared':
+            self.upstream -= 1
+            item, error = payload
+            qid = self._qid(item)
+            if error:
+                logger.error(f"Prepare Error {qid}: {error}")
+                self._finalize(self._fallback(item, f"System Error Fallback: {error}"))
+                return
+            self.prepared.add(qid)
+            if self.journal and not item.get('_resume_stage'):
+                self.journal.append_states([item], 'prepared', fields=('_formatted_text', 'context', 'use_large_model'))
+            if qid in self.domains:
+                self._ready(item)
+
+        elif kind == 'classified':
+            self.upstream -= 1
+            chunk, domain_map = payload
+            for item in chunk:
+                qid = self._qid(item)
+                self.domains[qid] = domain_map.get(qid, 'K') # Default K
+                if qid in self.prepared:
+                    self._ready(item)
+            if self.journal:
+                new = [it for it in chunk if not it.get('_resume_stage')]
+                for it in new:
+                    it['domain'] = self.domains[self._qid(it)]
+                self.journal.append_states(new, 'classified', fields=('domain',))
+
+        elif kind == 'solved':
+            self.in_flight -= 1
+            self._on_solved(*payload)
+
+    def _ready(self, item):
+        """Prepared + classified: enters the first-pass batcher."""
+        qid = self._qid(item)
+        if qid in self.final:
+            return
+        item['domain'] = self.domains[qid]
+        for key, batch in self.first.add((item.get('use_large_model', False), item['domain']), item):
+            self._submit('solve', key, batch)
+
+    def _on_solved(self, job, results, pending, error):
+        if error:
+            logger.error(f"[{job.stage}] Batch FATAL Error: {error}")
+            if job.stage == 'solve':
+                # FALLBACK: Fill missing items with Default 'A' to prevent submission gaps
+                results = [self._fallback(it, f"System Error Fallback: {error}") for it in job.items]
+                logger.warning(f"  [Fallback] Added {len(results)} default answers for failed batch.")
+
+        # Follow-up passes ignore further pending requests (prevents retrieval loops)
+        if job.stage == 'followup':
+            pending = []
+        pending_ids = {self._qid(p) for p in pending}
+
+        for r in results:
+            qid = r.get('id')
+            if qid not in self.item_map or qid in self.final:
+                continue
+            if qid in pending_ids:
+                self.provisional[qid] = r
+            else:
+                self._finalize(r)
+
+        # Tool outputs were appended to the item text: queue the follow-up
+        followup_model = self.model_name if job.stage == 'solve' else MODEL_LARGE
+        for item in pending:
+            item['_followup_model'] = followup_model # Journaled: a resumed run re-queues on the same model
+        if self.journal and pending:
+            self.journal.append_states(pending, 'pending')
+        for item in pending:
+            for key, batch in self.followup.add((followup_model, item.get('domain', 'K')), item):
+                self._submit('followup', key, batch)
+
+        # Items without any answer
+        for item in job.items:
+            qid = self._qid(item)
+            if qid in self.final or qid in pending_ids:
+                continue
+            if qid in self.provisional:
+                self._finalize(self.provisional.pop(qid))
+                continue
+            self.attempts[qid] += 1
+            if self.attempts[qid] > MAX_RETRIES:
+                logger.error(f"  [Retry] Giving up on {qid} after {MAX_RETRIES} retries.")
+                continue
+            for key, batch in self.retry.add(item.get('domain', 'K'), item):
+                self._submit('retry', key, batch)
+
+    def _dispatch(self):
+        """Releases partial batches that lingered long enough, or that nothing upstream can still fill."""
+        for key, batch in self.first.due(self.linger, force=not self.upstream):
+            self._submit('solve', key, batch)
+        no_more_feed = not (self.upstream or self.in_flight or len(self.first))
+        for key, batch in self.followup.due(self.linger, force=no_more_feed):
+            self._submit('followup', key, batch)
+        for key, batch in self.retry.due(self.linger, force=no_more_feed):
+            self._submit('retry', key, batch)
+
+    def _submit(self, stage, key, batch):
+        if stage == 'solve':
+            job = _Job(stage, MODEL_LARGE if key[0] else self.model_name, 0, batch)
+        elif stage == 'followup':
+            job = _Job(stage, key[0], 1, batch)
+        else:
+            job = _Job(stage, MODEL_SMALL, 0, batch)
+        self.stage_stats[stage][0] += 1
+        self.stage_stats[stage][1] += len(batch)
+        self.in_flight += 1
+        self.pools[stage].submit(self._solve_task, job)
+
+    def _finalize(self, result, journal=True):
+        qid = result.get('id')
+        if qid in self.final:
+            return
+        self.final[qid] = result
+        self.provisional.pop(qid, None)
+        if self.t_first is None:
+            self.t_first = time.time() - self.t_start
+        self.progress.update(1)
+        if self.journal and journal:
+            self.journal.append_results([result])
+        if self.on_result:
+            self.on_result(result)
+
+    @staticmethod
+    def _fallback(item, reason):
+        return attach_timeline({
+            "id": item.get('id') or item.get('qid'),
+            "answer": "A",
+            "confidence": 0,
+            "reasoning": reason,
+            "domain": item.get('domain', 'K')
+        }, item)
+
+    def _log_summary(self):
+        total = time.time() - self.t_start
+        stages = ", ".join(f"{stage}: {b} batches / {n} items" for stage, (b, n) in self.stage_stats.items())
+        first = f"{self.t_first:.2f}s" if self.t_first is not None else "n/a"
+        logger.info(f"[Pipeline] {len(self.final)}/{len(self.item_map)} answered in {total:.2f}s "
+                    f"(first result after {first}). {stages}")
+        packing = ", ".join(f"{stage}: fill {ps['fill']:.1%} (lower bound {ps['lower_bound']} batches)"
+                            for stage, ps in self.solver.packing_stats.summary().items())
+        if packing:
+            logger.info(f"[Pipeline] Batch packing: {packing}")
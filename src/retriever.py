@@ -1,16 +1,18 @@
 from .api import VNPTClient
 from .vector_store import VectorStore
-import numpy as np
 import threading
 import os
+import time
 from tqdm import tqdm
 import warnings
 # import torch (Moved to lazy load)
 from .retriever_sqlite import SQLiteBM25
+from .integrity import divergent_segments, NUM_SEGMENTS
 # from sentence_transformers import CrossEncoder (Moved to lazy load)
 
-from .config import DB_PATH, RERANKER_MODEL, RETRIEVER_K, RETRIEVER_FETCH_K, RERANK_POOL_SIZE, MAX_GPU_WORKERS, USE_RERANKER
+from .config import DB_PATH, RERANKER_MODEL, RETRIEVER_K, RETRIEVER_FETCH_K, RERANK_POOL_SIZE, RRF_K, USE_RERANKER, get_max_gpu_workers
 from .logger import setup_logger
+from .tracing import get_tracer
 from tenacity import RetryError
 from requests.exceptions import HTTPError
 
@@ -61,14 +63,14 @@ class Retriever:
         else:
             logger.info(f"Skipping Index Check (Fast Start). Loaded BM25 from {self.db_path}")
 
-        # Lazy Init Reranker
+        # Lazy Init Reranker (torch / sentence_transformers / GPU detection load on first search)
         self.reranker = None
         self._model_lock = threading.Lock()
-        self._gpu_semaphore = threading.Semaphore(MAX_GPU_WORKERS)
+        self._gpu_semaphore = None
     
-    def _ensure_reranker_loaded(self):
-        """Lazy loads the CrossEncoder model in a thread-safe manner."""
-        if not USE_RERANKER:
+    def _ensure_reranker_loaded(self, force: bool = False):
+        """Lazy loads the CrossEncoder model in a thread-safe manner (force: even if USE_RERANKER is off)."""
+        if not USE_RERANKER and not force:
             self.reranker = False
             return
 
@@ -84,6 +86,7 @@ class Retriever:
                 import torch
                 from sentence_transformers import CrossEncoder
                 
+                self._gpu_semaphore = threading.Semaphore(get_max_gpu_workers())
                 logger.info(f"Initializing Reranker ({RERANKER_MODEL} - GPU)...")
                 self.reranker = CrossEncoder(
                     RERANKER_MODEL, 
@@ -102,54 +105,57 @@ class Retriever:
     def _build_index(self):
         """
         Synchronizes the BM25 (SQLite) index with the VectorStore (ChromaDB).
-        Performs a delta sync: deletes obsolete documents and adds new ones.
+
+        Both stores keep a rolling digest (count + XOR of ID hashes) per ID segment.
+        1. Equal digests -> in sync (answered in milliseconds, no ID is loaded).
+        2. Otherwise only the divergent segments are diffed ID by ID:
+           obsolete documents are deleted, missing ones are fetched and indexed.
         """
-        logger.info("Checking Index Integrity (Incremental Sync)...")
+        logger.info("Checking Index Integrity (Segment Digests)...")
+        t0 = time.perf_counter()
         
-        # 1. Get snapshot of both systems
-        sqlite_ids = self.bm25_backend.get_existing_ids() # Set
-        vs_ids = self.vector_store.get_all_ids()          # Set
+        vs_digests = self.vector_store.id_digests()
+        bm25_digests = self.bm25_backend.id_digests()
+        segments = divergent_segments(vs_digests, bm25_digests)
         
-        # 2. Calculate Delas
-        missing_ids = vs_ids - sqlite_ids
-        obsolete_ids = sqlite_ids - vs_ids
+        if not segments:
+            logger.info(f"BM25 Index is up to date (digest match in {(time.perf_counter()-t0)*1000:.1f} ms).")
+            return
         
-        # 3. Handle Deletions
-        if obsolete_ids:
-            logger.info(f"Found {len(obsolete_ids)} documents removed from VectorStore. Syncing...")
-            self.bm25_backend.delete_documents(obsolete_ids)
+        logger.info(f"{len(segments)}/{NUM_SEGMENTS} ID segments diverge. Syncing only those ranges...")
         
-        # 4. Handle Additions
-        if missing_ids:
-            logger.info(f"Found {len(missing_ids)} new documents to index...")
-            
-            # Fetch content ONLY for missing items
-            # ChromaDB get() allows filtering by IDs
-            # [FIX] Batch fetch to avoid "too many SQL variables" (999/32766 limit)
-            missing_list = list(missing_ids)
-            BATCH_FETCH = 2000 # Reduced to 2000 for RAM safety
-            
-            for i in tqdm(range(0, len(missing_list), BATCH_FETCH), desc="Fetching & Indexing Deltas"):
-                batch_ids = missing_list[i : i + BATCH_FETCH]
+        # [FIX] Batch fetch to avoid "too many SQL variables" (999/32766 limit)
+        BATCH_FETCH = 2000 # Reduced to 2000 for RAM safety
+        obsolete_count = 0
+        missing_count = 0
+        
+        for seg in tqdm(segments, desc="Syncing Divergent Segments"):
+            try:
+                vs_ids = set(self.vector_store.ids_in_segment(seg))
+                bm25_ids = set(self.bm25_backend.ids_in_segment(seg))
+                
+                # 1. Handle Deletions
+                obsolete_ids = bm25_ids - vs_ids
+                if obsolete_ids:
+                    self.bm25_backend.delete_documents(obsolete_ids)
+                    obsolete_count += len(obsolete_ids)
                 
-                try:
-                    # Fetch batch content
+                # 2. Handle Additions (fetch content ONLY for missing items)
+                missing_list = list(vs_ids - bm25_ids)
+                for i in range(0, len(missing_list), BATCH_FETCH):
+                    batch_ids = missing_list[i : i + BATCH_FETCH]
                     results = self.vector_store.collection.get(ids=batch_ids, include=['documents', 'metadatas'])
-                    
-                    new_texts = results['documents']
-                    new_metas = results['metadatas']
-                    new_ids = results['ids']
-                    
-                    if new_texts:
-                        self.bm25_backend.index_documents(new_texts, new_metas, new_ids)
-                except Exception as e:
-                     logger.error(f"Error indexing delta batch {i}: {e}")
-                     # Continue to next batch instead of crashing
-        else:
-            if not obsolete_ids:
-                logger.info("BM25 Index is up to date.")
+                    if results['documents']:
+                        self.bm25_backend.index_documents(results['documents'], results['metadatas'], results['ids'])
+                        missing_count += len(results['ids'])
+            except Exception as e:
+                 logger.error(f"Error syncing segment {seg}: {e}")
+                 # Continue to next segment instead of crashing
+        
+        logger.info(f"Sync done in {time.perf_counter()-t0:.2f}s: removed {obsolete_count}, indexed {missing_count} documents.")
 
-    def search(self, query: str, k: int = RETRIEVER_K, fetch_k: int = RETRIEVER_FETCH_K) -> list:
+    def search(self, query: str, k: int = RETRIEVER_K, fetch_k: int = RETRIEVER_FETCH_K, rrf_k: int = RRF_K,
+               pool_size: int = RERANK_POOL_SIZE, use_reranker: bool = USE_RERANKER, timings: dict = None) -> list:
         """
         Performs Hybrid Search using Reciprocal Rank Fusion (RRF).
         
@@ -163,6 +169,12 @@ class Retriever:
             query (str): The search query.
             k (int): Number of final documents to return.
             fetch_k (int): Number of candidates to fetch from each sub-retriever.
+            rrf_k (int): RRF smoothing constant (higher = flatter rank contributions).
+            pool_size (int): Number of top RRF candidates scored by the Cross-Encoder.
+            use_reranker (bool): Rerank the pool (False = plain RRF order).
+            timings (dict, optional): Receives per-stage seconds ('embedding', 'vector', 'bm25',
+                                      'fusion', 'rerank'; used by scripts/bench_retrieval.py).
+                                      The stages are also recorded as tracing spans.
 
         Returns:
             list: List of document dicts with keys ['id', 'text', 'metadata', 'score', 'rrf_score', 'rerank_score'].
@@ -170,6 +182,7 @@ class Retriever:
         # Parallelize Vector and BM25 Search
         vector_results = []
         bm25_results = []
+        stages = {} # stage -> (start, end) perf_counter; filled by the worker threads
         
         import time
         from concurrent.futures import ThreadPoolExecutor
@@ -179,16 +192,18 @@ class Retriever:
         def run_vector():
             try:
                 # Embedding is sequential to queries anyway, but putting it here cleans up flow
-                t_emb_start = time.time()
+                t_emb_start = time.perf_counter()
                 logger.debug(f"Retrieving Embeddings for query: {query[:50]}...") # Changed to DEBUG
                 emb_response = self.client.get_embedding(query)
-                logger.debug(f"Embedding API took: {time.time()-t_emb_start:.2f}s")
+                stages['embedding'] = (t_emb_start, time.perf_counter())
+                logger.debug(f"Embedding API took: {time.perf_counter()-t_emb_start:.2f}s")
                 
                 if 'data' in emb_response and isinstance(emb_response['data'], list):
                     query_embedding = emb_response['data'][0]['embedding']
-                    t_vec_start = time.time()
+                    t_vec_start = time.perf_counter()
                     res = self.vector_store.search(query_embedding, k=fetch_k)
-                    logger.debug(f"Vector Search took: {time.time()-t_vec_start:.2f}s")
+                    stages['vector'] = (t_vec_start, time.perf_counter())
+                    logger.debug(f"Vector Search took: {time.perf_counter()-t_vec_start:.2f}s")
                     return res
             except RetryError as e:
                 # Handle Tenacity Retry Errors (usually API failures)
@@ -214,12 +229,13 @@ class Retriever:
         def run_bm25():
             res_list = []
             try:
-                t_bm25_start = time.time()
+                t_bm25_start = time.perf_counter()
                 # SQLite FTS5 rank is "Smaller is Better".
                 # search() returns results ordered by rank ASC (Best first).
                 # This is compatible with RRF which uses list position (enumerate).
                 raw_bm25 = self.bm25_backend.search(query, k=fetch_k)
-                logger.debug(f"BM25 Search took: {time.time()-t_bm25_start:.2f}s")
+                stages['bm25'] = (t_bm25_start, time.perf_counter())
+                logger.debug(f"BM25 Search took: {time.perf_counter()-t_bm25_start:.2f}s")
                 
                 # Convert to standard format for RRF
                 # id, metadata, score
@@ -245,7 +261,7 @@ class Retriever:
 
         # 3. Reciprocal Rank Fusion (RRF)
         # RRF_score(d) = sum(1 / (k + rank(d)))
-        rrf_k = 60
+        t_fusion_start = time.perf_counter()
         merged_scores = {}
         doc_map = {}
 
@@ -263,27 +279,30 @@ class Retriever:
 
         # Sort by RRF score
         sorted_keys = sorted(merged_scores.keys(), key=lambda x: merged_scores[x], reverse=True)
+        stages['fusion'] = (t_fusion_start, time.perf_counter())
         
         # 4. Reranking (Cross-Encoder)
         # Take Top N candidates from RRF for reranking (Heavy operation)
         rerank_pool = []
-        for key in sorted_keys[:RERANK_POOL_SIZE]: 
+        for key in sorted_keys[:pool_size]: 
             doc = doc_map[key]
             doc['rrf_score'] = merged_scores[key]
             rerank_pool.append(doc)
 
-        if self.reranker is None:
-            self._ensure_reranker_loaded()
+        if use_reranker and self.reranker is None:
+            self._ensure_reranker_loaded(force=True)
 
-        if self.reranker and rerank_pool:
+        if use_reranker and self.reranker and rerank_pool:
             # Prepare pairs for Cross-Encoder: [[query, doc_text], ...]
             pairs = [[query, doc['text']] for doc in rerank_pool]
             try:
                 # [GPU SAFETY] Limit concurrent GPU access
-                # Network threads can be 50, but GPU threads limited to MAX_GPU_WORKERS
+                # Network threads can be 50, but GPU threads limited to get_max_gpu_workers()
+                t_rerank_start = time.perf_counter()
                 with self._gpu_semaphore:
                     # Predict scores
                     rerank_scores = self.reranker.predict(pairs)
+                stages['rerank'] = (t_rerank_start, time.perf_counter())
                 
                 # Assign new scores
                 for i, doc in enumerate(rerank_pool):
@@ -293,11 +312,11 @@ class Retriever:
                 reranked_results = sorted(rerank_pool, key=lambda x: x['rerank_score'], reverse=True)
                 
                 # Return Top K
-                return reranked_results[:k]
+                return self._finish_search(reranked_results[:k], stages, timings)
                 
             except Exception as e:
                 logger.error(f"Rerank Error: {e}. Returning RRF results.")
-                return rerank_pool[:k]
+                return self._finish_search(rerank_pool[:k], stages, timings)
         
         # Fallback if no reranker
         final_results = []
@@ -306,7 +325,17 @@ class Retriever:
             doc['rrf_score'] = merged_scores[key]
             final_results.append(doc)
 
-        return final_results
+        return self._finish_search(final_results, stages, timings)
+
+    @staticmethod
+    def _finish_search(results, stages, timings):
+        """Records the stage timings of a search (tracing spans + optional timings dict) and returns the results."""
+        tracer = get_tracer()
+        for name, (start, end) in stages.items():
+            tracer.record(name, start, end)
+            if timings is not None:
+                timings[name] = end - start
+        return results
 
     def get_request_count(self) -> int:
         """Returns the total number of API requests made by the underlying client."""
@@ -1,15 +1,25 @@
 import sqlite3
 import os
 import pickle
-from pyvi import ViTokenizer
 from tqdm import tqdm
 import json
 import threading
 from concurrent.futures import ProcessPoolExecutor
+from .integrity import IdLedger
+
+_vi_tokenizer = None
+
+def _tokenize(text):
+    """Vietnamese word segmentation. pyvi (CRF model) is loaded on first use only."""
+    global _vi_tokenizer
+    if _vi_tokenizer is None:
+        from pyvi import ViTokenizer
+        _vi_tokenizer = ViTokenizer
+    return _vi_tokenizer.tokenize(text)
 
 # Helper function must be top-level for pickling
 def tokenize_batch_worker(texts):
-    return [ViTokenizer.tokenize(t) for t in texts]
+    return [_tokenize(t) for t in texts]
 
 class SQLiteBM25:
     """
@@ -19,6 +29,8 @@ class SQLiteBM25:
     def __init__(self, db_path="bm25_index.db"):
         self.db_path = db_path
         self.local = threading.local()
+        # ID table + per-segment digests (fast integrity checks against ChromaDB)
+        self.ledger = IdLedger("doc_ids")
         
         # Ensure generic setup (table creation) is done once safely
         self._init_db_schema()
@@ -44,11 +56,21 @@ class SQLiteBM25:
             # Column missing (Old Schema) -> Rebuild
             print("Schema mismatch detected (missing raw_content). Rebuilding index...")
             cursor.execute("DROP TABLE IF EXISTS documents")
+            cursor.execute("DROP TABLE IF EXISTS doc_ids")
             
         cursor.execute('''
             CREATE VIRTUAL TABLE IF NOT EXISTS documents 
             USING fts5(content, metadata, id UNINDEXED, raw_content UNINDEXED)
         ''')
+
+        # ID ledger: FTS5 'id' is UNINDEXED, so membership checks / paging / digests need a real table
+        if self.ledger.ensure_schema(cursor):
+            cursor.execute("SELECT id FROM documents")
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    break
+                self.ledger.add(conn.cursor(), [row[0] for row in rows])
         conn.commit()
         conn.close()
 
@@ -75,16 +97,17 @@ class SQLiteBM25:
         
         print(f"Indexing {len(texts)} documents into SQLite...")
         
+        # Skip IDs already indexed (content-hash IDs -> same content), and repeats within this batch
+        present = self.ledger.existing(cursor, ids)
+
         # 1. Tokenize
         # We use sequential tokenization here to avoid ProcessPool complexity issues within threads/Safe execution
         # (ViTokenizer is fast enough for increments)
-        tokenized_texts = []
-        for t in texts:
-            tokenized_texts.append(ViTokenizer.tokenize(t))
-            
         data_tuples = []
-        for i, (doc_id, tokens, meta) in enumerate(zip(ids, tokenized_texts, metadatas)):
-            raw_content = texts[i] # Original text
+        for doc_id, raw_content, meta in zip(ids, texts, metadatas):
+            if doc_id in present: continue
+            present.add(doc_id)
+            tokens = _tokenize(raw_content)
             meta_json = json.dumps(meta, ensure_ascii=False)
             data_tuples.append((tokens, meta_json, doc_id, raw_content))
             
@@ -94,6 +117,7 @@ class SQLiteBM25:
             for i in range(0, len(data_tuples), BATCH_SIZE):
                 batch = data_tuples[i:i+BATCH_SIZE]
                 cursor.executemany("INSERT INTO documents (content, metadata, id, raw_content) VALUES (?, ?, ?, ?)", batch)
+                self.ledger.add(cursor, [t[2] for t in batch])
                 conn.commit()
         except Exception as e:
             print(f"Index Error: {e}")
@@ -105,7 +129,7 @@ class SQLiteBM25:
         Search utilizing FTS5 BM25 ranking.
         """
         # Tokenize query exactly like documents
-        tokenized_query = ViTokenizer.tokenize(query)
+        tokenized_query = _tokenize(query)
         
         # [FIX] Sanitize query for FTS5
         # 1. Split into tokens
@@ -149,12 +173,27 @@ class SQLiteBM25:
             return []
 
     def get_existing_ids(self):
-        """Return set of all doc IDs currently in FTS index."""
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM documents")
-        # Fetch all as set
-        return {row[0] for row in cursor.fetchall()}
+        """Return set of all doc IDs currently in FTS index (materialized; prefer iter_ids)."""
+        ids = set()
+        for page in self.iter_ids():
+            ids.update(page)
+        return ids
+
+    def iter_ids(self, batch_size=10000):
+        """Keyset-paginated iteration over indexed doc IDs (ordered). Yields lists of IDs."""
+        yield from self.ledger.iter_ids(self._get_conn().cursor(), batch_size)
+
+    def filter_missing(self, ids):
+        """Return the subset of 'ids' NOT present in the index."""
+        present = self.ledger.existing(self._get_conn().cursor(), ids)
+        return [doc_id for doc_id in ids if doc_id not in present]
+
+    def id_digests(self):
+        """Per-segment (count, xor) digests of indexed IDs."""
+        return self.ledger.digests(self._get_conn().cursor())
+
+    def ids_in_segment(self, segment):
+        return self.ledger.ids_in_segment(self._get_conn().cursor(), segment)
 
     def delete_documents(self, doc_ids):
         """Remove specific docs by ID."""
@@ -170,6 +209,7 @@ class SQLiteBM25:
             batch = list_ids[i:i+BATCH]
             placeholders = ','.join(['?'] * len(batch))
             cursor.execute(f"DELETE FROM documents WHERE id IN ({placeholders})", batch)
+        self.ledger.remove(cursor, list_ids)
         
         conn.commit()
         print("Deletion committed.")
@@ -182,13 +222,13 @@ class SQLiteBM25:
             self.local.conn.close()
 
 # Integration Helper
-def migrate_to_sqlite(vector_store):
-    print("Migrating In-Memory Data to SQLite...")
-    docs_text, docs_meta, docs_ids = vector_store.get_all_documents()
-    
+def migrate_to_sqlite(vector_store, batch_size=2000):
+    print("Migrating VectorStore Data to SQLite (Paginated)...")
     db = SQLiteBM25()
     # Clear old data?
     # db.conn.execute("DELETE FROM documents")
     
-    db.index_documents(docs_text, docs_meta, docs_ids)
+    # Stream page by page: constant memory regardless of corpus size
+    for docs_text, docs_meta, docs_ids in vector_store.iter_documents(batch_size=batch_size):
+        db.index_documents(docs_text, docs_meta, docs_ids)
     return db
@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import queue
+import shutil
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+
+
+class _Worker:
+    """One pre-started interpreter (src/sandbox_worker.py) talking line-delimited JSON."""
+    def __init__(self, preload, memory_mb):
+        self.workdir = tempfile.mkdtemp(prefix="pysandbox_")
+        env = dict(os.environ)
+        env.update({
+            "SANDBOX_PRELOAD": ",".join(preload),
+            "SANDBOX_MEMORY_MB": str(memory_mb or 0),
+            # One BLAS thread per worker: the pool provides the parallelism
+            "OPENBLAS_NUM_THREADS": "1", "OMP_NUM_THREADS": "1", "MKL_NUM_THREADS": "1",
+            "PYTHONIOENCODING": "utf-8",
+        })
+        self.proc = subprocess.Popen(
+            [sys.executable, "-u", WORKER_SCRIPT],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            cwd=self.workdir, env=env, text=True, encoding="utf-8"
+        )
+        self.jobs = 0
+        self.crashed = False
+        self._replies = queue.Queue()
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def _read_loop(self):
+        for line in self.proc.stdout:
+            try:
+                self._replies.put(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        self.crashed = True
+        self._replies.put(None) # EOF: worker died
+
+    def wait_ready(self, timeout):
+        reply = self._replies.get(timeout=timeout)
+        if not reply or not reply.get("ready"):
+            raise RuntimeError("sandbox worker failed to start")
+
+    def run(self, code, timeout):
+        """Returns the worker reply, or None if the worker crashed / hung (caller must recycle it)."""
+        self.jobs += 1
+        try:
+            self.proc.stdin.write(json.dumps({"code": code, "timeout": timeout}, ensure_ascii=False) + "\n")
+            self.proc.stdin.flush()
+            # In-worker timers fire at 'timeout'; the grace period covers code stuck in C extensions
+            return self._replies.get(timeout=timeout + 2.0)
+        except (queue.Empty, OSError, ValueError):
+            return None
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def close(self):
+        try:
+            if self.alive():
+                self.proc.kill()
+            self.proc.wait(timeout=2)
+        except Exception:
+            pass
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class PythonWorkerPool:
+    """
+    Pool of warm Python interpreters for the execute_python tool.
+
+    Workers are started once (math libraries pre-imported) and reused: each job gets fresh
+    globals and builtins, a wall-clock/CPU timeout and the worker's RLIMIT_AS memory cap. A
+    worker is replaced after 'max_jobs' jobs, after a timeout, when it crashes, or when a job
+    changed interpreter state the next job would see (module attributes, new imports).
+    Replacements start in the background; jobs keep using the other workers meanwhile.
+
+    Args:
+        size (int): Number of workers.
+        max_jobs (int): Jobs per worker before it is recycled.
+        memory_mb (int): Address-space limit per worker (0 = unlimited).
+        preload (list): Modules imported at worker start.
+        start_timeout (float): Max seconds to wait for a worker to become ready.
+    """
+    def __init__(self, size=4, max_jobs=50, memory_mb=2048, preload=(), start_timeout=60.0):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.memory_mb = memory_mb
+        self.preload = list(preload)
+        self.start_timeout = start_timeout
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = 0
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="pysandbox")
+        self.stats = {"jobs": 0, "timeouts": 0, "crashes": 0, "tainted": 0, "recycled": 0}
+
+    def _spawn(self):
+        worker = _Worker(self.preload, self.memory_mb)
+        try:
+            worker.wait_ready(self.start_timeout)
+        except Exception:
+            worker.close()
+            raise
+        return worker
+
+    def warm_up(self):
+        """Starts all workers now (in parallel) instead of on first use."""
+        with self._lock:
+            missing = self.size - self._started
+            self._started = self.size
+        workers = list(self._executor.map(lambda _: self._spawn(), range(missing)))
+        for w in workers:
+            self._idle.put(w)
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                spawn = self._started < self.size and self._idle.empty()
+                if spawn:
+                    self._started += 1
+            if spawn:
+                try:
+                    return self._spawn()
+                except Exception:
+                    with self._lock:
+                        self._started -= 1
+                    raise
+            try:
+                return self._idle.get(timeout=1.0)
+            except queue.Empty:
+                continue # Re-check: a failed respawn frees its slot
+
+    def _checkin(self, worker, healthy):
+        if self._closed:
+            worker.close()
+            return
+        if healthy and worker.alive() and worker.jobs < self.max_jobs:
+            self._idle.put(worker)
+            return
+        worker.close()
+        with self._lock:
+            self.stats["recycled"] += 1
+        # The replacement boots off the caller's thread (interpreter start + preload imports)
+        threading.Thread(target=self._respawn, name="pysandbox-respawn", daemon=True).start()
+
+    def _respawn(self):
+        try:
+            worker = self._spawn()
+        except Exception as e:
+            logger.error(f"  [Sandbox] Could not restart worker: {e}")
+            with self._lock:
+                self._started -= 1
+            return
+        if self._closed:
+            worker.close()
+            return
+        self._idle.put(worker)
+
+    def run(self, code: str, timeout: float = 5) -> str:
+        """
+        Executes one snippet and returns its output in the Executor.execute format
+        (stdout, 'Error: ...' or the timeout message).
+        """
+        worker = self._checkout()
+        reply = worker.run(code, timeout)
+        healthy = bool(reply) and not reply.get("timed_out") and not reply.get("tainted")
+        with self._lock:
+            self.stats["jobs"] += 1
+            if reply is None:
+                self.stats["crashes" if worker.crashed else "timeouts"] += 1
+            elif reply.get("timed_out"):
+                self.stats["timeouts"] += 1
+            elif reply.get("tainted"):
+                self.stats["tainted"] += 1
+        self._checkin(worker, healthy)
+
+        if reply is None:
+            if worker.crashed:
+                return "Error: Execution crashed (worker terminated)."
+            return f"Error: Execution timed out (limit: {timeout}s)."
+        if reply.get("timed_out"):
+            return f"Error: Execution timed out (limit: {timeout}s)."
+        if not reply.get("ok"):
+            return f"Error: {reply.get('stderr', '').strip()}"
+        output = reply.get("stdout", "").strip()
+        if not output:
+            return "Code executed successfully but printed nothing."
+        return output
+
+    def map(self, codes: list, timeout: float = 5) -> list:
+        """Runs snippets in parallel across the pool; outputs are returned in input order."""
+        if len(codes) <= 1:
+            return [self.run(c, timeout) for c in codes]
+        return list(self._executor.map(lambda c: self.run(c, timeout), codes))
+
+    def close(self):
+        self._closed = True
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+        self._executor.shutdown(wait=False)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_python_pool():
+    """Process-wide worker pool configured from config.py (created on first use)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                import atexit
+                from .config import PYTHON_POOL_SIZE, PYTHON_POOL_MAX_JOBS, PYTHON_POOL_MEMORY_MB, PYTHON_POOL_PRELOAD
+                _pool = PythonWorkerPool(size=PYTHON_POOL_SIZE, max_jobs=PYTHON_POOL_MAX_JOBS,
+                                         memory_mb=PYTHON_POOL_MEMORY_MB, preload=PYTHON_POOL_PRELOAD)
+                atexit.register(_pool.close)
+    return _pool
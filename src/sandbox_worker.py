@@ -0,0 +1,137 @@
+import os
+import io
+import sys
+import json
+import time
+import signal
+import builtins
+import traceback
+import contextlib
+
+# Long-lived worker behind src/sandbox.py (PythonWorkerPool). Runs standalone (no 'src' imports).
+# Protocol: one JSON request per line on the original stdin ({"code", "timeout"}), one JSON
+# reply per line on the original stdout ({"ok", "stdout", "stderr", "timed_out", "tainted"}).
+# User code sees /dev/null as fd 0/1 so nothing it does can corrupt the protocol stream.
+# Each job gets its own globals and builtins dict; a job that still changes shared interpreter
+# state (module attributes, the builtins module, new imports) marks the worker "tainted" and
+# the pool replaces it instead of handing that state to the next job.
+
+PRELOAD = [m for m in os.environ.get("SANDBOX_PRELOAD", "").split(",") if m]
+MEMORY_MB = int(os.environ.get("SANDBOX_MEMORY_MB", "0") or 0)
+
+
+class JobTimeout(BaseException):
+    """Raised inside user code when the job's wall-clock or CPU budget is exhausted."""
+
+
+def _on_timeout(signum, frame):
+    raise JobTimeout()
+
+
+def _setup():
+    proto_in = os.fdopen(os.dup(0), "r", encoding="utf-8")
+    proto_out = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+
+    try:
+        import resource
+        if MEMORY_MB:
+            limit = MEMORY_MB * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        signal.signal(signal.SIGXCPU, _on_timeout)
+    except (ImportError, ValueError, OSError):
+        pass
+    signal.signal(signal.SIGALRM, _on_timeout)
+
+    # Warm imports: snippets importing these later only pay a dict lookup
+    for name in PRELOAD:
+        try:
+            __import__(name)
+        except Exception:
+            pass
+    return proto_in, proto_out
+
+
+def _set_cpu_budget(seconds):
+    """Soft RLIMIT_CPU = CPU used so far + budget (SIGXCPU -> JobTimeout)."""
+    try:
+        import resource
+        used = resource.getrusage(resource.RUSAGE_SELF)
+        spent = int(used.ru_utime + used.ru_stime)
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        soft = spent + max(1, int(seconds) + 1)
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def module_state():
+    """Identity fingerprint of every loaded module's attributes (rebinding or adding one changes it)."""
+    return {name: tuple((k, id(v)) for k, v in list(vars(m).items()))
+            for name, m in list(sys.modules.items()) if m is not None and hasattr(m, "__dict__")}
+
+
+def run_job(code, timeout):
+    out, err = io.StringIO(), io.StringIO()
+    # Fresh globals and a private copy of the builtins per job
+    job_globals = {"__name__": "__main__", "__builtins__": dict(vars(builtins))}
+    if "decimal" in sys.modules: # Thread-local context (precision, rounding) outlives the job otherwise
+        sys.modules["decimal"].setcontext(sys.modules["decimal"].Context())
+    ok, timed_out = True, False
+
+    _set_cpu_budget(timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            try:
+                exec(compile(code, "<string>", "exec"), job_globals)
+            except SystemExit as e:
+                if e.code not in (None, 0):
+                    ok = False
+                    if not isinstance(e.code, int):
+                        err.write(f"{e.code}\n")
+            except JobTimeout:
+                raise
+            except MemoryError:
+                ok = False
+                err.write("MemoryError: memory limit exceeded\n")
+            except BaseException as e:
+                ok = False
+                # Drop this module's exec() frame so the traceback reads like 'python -c'
+                tb = e.__traceback__.tb_next if e.__traceback__ else None
+                err.write("Traceback (most recent call last):\n" if tb else "")
+                err.write("".join(traceback.format_tb(tb)) if tb else "")
+                err.write("".join(traceback.format_exception_only(type(e), e)))
+    except JobTimeout:
+        ok, timed_out = False, True
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    return {"ok": ok, "stdout": out.getvalue(), "stderr": err.getvalue(), "timed_out": timed_out}
+
+
+def main():
+    proto_in, proto_out = _setup()
+    proto_out.write(json.dumps({"ready": True, "pid": os.getpid()}) + "\n")
+    proto_out.flush()
+
+    state = module_state()
+    for line in proto_in:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        t0 = time.time()
+        reply = run_job(job.get("code") or "", float(job.get("timeout") or 5))
+        after = module_state()
+        reply["tainted"] = after != state
+        state = after
+        reply["elapsed"] = round(time.time() - t0, 4)
+        proto_out.write(json.dumps(reply, ensure_ascii=False) + "\n")
+        proto_out.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from .logger import setup_logger
+from .concurrency import limiter_stats
+from .tracing import get_tracer
+
+logger = setup_logger(__name__)
+
+
+class ServerMetrics:
+    """
+    Thread-safe counters exposed on /metrics (Prometheus text format).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.requests_total = 0
+        self.errors_total = 0
+        self.questions_total = 0
+        self.in_flight = 0
+        self.latency_sum = 0.0
+
+    def begin(self, n_questions):
+        with self._lock:
+            self.requests_total += 1
+            self.questions_total += n_questions
+            self.in_flight += 1
+
+    def end(self, duration, error=False):
+        with self._lock:
+            self.in_flight -= 1
+            self.latency_sum += duration
+            if error:
+                self.errors_total += 1
+
+    def render(self, solver):
+        with self._lock:
+            lines = [
+                "# TYPE vnpt_server_uptime_seconds gauge",
+                f"vnpt_server_uptime_seconds {time.time() - self.started_at:.3f}",
+                "# TYPE vnpt_solve_requests_total counter",
+                f"vnpt_solve_requests_total {self.requests_total}",
+                "# TYPE vnpt_solve_errors_total counter",
+                f"vnpt_solve_errors_total {self.errors_total}",
+                "# TYPE vnpt_solve_questions_total counter",
+                f"vnpt_solve_questions_total {self.questions_total}",
+                "# TYPE vnpt_solve_in_flight gauge",
+                f"vnpt_solve_in_flight {self.in_flight}",
+                "# TYPE vnpt_solve_latency_seconds_sum counter",
+                f"vnpt_solve_latency_seconds_sum {self.latency_sum:.3f}",
+            ]
+        retriever = solver._retriever
+        lines += [
+            "# TYPE vnpt_api_requests_total counter",
+            f'vnpt_api_requests_total{{kind="inference"}} {solver.client.get_request_count()}',
+            f'vnpt_api_requests_total{{kind="embedding"}} {retriever.get_request_count() if retriever else 0}',
+        ]
+        cache_stats = solver.client.get_cache_stats()
+        if cache_stats:
+            lines += [
+                "# TYPE vnpt_llm_cache_hits_total counter",
+                f"vnpt_llm_cache_hits_total {cache_stats['hits']}",
+                "# TYPE vnpt_llm_cache_misses_total counter",
+                f"vnpt_llm_cache_misses_total {cache_stats['misses']}",
+                "# TYPE vnpt_llm_cache_entries gauge",
+                f"vnpt_llm_cache_entries {cache_stats['entries']}",
+            ]
+        limiters = limiter_stats()
+        if limiters:
+            lines += ["# TYPE vnpt_concurrency_limit gauge"]
+            lines += [f'vnpt_concurrency_limit{{endpoint="{name}"}} {snap["limit"]}' for name, snap in limiters.items()]
+            lines += ["# TYPE vnpt_concurrency_overloads_total counter"]
+            lines += [f'vnpt_concurrency_overloads_total{{endpoint="{name}"}} {snap["overloads"]}' for name, snap in limiters.items()]
+        lines += [
+            "# TYPE vnpt_retriever_loaded gauge",
+            f"vnpt_retriever_loaded {1 if retriever else 0}",
+        ]
+        # Span latency summaries (RAG, LLM calls, tool exec, ...) since startup
+        return "\n".join(lines) + "\n" + get_tracer().render_prometheus()
+
+
+class SolverRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP front-end for a resident BatchSolver.
+
+    Endpoints:
+        GET  /health   -> JSON status (retriever/reranker loaded, in-flight requests).
+        GET  /metrics  -> Prometheus text metrics.
+        POST /solve    -> Body: one question or a list (test.json schema).
+                          Answers are streamed as NDJSON (one line per question, as soon as
+                          it is final) followed by {"done": true, "count": n}.
+                          '?stream=0' returns a single JSON array instead.
+
+    Concurrent /solve requests are run one at a time on the shared solver: its run state
+    (dedup / packing / latency statistics, domain cache, journal) belongs to one run, and
+    each run already fans out over the solver's worker pools.
+    """
+    protocol_version = "HTTP/1.1" # Required for chunked streaming
+
+    # Set by create_server()
+    solver = None
+    metrics = None
+    solve_lock = None
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            retriever = self.solver._retriever
+            reranker = getattr(retriever, 'reranker', None) if retriever else None
+            self._send_json(200, {
+                "status": "ok",
+                "retriever_loaded": retriever is not None,
+                "reranker_loaded": bool(reranker),
+                "in_flight": self.metrics.in_flight,
+                "uptime_s": round(time.time() - self.metrics.started_at, 3)
+            })
+        elif path == "/metrics":
+            body = self.metrics.render(self.solver).encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": f"Unknown path {path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/solve":
+            self._send_json(404, {"error": f"Unknown path {url.path}"})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length).decode('utf-8'))
+        except Exception as e:
+            self._send_json(400, {"error": f"Invalid JSON body: {e}"})
+            return
+
+        items = payload if isinstance(payload, list) else [payload]
+        if not items or not all(isinstance(it, dict) and (it.get('id') or it.get('qid')) for it in items):
+            self._send_json(400, {"error": "Each question needs an 'id' (or 'qid'), 'question' and 'choices'."})
+            return
+        # Work on copies: the solver annotates items in place
+        items = [dict(it) for it in items]
+
+        stream = parse_qs(url.query).get('stream', ['1'])[0] != '0'
+        self.metrics.begin(len(items))
+        t0 = time.time()
+        error = False
+        try:
+            if stream:
+                self._solve_streaming(items)
+            else:
+                with self.solve_lock:
+                    results = self.solver.solve_items(items)
+                self._send_json(200, [self._public(r) for r in results])
+        except (BrokenPipeError, ConnectionResetError):
+            error = True
+            logger.warning("Client disconnected before the response was complete.")
+        except Exception as e:
+            error = True
+            logger.error(f"Solve request failed: {e}")
+        finally:
+            self.metrics.end(time.time() - t0, error=error)
+
+    def _solve_streaming(self, items):
+        results_queue = queue.Queue()
+        done = object()
+        failure = []
+
+        def worker():
+            try:
+                with self.solve_lock:
+                    self.solver.solve_items(items, on_result=results_queue.put)
+            except Exception as e:
+                failure.append(e)
+            finally:
+                results_queue.put(done)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        count = 0
+        while True:
+            result = results_queue.get()
+            if result is done:
+                break
+            self._write_chunk(self._public(result))
+            count += 1
+
+        tail = {"done": True, "count": count}
+        if failure:
+            tail["error"] = str(failure[0])
+        self._write_chunk(tail)
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+        if failure:
+            raise failure[0]
+
+    def _write_chunk(self, obj):
+        data = (json.dumps(obj, ensure_ascii=False) + "\n").encode('utf-8')
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    @staticmethod
+    def _public(result):
+        """Drops internal fields ('_index', '_formatted_text', ...)."""
+        return {k: v for k, v in result.items() if not k.startswith('_')}
+
+    def _send_json(self, status, obj):
+        body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix sockets have no (host, port) client address
+        return self.client_address[0] if isinstance(self.client_address, tuple) and self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        logger.debug(f"[Server] {self.address_string()} - {format % args}")
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def create_server(host="127.0.0.1", port=8000, unix_socket=None, solver=None, warm_up=True):
+    """
+    Builds the resident inference server (not started).
+
+    Args:
+        host (str): Bind address for TCP mode.
+        port (int): TCP port (0 = pick a free port).
+        unix_socket (str, optional): If set, listen on this Unix domain socket instead of TCP.
+        solver (BatchSolver, optional): Pre-built solver (a new one is created otherwise).
+        warm_up (bool): Load the Retriever/Reranker before accepting requests.
+
+    Returns:
+        socketserver.BaseServer: Call serve_forever() / shutdown() on it.
+    """
+    if solver is None:
+        from .batch_solver import BatchSolver
+        solver = BatchSolver()
+
+    if warm_up:
+        t0 = time.time()
+        logger.info("[Server] Warming up Retriever + Reranker...")
+        loaded = solver.warm_up()
+        logger.info(f"[Server] Warm-up finished in {time.time() - t0:.1f}s (retriever loaded: {loaded}).")
+
+    handler = type("BoundSolverRequestHandler", (SolverRequestHandler,), {
+        "solver": solver,
+        "metrics": ServerMetrics(),
+        "solve_lock": threading.Lock()
+    })
+
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        httpd = ThreadingUnixHTTPServer(unix_socket, handler)
+        logger.info(f"[Server] Listening on unix:{unix_socket}")
+    else:
+        httpd = ThreadingHTTPServer((host, port), handler)
+        httpd.daemon_threads = True
+        logger.info(f"[Server] Listening on http://{host}:{httpd.server_address[1]}")
+    return httpd
+
+
+def serve(host="127.0.0.1", port=8000, unix_socket=None, warm_up=True):
+    """Runs the resident inference server until interrupted (see create_server)."""
+    httpd = create_server(host=host, port=port, unix_socket=unix_socket, warm_up=warm_up)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("[Server] Stopping...")
+    finally:
+        httpd.server_close()
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
@@ -6,19 +6,26 @@ import logging
 # Use basic logging for utils if not fully configured elsewhere
 logger = logging.getLogger(__name__)
 
-def estimate_tokens(text: str) -> float:
+def estimate_tokens(text: str, model: str = None) -> float:
     """
     Estimates the number of tokens in a text string.
     
     Args:
         text (str): The input text.
+        model (str, optional): Model whose learned calibration is applied (see src/tokens.py).
     
     Returns:
-        float: Estimated token count (heuristic: 1 token ~= 2.5 characters for Vietnamese/English mix).
+        float: Estimated token count (tokenizer or character-class heuristic, calibrated per model).
     """
     if not text:
         return 0
-    return len(text) / 2.5
+    from .tokens import get_token_counter
+    return get_token_counter().count(text, model)
+
+def estimate_item_tokens(item: dict, model: str = None) -> float:
+    """Token estimate of an item's '_formatted_text' (count cached on the item until the text changes)."""
+    from .tokens import get_token_counter
+    return get_token_counter().count_item(item, model)
 
 def clean_answer(text: str, labels: list) -> str:
     """
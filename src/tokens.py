@@ -0,0 +1,177 @@
+import os
+import re
+import json
+import threading
+
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_ASCII_LETTERS = re.compile(r"[A-Za-z]")
+_NON_ASCII_LETTERS = re.compile(r"[^\x00-\x7F\W]") # Vietnamese diacritics, other scripts
+_DIGITS = re.compile(r"\d")
+_SYMBOLS = re.compile(r"[^\w\s]") # Punctuation, LaTeX '\', '{', '^', ...
+_WORDS = re.compile(r"\w+")
+
+
+class HeuristicBackend:
+    """
+    Tokenizer-free estimate from character classes (fast, no dependencies).
+
+    Weights approximate a BPE vocabulary: plain ASCII runs merge into long tokens, accented
+    Vietnamese letters and digits split often, LaTeX/punctuation is ~1 token per symbol.
+    Per-model calibration (TokenCounter) corrects the overall scale.
+    """
+    name = "heuristic"
+
+    def count(self, text: str) -> float:
+        ascii_letters = len(_ASCII_LETTERS.findall(text))
+        non_ascii = len(_NON_ASCII_LETTERS.findall(text))
+        digits = len(_DIGITS.findall(text))
+        symbols = len(_SYMBOLS.findall(text))
+        words = len(_WORDS.findall(text))
+        return ascii_letters / 4.0 + non_ascii / 1.5 + digits / 2.0 + symbols + words * 0.35
+
+
+class HFTokenizerBackend:
+    """
+    Exact counts from a Hugging Face 'tokenizers' tokenizer (tokenizer.json path or hub name).
+    Use the tokenizer of the served model when it is known.
+    """
+    def __init__(self, name_or_path):
+        from tokenizers import Tokenizer
+        if os.path.exists(name_or_path):
+            self.tokenizer = Tokenizer.from_file(name_or_path)
+        else:
+            self.tokenizer = Tokenizer.from_pretrained(name_or_path)
+        self.name = f"hf:{name_or_path}"
+
+    def count(self, text: str) -> float:
+        return float(len(self.tokenizer.encode(text, add_special_tokens=False).ids))
+
+
+class TokenCounter:
+    """
+    Pluggable token counter with per-model calibration.
+
+    count() = backend count x calibration factor of the model. The factor is learned from
+    the 'usage.prompt_tokens' the API reports for prompts we counted ourselves (decayed
+    ratio of sums, so recent observations dominate), and persisted between runs.
+
+    Args:
+        backend: Object with count(text) -> float.
+        calibration_path (str, optional): JSON file for learned factors.
+        decay (float): Weight kept by older observations per new one.
+        min_observations (int): Observations before a learned factor is used.
+    """
+    def __init__(self, backend=None, calibration_path=None, decay=0.95, min_observations=3):
+        self.backend = backend or HeuristicBackend()
+        self.calibration_path = calibration_path
+        self.decay = decay
+        self.min_observations = min_observations
+        self._lock = threading.Lock()
+        self._cal = {} # model -> {"actual": float, "estimated": float, "n": int}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not self.calibration_path or not os.path.exists(self.calibration_path):
+            return
+        try:
+            with open(self.calibration_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("backend") == self.backend.name:
+                self._cal = data.get("models", {})
+        except Exception as e:
+            logger.warning(f"  [Tokens] Could not read calibration {self.calibration_path}: {e}")
+
+    def factor(self, model=None) -> float:
+        with self._lock:
+            cal = self._cal.get(model) if model else None
+            if not cal or cal["n"] < self.min_observations or cal["estimated"] <= 0:
+                return 1.0
+            return min(max(cal["actual"] / cal["estimated"], 0.2), 5.0)
+
+    def raw(self, text: str) -> float:
+        return self.backend.count(text) if text else 0.0
+
+    def count(self, text: str, model=None) -> float:
+        """Calibrated token estimate of a text for a model."""
+        if not text:
+            return 0
+        return self.raw(text) * self.factor(model)
+
+    def count_item(self, item: dict, model=None, field='_formatted_text') -> float:
+        """
+        Calibrated count of an item's prompt text. The raw count is cached on the item
+        and reused while the text object is unchanged (tool outputs append -> recount).
+        """
+        text = item.get(field, '')
+        cached = item.get('_tok')
+        if cached is not None and cached[0] is text:
+            raw = cached[1]
+        else:
+            raw = self.raw(text)
+            item['_tok'] = (text, raw)
+        return raw * self.factor(model)
+
+    def count_messages(self, messages: list, tools=None) -> float:
+        """Raw count of a chat request (message contents + tool schemas)."""
+        total = sum(self.raw(m.get('content') or '') for m in messages)
+        if tools:
+            total += self.raw(json.dumps(tools, ensure_ascii=False))
+        return total
+
+    def observe(self, model: str, estimated_raw: float, actual: int):
+        """Feeds one API 'usage.prompt_tokens' observation for a prompt whose raw count was 'estimated_raw'."""
+        if not model or not actual or estimated_raw <= 0:
+            return
+        with self._lock:
+            cal = self._cal.setdefault(model, {"actual": 0.0, "estimated": 0.0, "n": 0})
+            cal["actual"] = cal["actual"] * self.decay + actual
+            cal["estimated"] = cal["estimated"] * self.decay + estimated_raw
+            cal["n"] += 1
+            self._dirty = True
+
+    def save(self):
+        if not self.calibration_path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"backend": self.backend.name, "models": {k: dict(v) for k, v in self._cal.items()}}
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.calibration_path)), exist_ok=True)
+            tmp_path = self.calibration_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.calibration_path)
+        except Exception as e:
+            logger.error(f"  [Tokens] Failed to save calibration: {e}")
+
+    def stats(self):
+        return {model: round(self.factor(model), 3) for model in list(self._cal)}
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def get_token_counter() -> TokenCounter:
+    """Process-wide TokenCounter configured from config.py (TOKENIZER_PATH, TOKEN_CALIBRATION_PATH)."""
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                from .config import TOKENIZER_PATH, TOKEN_CALIBRATION_PATH
+                backend = None
+                if TOKENIZER_PATH:
+                    try:
+                        backend = HFTokenizerBackend(TOKENIZER_PATH)
+                    except Exception as e:
+                        logger.warning(f"  [Tokens] Tokenizer '{TOKENIZER_PATH}' unavailable ({e}). Using heuristic counts.")
+                _counter = TokenCounter(backend, calibration_path=TOKEN_CALIBRATION_PATH)
+                import atexit
+                atexit.register(_counter.save)
+    return _counter
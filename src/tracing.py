@@ -0,0 +1,278 @@
+import contextvars
+import itertools
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Span open in the current thread / context (parent of spans started inside it)
+_current = contextvars.ContextVar("trace_span", default=None)
+# Innermost charged() block: (items, weights, [seconds moved to other stages])
+_charge = contextvars.ContextVar("timeline_charge", default=None)
+
+
+class Span:
+    """
+    One timed operation. Times are time.perf_counter() values (monotonic); 'trace_id' is the
+    question ID the span belongs to (inherited from the parent), batch spans list theirs in
+    attrs['qids'].
+    """
+    __slots__ = ('name', 'span_id', 'parent_id', 'trace_id', 'start', 'end', 'attrs')
+
+    def __init__(self, name, span_id, parent, trace_id, start, attrs):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = trace_id if trace_id is not None else (parent.trace_id if parent else None)
+        self.start = start
+        self.end = None
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+
+class _NoopSpan:
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of a sorted list (the ceil(q * n)-th value)."""
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class Tracer:
+    """
+    Lightweight in-process tracing (no external dependencies).
+
+    Spans nest through a context variable: a span started while another is open in the same
+    thread becomes its child and inherits its question ID. Finished spans are kept in a bounded
+    buffer for export. Per-name count, total and max are exact; percentiles come from the
+    last 'window' durations of each name, so a long-running server stays bounded.
+
+    Args:
+        enabled (bool): False turns span() / record() into no-ops.
+        max_spans (int): Finished spans kept for export (oldest dropped first).
+        window (int): Recent durations per span name kept for percentiles.
+    """
+    def __init__(self, enabled=True, max_spans=200000, window=10000):
+        self.enabled = enabled
+        self.origin = time.perf_counter()
+        self.wall_origin = time.time()
+        self.spans = deque(maxlen=max_spans)
+        self.durations = defaultdict(lambda: deque(maxlen=window)) # name -> recent seconds
+        self.totals = defaultdict(lambda: [0, 0.0, 0.0]) # name -> [count, total seconds, max]
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def now():
+        return time.perf_counter()
+
+    @contextmanager
+    def span(self, name, trace_id=None, **attrs):
+        """Times the enclosed block as a child of the current span."""
+        if not self.enabled:
+            yield _NOOP
+            return
+        span = Span(name, next(self._ids), _current.get(), trace_id, self.now(), attrs)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attrs['error'] = type(e).__name__
+            raise
+        finally:
+            _current.reset(token)
+            span.end = self.now()
+            self._finish(span)
+
+    def record(self, name, start, end=None, trace_id=None, **attrs):
+        """Adds an already measured span (start/end from now()) under the current span."""
+        if not self.enabled:
+            return
+        span = Span(name, next(self._ids), _current.get(), trace_id, start, attrs)
+        span.end = self.now() if end is None else end
+        self._finish(span)
+
+    def annotate(self, **attrs):
+        """Sets attributes on the current span (if any)."""
+        span = _current.get()
+        if span is not None:
+            span.set(**attrs)
+
+    def _finish(self, span):
+        duration = span.end - span.start
+        with self._lock:
+            self.spans.append(span)
+            self.durations[span.name].append(duration)
+            totals = self.totals[span.name]
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] = max(totals[2], duration)
+
+    def summary(self) -> dict:
+        """name -> {count, total_s, p50, p95, p99, max} (seconds; percentiles over the recent window)."""
+        with self._lock:
+            durations = {name: sorted(values) for name, values in self.durations.items()}
+            totals = {name: list(values) for name, values in self.totals.items()}
+        return {name: {
+            "count": totals[name][0],
+            "total_s": round(totals[name][1], 3),
+            "p50": round(percentile(values, 0.50), 4),
+            "p95": round(percentile(values, 0.95), 4),
+            "p99": round(percentile(values, 0.99), 4),
+            "max": round(totals[name][2], 4)
+        } for name, values in durations.items() if values}
+
+    def to_dict(self, span) -> dict:
+        return {
+            "name": span.name,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "trace_id": span.trace_id,
+            "ts": round(self.wall_origin + (span.start - self.origin), 6),
+            "start_s": round(span.start - self.origin, 6),
+            "duration_s": round(span.end - span.start, 6),
+            "attrs": span.attrs
+        }
+
+    def render_prometheus(self, prefix="vnpt_span") -> str:
+        """Span latency summaries in Prometheus text format."""
+        summary = self.summary()
+        if not summary:
+            return ""
+        lines = [f"# TYPE {prefix}_seconds summary"]
+        for name, s in sorted(summary.items()):
+            for q in ("p50", "p95", "p99"):
+                lines.append(f'{prefix}_seconds{{span="{name}",quantile="0.{q[1:]}"}} {s[q]}')
+            lines.append(f'{prefix}_seconds_sum{{span="{name}"}} {s["total_s"]}')
+            lines.append(f'{prefix}_seconds_count{{span="{name}"}} {s["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str):
+        """Writes the buffered spans as JSONL, or the summary as Prometheus text if path ends with '.prom'."""
+        if not self.enabled or not path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with self._lock:
+            spans = list(self.spans)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            if path.endswith('.prom'):
+                f.write(self.render_prometheus())
+            else:
+                for span in spans:
+                    f.write(json.dumps(self.to_dict(span), ensure_ascii=False, default=str) + "\n")
+        os.replace(tmp_path, path)
+        logger.info(f"[Trace] Exported {len(spans)} spans to {path}")
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """Process-wide tracer configured from config.py (a disabled tracer if TRACING_ENABLED is off)."""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                from .config import TRACING_ENABLED, TRACE_MAX_SPANS
+                _tracer = Tracer(enabled=TRACING_ENABLED, max_spans=TRACE_MAX_SPANS)
+    return _tracer
+
+
+# --- Per-question latency attribution ('time' column of the submission) ---
+
+# 'queue' is time spent waiting for rate-limit / concurrency admission before an API call. It is
+# part of the question's graded time (the answer really was that late) but kept apart from 'llm'.
+TIMELINE_STAGES = ("rag", "classify", "llm", "tool", "queue")
+
+
+def charge_time(items, stage, seconds, weights=None):
+    """
+    Adds 'seconds' of work to the items' '_timeline' (stage -> seconds, accumulated over passes).
+    Shared work (a batched LLM call) is split by 'weights' (e.g. prompt tokens), else evenly.
+    """
+    if not items:
+        return
+    total = sum(weights) if weights else 0
+    for i, item in enumerate(items):
+        share = seconds * weights[i] / total if total else seconds / len(items)
+        timeline = item.setdefault('_timeline', {})
+        timeline[stage] = timeline.get(stage, 0.0) + share
+
+
+@contextmanager
+def charged(items, stage, weights=None):
+    """Charges the duration of the enclosed block to the items (see charge_time), minus charge_wait() time."""
+    t0 = time.perf_counter()
+    moved = [0.0]
+    token = _charge.set((items, weights, moved))
+    try:
+        yield
+    finally:
+        _charge.reset(token)
+        charge_time(items, stage, time.perf_counter() - t0 - moved[0], weights)
+
+
+def charge_wait(seconds, stage="queue"):
+    """Moves 'seconds' of the enclosing charged() block (if any) to another stage."""
+    current = _charge.get()
+    if current is None or seconds <= 0:
+        return
+    items, weights, moved = current
+    moved[0] += seconds
+    charge_time(items, stage, seconds, weights)
+
+
+def timeline_total(item) -> float:
+    return sum((item.get('_timeline') or {}).values())
+
+
+def attach_timeline(result, item):
+    """Sets the result's 'time' (total seconds), 'timeline' breakdown and 'domain' from its item."""
+    timeline = item.get('_timeline') or {}
+    result['time'] = timeline_total(item)
+    result['timeline'] = {stage: round(seconds, 4) for stage, seconds in timeline.items()}
+    result.setdefault('domain', item.get('domain'))
+    return result
+
+
+def timeline_by_domain(results) -> dict:
+    """
+    domain -> {count, p50, p95, p99, mean, stages: {stage: mean seconds}} of the results' 'time'/'timeline'.
+    Coalesced copies ('duplicate_of') did no work of their own and are left out.
+    """
+    groups = defaultdict(list)
+    for r in results:
+        if r.get('timeline') and not r.get('duplicate_of'):
+            groups[r.get('domain') or 'K'].append(r)
+    stats = {}
+    for domain, rs in sorted(groups.items()):
+        times = sorted(r.get('time', 0.0) for r in rs)
+        stats[domain] = {
+            "count": len(rs),
+            "p50": round(percentile(times, 0.50), 4),
+            "p95": round(percentile(times, 0.95), 4),
+            "p99": round(percentile(times, 0.99), 4),
+            "mean": round(sum(times) / len(times), 4),
+            "stages": {stage: round(sum(r['timeline'].get(stage, 0.0) for r in rs) / len(rs), 4) for stage in TIMELINE_STAGES}
+        }
+    return stats
@@ -6,15 +6,36 @@ import datetime
 import threading
 import subprocess
 import sys
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError: # Windows: flushes are only serialized within one process
+    fcntl = None
 
 class Executor:
     """
     Executes Python code in a safe subprocess environment.
+    Uses the warm worker pool (src/sandbox.py) when PYTHON_POOL_ENABLED, otherwise
+    one fresh interpreter per snippet.
     """
+    @staticmethod
+    def _pool():
+        from .config import PYTHON_POOL_ENABLED
+        if not PYTHON_POOL_ENABLED:
+            return None
+        try:
+            from .sandbox import get_python_pool
+            return get_python_pool()
+        except Exception as e:
+            print(f"[Executor] Worker pool unavailable ({e}). Falling back to subprocess per snippet.")
+            return None
+
     @staticmethod
     def execute(code: str, timeout: int = 5) -> str:
         """
         Executes the provided Python code and returns the stdout.
+        Deterministic snippets already run (same normalized code) are answered from the code cache.
         
         Args:
             code (str): The Python code to execute.
@@ -23,6 +44,53 @@ class Executor:
         Returns:
             str: Using stdout or error message.
         """
+        return Executor.execute_many([code], timeout)[0]
+
+    @staticmethod
+    def execute_many(codes: list, timeout: int = 5) -> list:
+        """Executes several snippets in parallel (pool) and returns their outputs in order."""
+        from .code_cache import get_code_cache, code_key
+        cache = get_code_cache()
+
+        outputs = [None] * len(codes)
+        todo = {} # key -> (code, [indexes], cacheable)
+        for i, code in enumerate(codes):
+            key, deterministic = code_key(code, timeout)
+            if cache and deterministic:
+                cached = cache.get(key)
+                if cached is not None:
+                    outputs[i] = cached
+                    continue
+            elif cache:
+                cache.note_bypass()
+                key = f"{key}:{i}" # Never share a run between non-deterministic snippets
+            todo.setdefault(key, (code, [], deterministic))[1].append(i)
+
+        from .tracing import get_tracer
+        get_tracer().annotate(cache_hits=len(codes) - sum(len(indexes) for _, indexes, _ in todo.values()))
+        if todo:
+            keys = list(todo)
+            results = Executor._run_many([todo[k][0] for k in keys], timeout)
+            for key, output in zip(keys, results):
+                code, indexes, deterministic = todo[key]
+                for i in indexes:
+                    outputs[i] = output
+                if cache and deterministic:
+                    cache.put(key, output)
+        return outputs
+
+    @staticmethod
+    def _run_many(codes: list, timeout: int = 5) -> list:
+        pool = Executor._pool()
+        if pool:
+            try:
+                return pool.map(codes, timeout)
+            except Exception as e:
+                print(f"[Executor] Worker pool error ({e}). Falling back to subprocess.")
+        return [Executor._execute_subprocess(c, timeout) for c in codes]
+
+    @staticmethod
+    def _execute_subprocess(code: str, timeout: int = 5) -> str:
         try:
             # Create a separate process to run the code
             # "python -c <code>"
@@ -43,64 +111,368 @@ class Executor:
                 return f"Error: {result.stderr.strip()}"
                 
         except subprocess.TimeoutExpired:
-            return "Error: Execution timed out (limit: 5s)."
+            return f"Error: Execution timed out (limit: {timeout}s)."
         except Exception as e:
             return f"System Error: {str(e)}"
 
+@contextmanager
+def _file_lock(path):
+    """Exclusive inter-process lock on a sidecar file (no-op without fcntl)."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
 class QuotaTracker:
-    def __init__(self, state_file="quota_tracker.json"):
+    """
+    Daily API usage counters (requests and tokens, per endpoint and per model).
+
+    add_usage() only updates in-memory counters under a lock; a background thread
+    flushes to 'state_file' every 'flush_interval' seconds (temp file + rename, so the
+    file is never half-written). On flush the file is re-read and this process' deltas
+    are added under an exclusive lock on '<state_file>.lock' (fcntl, POSIX), so several
+    processes can share one file without overwriting each other.
+
+    File format:
+        {"YYYY-MM-DD": {"requests": n, "tokens": n,
+                        "endpoints": {name: {"requests": n, "tokens": n}},
+                        "models": {name: {"requests": n, "tokens": n}}}}
+    Legacy {"YYYY-MM-DD": n} entries are read as request totals.
+
+    Args:
+        state_file (str): JSON file path.
+        flush_interval (float): Seconds between background flushes (0 = flush only on close).
+    """
+    def __init__(self, state_file="quota_tracker.json", flush_interval=5.0):
         self.state_file = state_file
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.pending = {}  # Deltas not yet written (same shape as a day entry)
+        self._stop = threading.Event()
         self.load()
 
-    def load(self):
+        self._flusher = None
+        if flush_interval:
+            self._flusher = threading.Thread(target=self._flush_loop, name="quota-flush", daemon=True)
+            self._flusher.start()
+        import atexit
+        atexit.register(self.close)
+
+    @staticmethod
+    def _empty_day():
+        return {"requests": 0, "tokens": 0, "endpoints": {}, "models": {}}
+
+    @classmethod
+    def _normalize(cls, state):
+        out = {}
+        for day, entry in (state or {}).items():
+            if isinstance(entry, (int, float)): # Legacy format
+                d = cls._empty_day()
+                d["requests"] = int(entry)
+                out[day] = d
+            elif isinstance(entry, dict):
+                d = cls._empty_day()
+                d.update(entry)
+                out[day] = d
+        return out
+
+    def _read_file(self):
         if os.path.exists(self.state_file):
             try:
                 with open(self.state_file, 'r') as f:
-                    self.state = json.load(f)
-            except:
-                self.state = {}
-        else:
-            self.state = {}
+                    return self._normalize(json.load(f))
+            except Exception:
+                return {}
+        return {}
+
+    def load(self):
+        with self.lock:
+            self.state = self._read_file()
 
     def get_today_key(self):
         return datetime.datetime.now().strftime("%Y-%m-%d")
 
-    def get_usage(self):
-        key = self.get_today_key()
-        return self.state.get(key, 0)
+    @staticmethod
+    def _add(day, count, tokens, endpoint, model):
+        day["requests"] += count
+        day["tokens"] += tokens
+        for group, name in (("endpoints", endpoint), ("models", model)):
+            if name:
+                slot = day[group].setdefault(name, {"requests": 0, "tokens": 0})
+                slot["requests"] += count
+                slot["tokens"] += tokens
 
-    def add_usage(self, count):
+    def add_usage(self, count=1, endpoint=None, model=None, tokens=0):
+        """Records usage in memory (no I/O)."""
         key = self.get_today_key()
-        self.state[key] = self.state.get(key, 0) + count
-        self.save()
+        with self.lock:
+            self._add(self.state.setdefault(key, self._empty_day()), count, tokens, endpoint, model)
+            self._add(self.pending.setdefault(key, self._empty_day()), count, tokens, endpoint, model)
+
+    def get_usage(self, endpoint=None, model=None, field="requests"):
+        """Today's usage (total, or for one endpoint / model)."""
+        with self.lock:
+            day = self.state.get(self.get_today_key())
+            if not day:
+                return 0
+            if endpoint:
+                return day["endpoints"].get(endpoint, {}).get(field, 0)
+            if model:
+                return day["models"].get(model, {}).get(field, 0)
+            return day.get(field, 0)
+
+    @classmethod
+    def _merge(cls, dst, src):
+        """Adds the day entries of 'src' into 'dst'."""
+        for key, delta in src.items():
+            day = dst.setdefault(key, cls._empty_day())
+            day["requests"] += delta["requests"]
+            day["tokens"] += delta["tokens"]
+            for group in ("endpoints", "models"):
+                for name, v in delta[group].items():
+                    slot = day[group].setdefault(name, {"requests": 0, "tokens": 0})
+                    slot["requests"] += v["requests"]
+                    slot["tokens"] += v["tokens"]
 
     def save(self):
-        with open(self.state_file, 'w') as f:
-            json.dump(self.state, f)
+        """Merges pending deltas into the file (atomic replace)."""
+        with self.lock:
+            if not self.pending:
+                return
+            pending, self.pending = self.pending, {}
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.state_file)), exist_ok=True)
+                # Read-merge-replace must not interleave with another process' flush
+                with _file_lock(f"{self.state_file}.lock"):
+                    merged = self._read_file()
+                    self._merge(merged, pending)
+                    tmp_path = f"{self.state_file}.{os.getpid()}.tmp"
+                    with open(tmp_path, 'w') as f:
+                        json.dump(merged, f)
+                    os.replace(tmp_path, self.state_file)
+                self.state = merged
+            except Exception as e:
+                self._merge(self.pending, pending) # Retry on the next flush
+                print(f"[QuotaTracker] Flush failed: {e}")
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.save()
+
+    def close(self):
+        """Stops the background flusher and writes the remaining deltas."""
+        self._stop.set()
+        if self._flusher and self._flusher.is_alive() and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=self.flush_interval + 1)
+        self.save()
+
+
+_quota_trackers = {}
+_quota_trackers_lock = threading.Lock()
+
+
+def get_quota_tracker(state_file="quota_tracker.json", flush_interval=5.0):
+    """Process-wide QuotaTracker per state file (one flusher thread, one set of counters)."""
+    path = os.path.abspath(state_file)
+    with _quota_trackers_lock:
+        if path not in _quota_trackers:
+            _quota_trackers[path] = QuotaTracker(state_file, flush_interval=flush_interval)
+        return _quota_trackers[path]
+
+
+class _MemoryGCRAState:
+    """In-process GCRA state: {key: theoretical arrival time}."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tats = {}
+
+    def attempt(self, cells, now):
+        with self.lock:
+            wait, new = _gcra_check(self.tats, cells, now)
+            if wait <= 0:
+                self.tats.update(new)
+            return wait
+
+
+class _SQLiteGCRAState:
+    """
+    GCRA state shared by every process using the same SQLite file (e.g. Indexer and
+    BatchSolver running side by side). Each attempt is one IMMEDIATE transaction.
+    """
+    def __init__(self, path):
+        import sqlite3
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS gcra (key TEXT PRIMARY KEY, tat REAL)")
+
+    def attempt(self, cells, now):
+        keys = [c[0] for c in cells]
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.conn.execute(
+                    f"SELECT key, tat FROM gcra WHERE key IN ({','.join('?' * len(keys))})", keys
+                ).fetchall()
+                wait, new = _gcra_check(dict(rows), cells, now)
+                if wait <= 0:
+                    self.conn.executemany("INSERT OR REPLACE INTO gcra (key, tat) VALUES (?, ?)", list(new.items()))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            return wait
+
+
+def _gcra_check(tats, cells, now):
+    """
+    Generic Cell Rate Algorithm over several dimensions at once (all must conform).
+
+    Args:
+        tats (dict): key -> theoretical arrival time.
+        cells (list): [(key, emission_interval, capacity, cost)]; emission_interval is the
+                      time one cost unit "occupies", capacity the max units per window.
+
+    Returns:
+        tuple: (seconds to wait (<= 0 means accepted), {key: new tat})
+    """
+    wait = 0.0
+    new = {}
+    for key, emission, capacity, cost in cells:
+        cost = min(cost, capacity) # A single oversized request must still be admissible
+        tat = max(tats.get(key, now), now) + cost * emission
+        allow_at = tat - capacity * emission
+        wait = max(wait, allow_at - now)
+        new[key] = tat
+    return wait, new
+
 
 class RateLimiter:
-    def __init__(self, limit, interval=60):
+    """
+    Sliding-window rate limiter (GCRA): at most 'limit' requests (and optionally
+    'token_limit' tokens) in any window of 'interval' seconds, spread smoothly instead
+    of a full refill at each window edge.
+
+    Up to 'burst' requests pass back-to-back; after that one request is admitted every
+    interval / (limit - burst + 1) seconds. Burst plus refill therefore never exceed 'limit'
+    inside a window (a plain bucket of 'limit' refilled at limit/interval admits ~2x at the edge).
+
+    Costs are weighted: acquire(cost, tokens) charges both dimensions atomically.
+    With 'state_path' the state lives in SQLite and is shared across processes
+    under the same 'name' (one quota, however many processes spend it).
+
+    Args:
+        limit (int): Max requests per interval.
+        interval (float): Window length in seconds.
+        token_limit (int, optional): Max tokens per interval (None = not limited).
+        burst (int, optional): Max requests admitted back-to-back (default: limit // 10, at least 1).
+        token_burst (int, optional): Max tokens admitted back-to-back (default: token_limit // 2).
+        name (str): Quota key when shared.
+        state_path (str, optional): SQLite file for cross-process state.
+    """
+    WAIT_BUCKETS = (0.0, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+    def __init__(self, limit, interval=60, token_limit=None, burst=None, name="default", state_path=None, token_burst=None):
         self.limit = limit
         self.interval = interval
-        self.tokens = limit
-        self.last_refill = time.time()
+        self.token_limit = token_limit
+        self.burst = min(burst or max(1, limit // 10), limit)
+        self.token_burst = min(token_burst or max(1, token_limit // 2), token_limit) if token_limit else None
+        self.name = name
+        self.state = _MemoryGCRAState()
+        if state_path:
+            try:
+                self.state = _SQLiteGCRAState(state_path)
+            except Exception as e:
+                print(f"[RateLimiter] Shared state unavailable ({e}). Using in-process state.")
+
         self.lock = threading.Lock()
-        
-    def wait_for_token(self):
+        self.wait_hist = [0] * len(self.WAIT_BUCKETS)
+        self.wait_sum = 0.0
+        self.acquired = 0
+        self.rejected = 0
+
+    def _cells(self, cost, tokens):
+        # Emission interval leaves room for the burst inside every window
+        cells = [(f"{self.name}:req", self.interval / (self.limit - self.burst + 1), self.burst, cost)]
+        if self.token_limit and tokens:
+            cells.append((f"{self.name}:tok", self.interval / (self.token_limit - self.token_burst + 1), self.token_burst, tokens))
+        return cells
+
+    def _record(self, waited):
+        with self.lock:
+            self.acquired += 1
+            self.wait_sum += waited
+            for i, bound in enumerate(self.WAIT_BUCKETS):
+                if waited <= bound:
+                    self.wait_hist[i] += 1
+                    break
+
+    def try_acquire(self, cost=1, tokens=0):
+        """Non-blocking: charges and returns True if admitted now, else False (nothing charged)."""
+        if self.state.attempt(self._cells(cost, tokens), time.time()) <= 0:
+            self._record(0.0)
+            return True
+        with self.lock:
+            self.rejected += 1
+        return False
+
+    def acquire(self, cost=1, tokens=0, timeout=None):
+        """
+        Blocks until admitted. Returns the time waited (seconds).
+        Raises TimeoutError if 'timeout' passes first.
+        """
+        t0 = time.time()
+        cells = self._cells(cost, tokens)
         while True:
-            with self.lock:
-                now = time.time()
-                if now - self.last_refill >= self.interval:
-                    self.tokens = self.limit # Refill
-                    self.last_refill = now
-                
-                if self.tokens > 0:
-                    self.tokens -= 1
-                    return
-                
-                # Compute wait time
-                wait_time = self.interval - (now - self.last_refill)
-            
-            # Wait outside lock
-            if wait_time > 0:
-                time.sleep(wait_time + 0.1)
\ No newline at end of file
+            now = time.time()
+            wait = self.state.attempt(cells, now)
+            if wait <= 0:
+                waited = now - t0
+                self._record(waited)
+                return waited
+            if timeout is not None and now + wait - t0 > timeout:
+                raise TimeoutError(f"Rate limit '{self.name}': no capacity within {timeout}s")
+            time.sleep(min(wait, 1.0)) # Re-check (other processes may have changed the state)
+
+    async def acquire_async(self, cost=1, tokens=0, timeout=None):
+        """asyncio variant of acquire() (sleeps without blocking the event loop)."""
+        import asyncio
+        t0 = time.time()
+        cells = self._cells(cost, tokens)
+        while True:
+            now = time.time()
+            wait = self.state.attempt(cells, now)
+            if wait <= 0:
+                waited = now - t0
+                self._record(waited)
+                return waited
+            if timeout is not None and now + wait - t0 > timeout:
+                raise TimeoutError(f"Rate limit '{self.name}': no capacity within {timeout}s")
+            await asyncio.sleep(min(wait, 1.0))
+
+    def wait_for_token(self, tokens=0):
+        """Blocking acquire of one request (kept for existing callers)."""
+        self.acquire(1, tokens)
+
+    def stats(self):
+        """Acquire count, rejections (try_acquire) and the wait-time histogram."""
+        with self.lock:
+            hist = {}
+            for bound, count in zip(self.WAIT_BUCKETS, self.wait_hist):
+                hist["+Inf" if bound == float('inf') else f"<={bound}s"] = count
+            return {
+                "name": self.name,
+                "acquired": self.acquired,
+                "rejected": self.rejected,
+                "wait_sum_s": round(self.wait_sum, 3),
+                "wait_avg_s": round(self.wait_sum / self.acquired, 4) if self.acquired else 0.0,
+                "wait_histogram": hist
+            }
@@ -8,9 +8,12 @@
 
 import os
 import uuid
+import random
 import hashlib
-import chromadb
+import sqlite3
+import threading
 from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
+from .integrity import IdLedger
 
 class VectorStore:
     def __init__(self, collection_name="vnpt_rag_collection", persist_directory="chroma_db"):
@@ -30,9 +33,6 @@ class VectorStore:
         except Exception:
             pass
 
-        # Lazy import to avoid startup lag if not used
-        import chromadb
-        
         # Ensure directory exists (Chroma handles this, but good practice)
         self.persist_directory = persist_directory
         self.collection_name = collection_name
@@ -40,8 +40,20 @@ class VectorStore:
         # Initialize Client
         self._init_chroma()
 
+        # Sidecar ID ledger (Chroma has no triggers): rolling per-segment digests for fast integrity checks
+        self.ledger = IdLedger("chroma_ids")
+        self._ledger_lock = threading.Lock()
+        self._ledger_conn = sqlite3.connect(os.path.join(self.persist_directory, "id_ledger.db"), check_same_thread=False)
+        self._ledger_conn.execute("PRAGMA journal_mode=WAL")
+        with self._ledger_lock:
+            self.ledger.ensure_schema(self._ledger_conn.cursor())
+            self._ledger_conn.commit()
+
     @retry(stop=stop_after_attempt(5), wait=wait_fixed(5), retry=retry_if_exception_type(Exception))
     def _init_chroma(self):
+        # Lazy import to avoid startup lag if not used
+        import chromadb
+
         print(f"[VectorStore] Connecting to ChromaDB at '{self.persist_directory}' (Attempting)...")
         self.client = chromadb.PersistentClient(path=self.persist_directory)
         
@@ -67,9 +79,10 @@ class VectorStore:
     def add_batch(self, texts, embeddings, metadatas=None):
         """
         Add a batch of documents + embeddings to the collection.
+        Returns the number of upserted documents. Raises on DB errors.
         """
         if not texts or not embeddings:
-            return
+            return 0
 
         batch_size = len(texts)
         # Generate stable IDs based on content hash
@@ -104,16 +117,62 @@ class VectorStore:
                 batch_embs = final_embeddings[i:upto]
                 batch_metas = final_metadatas[i:upto]
                 
-                self.collection.upsert(
-                    embeddings=batch_embs,
-                    documents=batch_texts,
-                    metadatas=batch_metas,
-                    ids=batch_ids
-                )
+                self._ledger_begin()
+                try:
+                    self.collection.upsert(
+                        embeddings=batch_embs,
+                        documents=batch_texts,
+                        metadatas=batch_metas,
+                        ids=batch_ids
+                    )
+                except Exception:
+                    self._ledger_abort()
+                    raise
                 total_upserted += len(batch_ids)
+                self._ledger_update(added=batch_ids)
                 
         except Exception as e:
+            # Re-raise so the caller can retry with the batch still in hand (upsert is idempotent)
             print(f"[VectorStore] Error adding batch: {e}")
+            raise
+
+        return total_upserted
+
+    def add_aliases(self, alias_map):
+        """
+        Records near-duplicate aliases on canonical documents that are already stored.
+        alias_map: {canonical_id: [{"source": ..., "source_file": ..., "title": ...}, ...]}
+        """
+        from .dedup import merge_alias_metadata
+
+        if not alias_map:
+            return 0
+
+        canonical_ids = list(alias_map.keys())
+        updated = 0
+        BATCH = 2000 # Stay below SQL variable limit
+        try:
+            for i in range(0, len(canonical_ids), BATCH):
+                batch_ids = canonical_ids[i:i + BATCH]
+                existing = self.collection.get(ids=batch_ids, include=['metadatas'])
+
+                upd_ids, upd_metas = [], []
+                for doc_id, meta in zip(existing['ids'], existing['metadatas']):
+                    meta = dict(meta or {})
+                    aliases = [a for a in alias_map[doc_id]
+                               if (a.get("source"), a.get("source_file")) != (meta.get("source"), meta.get("source_file"))]
+                    if not aliases:
+                        continue
+                    merge_alias_metadata(meta, aliases)
+                    upd_ids.append(doc_id)
+                    upd_metas.append(meta)
+
+                if upd_ids:
+                    self.collection.update(ids=upd_ids, metadatas=upd_metas)
+                    updated += len(upd_ids)
+        except Exception as e:
+            print(f"[VectorStore] Error updating aliases: {e}")
+        return updated
 
     def search(self, query_embedding, k=5, filter_dict=None):
         """
@@ -172,7 +231,13 @@ class VectorStore:
                 return False
 
             print(f"[VectorStore] Found {count} documents matching {filter_dict}. Deleting...")
-            self.collection.delete(where=filter_dict)
+            self._ledger_begin()
+            try:
+                self.collection.delete(where=filter_dict)
+            except Exception:
+                self._ledger_abort()
+                raise
+            self._ledger_update(removed=existing['ids'])
             print("[VectorStore] Deletion complete.")
             return True
         except Exception as e:
@@ -187,19 +252,132 @@ class VectorStore:
                 name=self.collection_name, 
                 metadata={"hnsw:space": "cosine"}
             )
+            with self._ledger_lock:
+                self.ledger.clear(self._ledger_conn.cursor())
+                self._ledger_conn.commit()
         except Exception as e:
             print(f"Error resetting collection: {e}")
+
+    # --- ID Ledger (Integrity) ---
+
+    def _ledger_begin(self):
+        # Left pending if the process dies (or the write fails) before _ledger_update
+        with self._ledger_lock:
+            self.ledger.begin_write(self._ledger_conn.cursor())
+            self._ledger_conn.commit()
+
+    def _ledger_update(self, added=(), removed=()):
+        with self._ledger_lock:
+            cursor = self._ledger_conn.cursor()
+            if added:
+                self.ledger.add(cursor, added)
+            if removed:
+                self.ledger.remove(cursor, removed)
+            self.ledger.end_write(cursor)
+            self._ledger_conn.commit()
+
+    def _ledger_abort(self):
+        # The store write raised: clear its mark. A partially applied write still shows up
+        # in id_digests() through the count / sample checks.
+        with self._ledger_lock:
+            self.ledger.end_write(self._ledger_conn.cursor())
+            self._ledger_conn.commit()
+
+    def rebuild_id_ledger(self):
+        """Rebuilds the sidecar ledger from the collection (streamed, one-time cost)."""
+        print("[VectorStore] Rebuilding ID ledger from collection...")
+        with self._ledger_lock:
+            cursor = self._ledger_conn.cursor()
+            self.ledger.clear(cursor)
+            for ids in self.iter_ids():
+                self.ledger.add(cursor, ids)
+            self._ledger_conn.commit()
+
+    def _ledger_sample_ok(self, sample_size=64):
+        """Spot check in both directions: a random page of collection IDs and a random ledger segment."""
+        count = self.count()
+        if not count:
+            return True
+        page = self.collection.get(limit=sample_size, offset=random.randrange(max(count - sample_size, 0) + 1), include=[])['ids']
+        with self._ledger_lock:
+            cursor = self._ledger_conn.cursor()
+            if len(self.ledger.existing(cursor, page)) != len(set(page)):
+                return False
+            segments = list(self.ledger.digests(cursor))
+            segment_ids = self.ledger.ids_in_segment(cursor, random.choice(segments)) if segments else []
+        sample = random.sample(segment_ids, min(sample_size, len(segment_ids)))
+        return len(self.filter_existing(sample)) == len(sample)
+
+    def id_digests(self):
+        """
+        Per-segment (count, xor) digests of stored IDs.
+        The ledger is trusted only if no write is pending (crash between a Chroma write and its
+        ledger update), its total matches collection.count() and a sampled spot check agrees;
+        otherwise (e.g. deletes made outside delete_by_metadata) it is rebuilt first.
+        """
+        with self._ledger_lock:
+            cursor = self._ledger_conn.cursor()
+            pending = self.ledger.pending_writes(cursor)
+            ledger_total = self.ledger.total(cursor)
+        if pending or ledger_total != self.count() or not self._ledger_sample_ok():
+            self.rebuild_id_ledger()
+        with self._ledger_lock:
+            return self.ledger.digests(self._ledger_conn.cursor())
+
+    def ids_in_segment(self, segment):
+        with self._ledger_lock:
+            return self.ledger.ids_in_segment(self._ledger_conn.cursor(), segment)
+
+    def iter_documents(self, batch_size=2000, include=('documents', 'metadatas'), where=None):
+        """
+        Paginated export of the collection (limit/offset).
+        Yields (documents, metadatas, ids) per page, so full-corpus consumers run in constant memory.
+        Fields not requested in 'include' are yielded as None.
+        Note: pages may shift if the collection is modified during iteration.
+        """
+        include = list(include)
+        offset = 0
+        while True:
+            results = self.collection.get(limit=batch_size, offset=offset, include=include, where=where)
+            ids = results['ids']
+            if not ids:
+                break
+
+            documents = results.get('documents') if 'documents' in include else None
+            metadatas = results.get('metadatas') if 'metadatas' in include else None
+            yield documents, metadatas, ids
+
+            offset += len(ids)
+            if len(ids) < batch_size:
+                break
+
+    def iter_ids(self, batch_size=10000):
+        """Paginated export of document IDs only. Yields lists of IDs."""
+        for _, _, ids in self.iter_documents(batch_size=batch_size, include=()):
+            yield ids
+
+    def filter_existing(self, ids):
+        """Return the subset of 'ids' present in the collection."""
+        existing = set()
+        BATCH = 2000 # Stay below SQL variable limit
+        ids = list(ids)
+        for i in range(0, len(ids), BATCH):
+            results = self.collection.get(ids=ids[i:i + BATCH], include=[])
+            existing.update(results['ids'])
+        return existing
+
     def get_all_documents(self):
         """
         Retrieve all documents from the collection.
-        Useful for building in-memory indices (e.g., BM25).
+        Materializes the whole corpus in RAM; prefer iter_documents() for large collections.
         """
         try:
-            # ChromaDB get() without arguments returns all
-            # But for large collections, we might need pagination if it hits limits.
-            # However, simpler to just get all for now for < 1M docs.
-            results = self.collection.get()
-            return results['documents'], results['metadatas'], results['ids']
+            all_docs, all_metas, all_ids = [], [], []
+            for docs, metas, ids in self.iter_documents():
+                all_docs.extend(docs)
+                all_metas.extend(metas)
+                all_ids.extend(ids)
+            return all_docs, all_metas, all_ids
         except Exception as e:
             print(f"[VectorStore] Error fetching all docs: {e}")
             return [], [], []
@@ -207,11 +385,13 @@ class VectorStore:
     def get_all_ids(self):
         """
         Retrieve only IDs of all documents.
-        Optimized for incremental updates.
+        Materializes every ID in RAM; prefer iter_ids() for large collections.
         """
         try:
-            results = self.collection.get(include=[]) # No docs/metadatas
-            return set(results['ids'])
+            all_ids = set()
+            for ids in self.iter_ids():
+                all_ids.update(ids)
+            return all_ids
         except Exception as e:
             print(f"[VectorStore] Error fetching IDs: {e}")
             return set()